@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'base'
+
+    def ready(self):
+        from base import checks  # noqa: F401 registers the system checks
+        from base.metrics import install_query_wrapper
+        connection_created.connect(install_query_wrapper, dispatch_uid='base.metrics.install_query_wrapper')
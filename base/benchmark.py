@@ -0,0 +1,47 @@
+import math
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back(using=None):
+    """Run a benchmark inside a transaction that is always rolled back."""
+    try:
+        with transaction.atomic(using=using):
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': round(total / len(samples) * 1000, 3) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
@@ -0,0 +1,42 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    Set of strings with no false negatives and about `error_rate` false
+    positives while it holds at most `capacity` items. Uses double hashing
+    over one blake2b digest. Adds must be serialized by the caller, lookups
+    are safe from any thread.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, item):
+        """Add `item`, counted only if it wasn't (apparently) in the filter yet."""
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        self.count += added
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,39 @@
+"""
+System checks. State every worker must see is kept in Django's cache;
+outside ENVIRONMENT=LOCAL a process-local backend for it is an error, as
+each worker would keep its own copy and miss the others' invalidations.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+
+
+def shared_cache_aliases():
+    """Cache alias -> settings that need it shared by all workers."""
+    aliases = {}
+    aliases.setdefault(settings.AUTH_USER_CACHE['CACHE'], []).append('AUTH_USER_CACHE')
+    aliases.setdefault(settings.RATE_LIMIT_CACHE, []).append('RATE_LIMIT_CACHE')
+    aliases.setdefault(settings.RESPONSE_CACHE['CACHE'], []).append('RESPONSE_CACHE')
+    if settings.DATABASE_ROUTING['REPLICAS']:
+        aliases.setdefault(settings.DATABASE_ROUTING['CACHE'], []).append('DATABASE_ROUTING')
+    return aliases
+
+
+def is_process_local(alias):
+    return isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+@register()
+def check_shared_caches(app_configs, **kwargs):
+    if settings.ENVIRONMENT in (None, 'LOCAL'):
+        return []
+    return [
+        Error(
+            f'The {alias!r} cache is process-local, but holds state all workers must share: {", ".join(names)}.',
+            hint=f'Set REDIS_URL, or point CACHES[{alias!r}] at another shared backend.',
+            id='base.E001',
+        )
+        for alias, names in shared_cache_aliases().items() if is_process_local(alias)
+    ]
@@ -0,0 +1,87 @@
+"""
+PostgreSQL backend that borrows connections from a process-wide
+base.pool.ConnectionPool instead of opening one per request. Pool options
+go in OPTIONS['pool'] (min_size, max_size, timeout, max_idle, max_lifetime,
+check_after); use it with CONN_MAX_AGE = 0 so Django hands the connection
+back at the end of every request, from WSGI workers and ASGI threads alike.
+"""
+from functools import partial
+
+from django.db.backends.postgresql import base as postgresql
+from django.db.backends.postgresql.creation import DatabaseCreation as PostgresDatabaseCreation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from base.pool import ConnectionPool, PoolTimeout, close_pools, get_pool
+
+Database = postgresql.Database
+
+# Same values in psycopg2 and psycopg
+TRANSACTION_STATUS_IDLE = 0
+TRANSACTION_STATUS_UNKNOWN = 4
+
+
+def check_connection(connection):
+    if connection.closed:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    if not connection.autocommit:
+        connection.rollback()
+    return True
+
+
+def reset_connection(connection):
+    """Roll back whatever the last borrower left open, drop broken connections."""
+    if connection.closed:
+        return False
+    transaction_status = connection.info.transaction_status
+    if transaction_status == TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if transaction_status != TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    return True
+
+
+class DatabaseCreation(PostgresDatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # idle pooled connections would keep DROP DATABASE from running
+        close_pools(lambda key: key[1] == test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(postgresql.DatabaseWrapper):
+    creation_class = DatabaseCreation
+    pool = None
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        key = (self.alias, conn_params.get('dbname'), conn_params.get('host'),
+               conn_params.get('port'), conn_params.get('user'))
+        self.pool = get_pool(key, partial(self.create_pool, conn_params))
+        try:
+            connection = self.pool.acquire()
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e)) from e
+        # set by the parent's get_new_connection, which only runs for new connections
+        self.isolation_level = IsolationLevel(
+            self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED)
+        )
+        return connection
+
+    def create_pool(self, conn_params):
+        return ConnectionPool(
+            partial(super().get_new_connection, conn_params),
+            check=check_connection,
+            reset=reset_connection,
+            **self.settings_dict['OPTIONS'].get('pool', {}),
+        )
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
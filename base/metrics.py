@@ -0,0 +1,200 @@
+"""
+Per-request instrumentation. RequestMetricsMiddleware samples requests
+(REQUEST_METRICS['SAMPLE_RATE']) and, for sampled ones, counts queries and
+SQL time through a connection execute wrapper, collects the named timers
+below, and folds everything into per-endpoint histograms. The slow query
+log (SLOW_QUERY_MS) times every query of every request, sampled or not:
+two perf_counter() calls per query. With SLOW_QUERY_MS = None unsampled
+requests only pay for one random() call and a context variable lookup per
+query. The histograms live in process memory, so every worker reports its
+own share of the traffic.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger('base.metrics')
+slow_query_logger = logging.getLogger('base.metrics.slow_query')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.queries = 0
+        self.timings = {'db': 0.0}
+        self.counters = {}
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def count(self, name):
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+    def server_timing(self, total):
+        parts = [f'db;dur={self.timings["db"] * 1000:.1f};desc="{self.queries} queries"']
+        parts += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.timings.items() if name != 'db']
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def current_metrics():
+    return _current.get()
+
+
+def count(name):
+    """Count `name` (e.g. a cache hit) on the current request's endpoint."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.count(name)
+
+
+@contextmanager
+def timer(name):
+    """Add the time spent in the block to the current request's `name` timing."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - start)
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """Connection execute wrapper, installed on every connection by BaseConfig.ready()."""
+    metrics = _current.get()
+    slow_ms = settings.REQUEST_METRICS['SLOW_QUERY_MS']
+    if metrics is None and slow_ms is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        if metrics is not None:
+            metrics.queries += 1
+            metrics.timings['db'] += duration
+        if slow_ms is not None and duration * 1000 >= slow_ms:
+            slow_query_logger.warning(json.dumps({
+                'event': 'slow_query',
+                'duration_ms': round(duration * 1000, 3),
+                'sql': sql,
+                'params': repr(params)[:500],
+                'many': many,
+            }))
+
+
+def install_query_wrapper(sender=None, connection=None, **kwargs):
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+class Histogram:
+    """Fixed-bucket histogram, quantiles are estimated as the bucket's upper bound."""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def as_dict(self):
+        buckets = {str(bound): count for bound, count in zip(self.bounds, self.counts)}
+        buckets['+Inf'] = self.counts[-1]
+        return {
+            'count': self.count,
+            'mean': round(self.sum / self.count, 3) if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 3),
+            'buckets': buckets,
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe per-endpoint aggregation of sampled requests."""
+
+    timings = ('total', 'view', 'db', 'serializer')
+    query_bounds = (1, 2, 5, 10, 25, 50, 100)
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def _new_endpoint(self):
+        endpoint = {name: Histogram(self.bounds) for name in self.timings}
+        endpoint['queries'] = Histogram(self.query_bounds)
+        endpoint['status'] = {}
+        endpoint['counters'] = {}
+        return endpoint
+
+    def record(self, endpoint, status_code, timings_ms, queries, counters=None):
+        with self._lock:
+            histograms = self._endpoints.get(endpoint)
+            if histograms is None:
+                histograms = self._endpoints[endpoint] = self._new_endpoint()
+            for name in self.timings:
+                histograms[name].observe(timings_ms.get(name, 0.0))
+            histograms['queries'].observe(queries)
+            status = str(status_code)
+            histograms['status'][status] = histograms['status'].get(status, 0) + 1
+            for name, value in (counters or {}).items():
+                histograms['counters'][name] = histograms['counters'].get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    name: value if isinstance(value, dict) else value.as_dict()
+                    for name, value in histograms.items()
+                }
+                for endpoint, histograms in sorted(self._endpoints.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry(settings.REQUEST_METRICS['BUCKETS_MS'])
+    return _registry
@@ -0,0 +1,151 @@
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.functional import LazyObject, empty
+
+from base.metrics import RequestMetrics, _current, current_metrics, get_registry, logger
+from base.routers import RoutingState, _state, stick_to_primary
+
+
+class RequestMetricsMiddleware:
+    """
+    Instruments a sample of requests: query count, SQL time, serializer and
+    view time end up in a Server-Timing header (staff users only), one JSON
+    log line on the base.metrics logger and the per-endpoint histograms
+    served by base.views.RequestMetricsView. Should be the first middleware so that
+    `total` covers the whole stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.view_started = time.perf_counter()
+
+    def sampled(self):
+        rate = settings.REQUEST_METRICS['SAMPLE_RATE']
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def endpoint(self, request):
+        match = request.resolver_match
+        route = f'/{match.route}' if match is not None else 'unresolved'
+        return f'{request.method} {route}'
+
+    def is_staff(self, request):
+        # the user a view authenticated; AuthenticationMiddleware's lazy
+        # session user is left unevaluated
+        user = request.__dict__.get('user')
+        if isinstance(user, LazyObject) and user._wrapped is empty:
+            return False
+        return user is not None and user.is_staff
+
+    def finish(self, request, response, metrics):
+        config = settings.REQUEST_METRICS
+        now = time.perf_counter()
+        if metrics.view_started is not None:
+            metrics.add('view', now - metrics.view_started)
+        total = now - metrics.started
+        endpoint = self.endpoint(request)
+
+        timings_ms = {name: seconds * 1000 for name, seconds in metrics.timings.items()}
+        timings_ms['total'] = total * 1000
+        get_registry().record(endpoint, response.status_code, timings_ms, metrics.queries, metrics.counters)
+
+        if config['SERVER_TIMING'] and self.is_staff(request):
+            response['Server-Timing'] = metrics.server_timing(total)
+        slow = config['SLOW_REQUEST_MS'] is not None and timings_ms['total'] >= config['SLOW_REQUEST_MS']
+        level = logging.WARNING if slow else logging.INFO
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps({
+                'event': 'slow_request' if slow else 'request',
+                'endpoint': endpoint,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': metrics.queries,
+                **{f'{name}_ms': round(value, 3) for name, value in sorted(timings_ms.items())},
+            }))
+        return response
+
+
+class DatabaseRoutingMiddleware:
+    """
+    Scopes base.routers state to a request and, when the request wrote to
+    the database, keeps the user's reads on the primary for
+    DATABASE_ROUTING['STICKY_SECONDS'].
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.finish(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.finish(request, state)
+        return response
+
+    def finish(self, request, state):
+        if not state.wrote or not settings.DATABASE_ROUTING['REPLICAS']:
+            return
+        # the user a view authenticated; AuthenticationMiddleware's lazy
+        # session user is left unevaluated
+        user = request.__dict__.get('user')
+        if isinstance(user, LazyObject) and user._wrapped is empty:
+            return
+        if user is not None and user.is_authenticated:
+            stick_to_primary(user.pk)
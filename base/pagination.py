@@ -0,0 +1,135 @@
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over the view's `keyset_ordering` (by default
+    `-created_at, -pk`). Pages are fetched with a WHERE on the last seen key
+    instead of an OFFSET, and the total COUNT(*) can be turned off per view
+    with `include_count = False`. Cursors are signed, so a client can't
+    forge a position.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    salt = 'base.pagination.KeysetPagination'
+    default_ordering = ('-created_at', '-pk')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        include_count = self.prepare(request, view)
+        self.count = queryset.count() if include_count else None
+        return self.finish(list(self.page_queryset(queryset)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views, runs on the async ORM."""
+        include_count = self.prepare(request, view)
+        self.count = await queryset.acount() if include_count else None
+        return self.finish([row async for row in self.page_queryset(queryset)])
+
+    def prepare(self, request, view):
+        self.request = request
+        self.ordering = tuple(getattr(view, 'keyset_ordering', self.default_ordering))
+        self.position, self.backwards = self.decode_cursor(request)
+        return getattr(view, 'include_count', True)
+
+    def page_queryset(self, queryset):
+        if self.position is not None:
+            queryset = queryset.filter(self.keyset_filter(self.position, self.backwards))
+        ordering = self.reversed_ordering() if self.backwards else self.ordering
+        return queryset.order_by(*ordering)[:self.page_size + 1]
+
+    def finish(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.backwards:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.build_link(self.page[-1], backwards=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.build_link(self.page[0], backwards=True)
+
+    def build_link(self, row, backwards):
+        position = [self.encode_value(getattr(row, field.lstrip('-'))) for field in self.ordering]
+        cursor = signing.dumps({'p': position, 'b': backwards}, salt=self.salt, compress=True)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = getattr(request, 'query_params', request.GET).get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = signing.loads(cursor, salt=self.salt)
+            position = [self.decode_value(value) for value in payload['p']]
+            backwards = bool(payload['b'])
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, backwards
+
+    def keyset_filter(self, position, backwards):
+        """
+        Rows strictly after `position` in ordering:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != backwards
+            lookup = f'{name}__lt' if descending else f'{name}__gt'
+            condition |= Q(**equal, **{lookup: value})
+            equal[name] = value
+        return condition
+
+    def reversed_ordering(self):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+
+    @staticmethod
+    def encode_value(value):
+        if isinstance(value, datetime):
+            return {'dt': value.isoformat()}
+        return value
+
+    @staticmethod
+    def decode_value(value):
+        if isinstance(value, dict):
+            parsed = parse_datetime(value['dt'])
+            if parsed is None:
+                raise ValueError(value)
+            return parsed
+        return value
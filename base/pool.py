@@ -0,0 +1,233 @@
+"""
+A process-wide, thread-safe pool of DB-API connections, used by the
+base.db.postgresql_pool backend. Django threads (WSGI workers, ASGI's
+sync_to_async threads) borrow a connection when Django connects and hand
+it back when Django closes it at the end of the request, so the TCP and
+auth handshake is paid once per pooled connection instead of per request.
+"""
+import threading
+import time
+from collections import deque
+
+from base.metrics import Histogram, current_metrics
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _Entry:
+    __slots__ = ('connection', 'created', 'last_used')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created = self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    `connect()` opens a connection, `check(connection)` is a health check run
+    on connections idle for more than `check_after` seconds, `reset(connection)`
+    runs when one is returned and `close(connection)` closes it; `check` and
+    `reset` return False for a connection that must be thrown away.
+
+    Idle connections are handed out most recently used first, so under
+    light traffic the surplus above `min_size` idles out after `max_idle`.
+    """
+    wait_bounds_ms = (0.1, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+    def __init__(self, connect, min_size=0, max_size=10, timeout=5.0, max_idle=300.0,
+                 max_lifetime=3600.0, check_after=30.0, check=None, reset=None, close=None):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.check = check or (lambda connection: True)
+        self.reset = reset or (lambda connection: True)
+        self.close = close or (lambda connection: connection.close())
+
+        self._closed = False
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._wait_ms = Histogram(self.wait_bounds_ms)
+        self._counters = dict.fromkeys(
+            ('acquired', 'created', 'closed', 'health_check_failures', 'reset_failures', 'timeouts'), 0
+        )
+
+    def fill(self):
+        """Open connections until min_size are open."""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            entry = self._open()
+            with self._cond:
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            entry, create = None, False
+            with self._cond:
+                while entry is None and not create:
+                    if self._idle:
+                        entry = self._idle.pop()
+                    elif self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._counters['timeouts'] += 1
+                            self._record_wait(start)
+                            raise PoolTimeout(f'No connection available within {self.timeout}s '
+                                              f'({self.max_size} in use)')
+                        self._waiting += 1
+                        try:
+                            self._cond.wait(remaining)
+                        finally:
+                            self._waiting -= 1
+
+            if create:
+                entry = self._open()
+            elif not self._usable(entry):
+                continue
+
+            with self._cond:
+                self._in_use[id(entry.connection)] = entry
+                self._counters['acquired'] += 1
+                self._record_wait(start)
+            return entry.connection
+
+    def release(self, connection, discard=False):
+        with self._cond:
+            entry = self._in_use.pop(id(connection), None)
+        if entry is None:
+            self.close(connection)
+            return
+        now = time.monotonic()
+        if discard or self._closed or now - entry.created > self.max_lifetime:
+            self._discard(entry)
+            return
+        if not self._safe(self.reset, entry):
+            with self._cond:
+                self._counters['reset_failures'] += 1
+            self._discard(entry)
+            return
+        entry.last_used = now
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    def close_all(self):
+        """Close idle connections, connections in use are closed when released."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        for entry in idle:
+            self._discard(entry)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'waiting': self._waiting,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                **self._counters,
+                'wait_ms': self._wait_ms.as_dict(),
+            }
+
+    def _open(self):
+        try:
+            entry = _Entry(self.connect())
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters['created'] += 1
+        return entry
+
+    def _usable(self, entry):
+        now = time.monotonic()
+        idle = now - entry.last_used
+        surplus = self._size > self.min_size
+        if now - entry.created > self.max_lifetime or (surplus and idle > self.max_idle):
+            self._discard(entry)
+            return False
+        if idle > self.check_after and not self._safe(self.check, entry):
+            with self._cond:
+                self._counters['health_check_failures'] += 1
+            self._discard(entry)
+            return False
+        return True
+
+    def _safe(self, func, entry):
+        try:
+            return func(entry.connection)
+        except Exception:
+            return False
+
+    def _discard(self, entry):
+        try:
+            self.close(entry.connection)
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._counters['closed'] += 1
+            self._cond.notify()
+
+    def _record_wait(self, start):
+        # called with the lock held
+        waited = time.monotonic() - start
+        self._wait_ms.observe(waited * 1000)
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.add('pool', waited)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, factory):
+    """The pool registered under `key`, created (and filled) by `factory()` on first use."""
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = factory()
+                try:
+                    pool.fill()
+                except BaseException:
+                    pool.close_all()
+                    raise
+                _pools[key] = pool
+    return pool
+
+
+def all_pools():
+    return dict(_pools)
+
+
+def close_pools(match=lambda key: True):
+    with _pools_lock:
+        keys = [key for key in _pools if match(key)]
+        closing = [_pools.pop(key) for key in keys]
+    for pool in closing:
+        pool.close_all()
@@ -0,0 +1,82 @@
+import math
+import time
+
+from django.core.cache import caches
+
+PERIODS = {'s': ('second', 1), 'm': ('minute', 60), 'h': ('hour', 3600), 'd': ('day', 86400)}
+
+
+def parse_rate(rate):
+    """'3/minute' -> (3, 60, 'minute'), same format as DRF throttle rates."""
+    num, period = rate.split('/')
+    name, seconds = PERIODS[period[0]]
+    return int(num), seconds, name
+
+
+class SlidingWindowRateLimiter:
+    """
+    Sliding-window counter on Django's cache. Each window has a counter
+    that is incremented before the check, so concurrent hits each see a
+    distinct count and can't both slip under the limit. The previous
+    window's counter is weighted by how much of it still overlaps.
+
+    Atomicity comes from the backend's incr(): memcached, Redis and
+    LocMemCache are atomic, FileBasedCache is only atomic per process.
+    The limit is per cache, so the cache must be shared by all workers or
+    each of them allows the full rate.
+    """
+
+    def __init__(self, rate, prefix, cache_alias='default'):
+        self.limit, self.window, self.period = parse_rate(rate)
+        self.prefix = prefix
+        self.cache = caches[cache_alias]
+
+    def _key(self, key, window):
+        return f'ratelimit:{self.prefix}:{key}:{window}'
+
+    def hit(self, key, now=None):
+        """
+        Count one hit for `key`. Returns the counter it went to, for
+        release(), or None (and undoes it) when over the limit.
+        """
+        counter, granted = self.take(key, 1, now)
+        return counter if granted else None
+
+    def take(self, key, count, now=None):
+        """
+        Count up to `count` hits for `key` at once, as many as fit under the
+        limit. Returns the counter they went to, for release(), and how many
+        were granted; the rest are undone.
+        """
+        now = time.time() if now is None else now
+        window = int(now // self.window)
+        current_key = self._key(key, window)
+        if count <= 0:
+            return current_key, 0
+        self.cache.add(current_key, 0, self.window * 2)
+        try:
+            current = self.cache.incr(current_key, count)
+        except ValueError:
+            # expired between add() and incr()
+            self.cache.add(current_key, 0, self.window * 2)
+            current = self.cache.incr(current_key, count)
+
+        previous = self.cache.get(self._key(key, window - 1), 0)
+        overlap = 1 - (now % self.window) / self.window
+        # the hits were counted as current - count + 1 .. current, each is
+        # granted if it would have been on its own
+        granted = max(0, min(count, math.floor(self.limit - previous * overlap) - (current - count)))
+        if granted < count:
+            self.cache.decr(current_key, count - granted)
+        return current_key, granted
+
+    def release(self, counter, count=1):
+        """
+        Give back `count` hits that did not result in an action, `counter`
+        as returned by hit() or take(): the window may have rolled over
+        since.
+        """
+        try:
+            self.cache.decr(counter, count)
+        except ValueError:
+            pass
@@ -0,0 +1,68 @@
+import math
+import re
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DIGITS = frozenset(b'0123456789')
+EXPONENT = re.compile(rb'e[-0-9]')
+
+
+def repr_mismatch(output):
+    """
+    True when orjson `output` may hold a float written differently from
+    repr(): 1e16 for 1e+16, 0.00001 for 1e-05. Such output is rendered by
+    the stdlib encoder; a match inside a string only costs the fast path.
+    Two literal scans, a character class regex is slower than orjson itself.
+    """
+    if b'0.0000' in output:
+        return True
+    return any(output[match.start() - 1] in DIGITS for match in EXPONENT.finditer(output))
+
+
+def has_non_finite(data):
+    """True when `data` holds a NaN or infinite float, which orjson writes as null."""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it's installed, with the same
+    bytes as JSONRenderer: compact, unescaped unicode with U+2028/U+2029
+    escaped, and every type orjson doesn't encode identically (datetimes,
+    dataclasses) goes through the DRF encoder. Indented output, non-default
+    UNICODE_JSON/COMPACT_JSON and anything orjson refuses (non-str keys,
+    ints over 64 bits) fall back to JSONRenderer, as does output with a
+    null that came from NaN or infinity, so STRICT_JSON raises the same way.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not (self.compact and self.ensure_ascii is False):
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            output = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if repr_mismatch(output) or (b'null' in output and has_non_finite(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+        return output.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,115 @@
+"""
+Per-user response cache of BaseListView subclasses with
+`response_cache = True`. A response is keyed by the user, the full path,
+the negotiated media type and the current version of GLOBAL_SCOPE and of
+every scope the view depends on (BaseListView.get_cache_scopes). Writers
+call bump() with the scopes they changed; it deletes their versions right
+away and again once the transaction commits, as a request reading the
+rows before the commit may have recreated them. Responses cached under
+the old versions are never hit again and age out of the LRU.
+
+Versions live in Django's cache (RESPONSE_CACHE['CACHE']), all of a
+request's in one get_many, so a bump is seen by every process sharing
+that cache; a process-local one fails the base.E001 check outside
+ENVIRONMENT=LOCAL. A version restarts from the clock, never from a number
+already handed out, so its value is also its age: requests read from a
+replica skip the cache until their versions are older than the replica
+lag, or they could cache rows from before the bump under the new
+version. The key's digest doubles as the ETag: a request whose
+If-None-Match matches gets a 304 after the version check alone, in any
+process. Bodies are kept per process in an LRU of MAXSIZE entries and
+bodies over MAX_BODY_BYTES are not kept, which bounds the memory.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from base.cache import LRUCache
+
+# Part of every key, bumped by writes that bypass the other scopes (bulk loads)
+GLOBAL_SCOPE = 'global'
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def version_key(scope):
+    return f'base.response_cache.version:{scope}'
+
+
+def versions(scopes):
+    cache = caches[settings.RESPONSE_CACHE['CACHE']]
+    keys = [version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # another process may add it first, read back the one that won
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(*scopes):
+    """Invalidate the responses cached under `scopes`, now and when the current transaction commits."""
+    keys = [version_key(scope) for scope in scopes]
+    if keys:
+        cache = caches[settings.RESPONSE_CACHE['CACHE']]
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def parse_etags(header):
+    return {tag.strip().removeprefix('W/') for tag in header.split(',')}
+
+
+class ResponseCache:
+    """Rendered bodies by ETag, see the module docstring."""
+
+    def __init__(self, maxsize, max_body_bytes):
+        self.max_body_bytes = max_body_bytes
+        self._bodies = LRUCache(maxsize)
+
+    def __len__(self):
+        return len(self._bodies)
+
+    def etag(self, request, scopes, settle=0):
+        """
+        ETag of `request` under the current versions of `scopes`, None when
+        one of them was created less than `settle` seconds ago.
+        """
+        current = versions(scopes)
+        if settle and time.time_ns() - max(current) < settle * 1e9:
+            return None
+        parts = [str(request.user.id), request.accepted_media_type, request.get_full_path()]
+        parts += [f'{scope}={version}' for scope, version in zip(scopes, current)]
+        return '"' + hashlib.sha1('\0'.join(parts).encode()).hexdigest() + '"'
+
+    def get(self, etag):
+        """(content, content type) cached under `etag`, or None."""
+        return self._bodies.get(etag)
+
+    def set(self, etag, response):
+        if len(response.content) <= self.max_body_bytes:
+            self._bodies.set(etag, (response.content, response['Content-Type']))
+
+    def clear(self):
+        self._bodies.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = settings.RESPONSE_CACHE
+                _cache = ResponseCache(config['MAXSIZE'], config['MAX_BODY_BYTES'])
+    return _cache
@@ -0,0 +1,85 @@
+"""
+Read replica routing. Reads go to the primary unless a view opted the
+request in with route_reads_to_replica(), which base.views.BaseListView
+does for views with `read_replica = True` on safe methods. A request is
+pinned to one replica, so its COUNT and page queries see the same
+snapshot.
+
+Every ORM write marks the request; DatabaseRoutingMiddleware then keeps
+the writer's reads on the primary for DATABASE_ROUTING['STICKY_SECONDS'],
+longer than the replicas lag, so a user always reads their own writes.
+The marker lives in the DATABASE_ROUTING['CACHE'] alias, which must be
+shared by all processes: a read served by another worker than the write
+would otherwise go to a lagging replica.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+_state = ContextVar('base.routers.state', default=None)
+
+
+class RoutingState:
+    """Routing of the current request."""
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+def current_state():
+    return _state.get()
+
+
+def sticky_key(user_id):
+    return f'base.routers.primary:{user_id}'
+
+
+def route_reads_to_replica(user_id):
+    """
+    Send the rest of the current request's reads to a replica unless
+    `user_id` wrote within STICKY_SECONDS. Returns the replica alias or None.
+    """
+    state = _state.get()
+    replicas = settings.DATABASE_ROUTING['REPLICAS']
+    if state is None or state.wrote or not replicas:
+        return None
+    if user_id is not None and caches[settings.DATABASE_ROUTING['CACHE']].get(sticky_key(user_id)):
+        return None
+    state.replica = random.choice(replicas)
+    return state.replica
+
+
+def stick_to_primary(user_id):
+    config = settings.DATABASE_ROUTING
+    caches[config['CACHE']].set(sticky_key(user_id), True, config['STICKY_SECONDS'])
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.replica is not None and not state.wrote:
+            return state.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # an instance read from a replica is saved to the primary
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in settings.DATABASE_ROUTING['REPLICAS']:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the primary's rows
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_ROUTING['REPLICAS']}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
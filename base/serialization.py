@@ -0,0 +1,151 @@
+"""
+Read-only fast path for list endpoints. A ValuesPlan is compiled once from
+a ModelSerializer: every readable field becomes a values_list() column and
+the whole row, nested serializers included, becomes one generated dict
+expression. Rows are never turned into model instances and no field
+machinery runs per row, only the conversions that change a value (an int
+id rendered through a CharField, a datetime). The output is the same as
+the serializer's `.data`, key order included; serializers the plan can't
+reproduce exactly are refused with ImproperlyConfigured.
+"""
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db import models
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+STRING_FIELDS = (models.CharField, models.TextField)
+
+
+def resolve(model, source):
+    """
+    (model field, nullable) at the end of the dotted `source`, following
+    forward relations. Nullable when any field on the way is.
+    """
+    parts = source.split('.')
+    nullable = False
+    for part in parts[:-1]:
+        field = model._meta.get_field(part)
+        if not (field.many_to_one or field.one_to_one) or not field.concrete:
+            raise FieldDoesNotExist(source)
+        nullable = nullable or field.null
+        model = field.related_model
+    field = model._meta.get_field(parts[-1])
+    return field, nullable or field.null
+
+
+def value_field(model_field):
+    """The field whose value a relation column holds, `model_field` itself otherwise."""
+    while model_field.is_relation:
+        model_field = model_field.target_field
+    return model_field
+
+
+def converter(field, model_field):
+    """
+    Function turning a column value into `field`'s representation:
+    `field.to_representation` or a faster equivalent, None when the value
+    already is the representation.
+    """
+    stored = value_field(model_field)
+    if type(field) in (serializers.CharField, serializers.EmailField):
+        return None if isinstance(stored, STRING_FIELDS) else str
+    if type(field) is serializers.IntegerField and isinstance(stored, models.IntegerField):
+        return None
+    if (type(field) is serializers.ChoiceField and isinstance(stored, STRING_FIELDS)
+            and all(isinstance(key, str) for key in field.choices)):
+        return None
+    if (type(field) is serializers.DateTimeField and isinstance(stored, models.DateTimeField)
+            and not hasattr(field, 'timezone')):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        # naive datetimes never end in +00:00, so isoformat() is the whole conversion
+        if output_format and output_format.lower() == ISO_8601 and not settings.USE_TZ:
+            return datetime.isoformat
+    return field.to_representation
+
+
+class ValuesPlan:
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.columns = []
+        self.converters = []
+        self.expression = self.compile_serializer(serializer_class(), serializer_class.Meta.model, '')
+        namespace = {f'c{index}': convert for index, convert in enumerate(self.converters)}
+        exec(
+            f'def serialize(r):\n    return {self.expression}\n'
+            f'def serialize_many(rows):\n    return [{self.expression} for r in rows]\n',
+            namespace,
+        )
+        self.serialize = namespace['serialize']
+        self.serialize_many = namespace['serialize_many']
+
+    def column(self, path):
+        if path not in self.columns:
+            self.columns.append(path)
+        return f'r[{self.columns.index(path)}]'
+
+    def compile_serializer(self, serializer, model, prefix):
+        if type(serializer).to_representation is not serializers.Serializer.to_representation:
+            raise ImproperlyConfigured(f'{type(serializer).__name__} overrides to_representation')
+        items = []
+        for field in serializer._readable_fields:
+            items.append(f'{field.field_name!r}: {self.compile_field(field, model, prefix)}')
+        return '{' + ', '.join(items) + '}'
+
+    def compile_field(self, field, model, prefix):
+        name = type(field).__name__
+        if isinstance(field, serializers.BaseSerializer):
+            if not isinstance(field, serializers.ModelSerializer):
+                raise ImproperlyConfigured(f'{name} {field.field_name!r} is not a ModelSerializer')
+        elif isinstance(field, (serializers.SerializerMethodField, serializers.HiddenField)) or field.source == '*':
+            raise ImproperlyConfigured(f'{name} {field.field_name!r} can\'t be read from values()')
+        try:
+            model_field, nullable = resolve(model, field.source)
+        except FieldDoesNotExist:
+            raise ImproperlyConfigured(f'{field.field_name!r} is not a column of {model.__name__}')
+        path = prefix + field.source.replace('.', '__')
+
+        if isinstance(field, serializers.BaseSerializer):
+            if not (model_field.many_to_one or model_field.one_to_one) or not model_field.concrete:
+                raise ImproperlyConfigured(f'{field.field_name!r} is not a forward relation of {model.__name__}')
+            nested = self.compile_serializer(field, model_field.related_model, path + '__')
+            if nullable:
+                return f'(None if {self.column(path)} is None else {nested})'
+            return nested
+
+        value = self.column(path)
+        convert = converter(field, model_field)
+        if convert is None:
+            return value
+        self.converters.append(convert)
+        call = f'c{len(self.converters) - 1}({value})'
+        # a serializer renders None without calling the field
+        return f'(None if {value} is None else {call})' if nullable else call
+
+    def values(self, queryset, *extra):
+        """
+        `queryset` as named rows with the plan's columns followed by `extra`,
+        e.g. the keyset ordering fields a paginator reads from the rows.
+        """
+        columns = list(self.columns)
+        columns += [name for name in extra if name not in columns]
+        return queryset.values_list(*columns, named=True)
+
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def values_plan(serializer_class):
+    """The ValuesPlan of `serializer_class`, compiled on first use."""
+    plan = _plans.get(serializer_class)
+    if plan is None:
+        with _plans_lock:
+            plan = _plans.get(serializer_class)
+            if plan is None:
+                plan = _plans[serializer_class] = ValuesPlan(serializer_class)
+    return plan
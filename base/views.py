@@ -1,13 +1,121 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
 from rest_framework import generics
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.permissions import SAFE_METHODS, IsAdminUser
 from rest_framework.response import Response
 
+from base.metrics import count, get_registry, timer
+from base.pagination import KeysetPagination
+from base.pool import all_pools
+from base.response_cache import GLOBAL_SCOPE, get_response_cache, parse_etags, user_scope
+from base.routers import current_state, route_reads_to_replica
+from base.serialization import values_plan
+
 class BaseListView(generics.ListAPIView):
-    pagination_class = PageNumberPagination
+    pagination_classes = {
+        'page': PageNumberPagination,
+        'keyset': KeysetPagination,
+    }
+    # None falls back to settings.LIST_PAGINATION_MODE
+    pagination_mode = None
+    # Used by keyset pagination, must end with a unique field
+    keyset_ordering = ('-created_at', '-pk')
+    include_count = True
+    # Serialize from values() rows with the serializer's compiled ValuesPlan
+    # instead of model instances, see base.serialization
+    fast_serialization = False
+    # Serve safe methods from a read replica, see base.routers
+    read_replica = False
+    # Cache responses per user with ETags, see base.response_cache
+    response_cache = False
+    etag = None
+
+    @property
+    def pagination_class(self):
+        return self.pagination_classes[self.pagination_mode or settings.LIST_PAGINATION_MODE]
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.read_replica and request.method in SAFE_METHODS:
+            route_reads_to_replica(request.user.id)
+
+    def get_cache_scopes(self):
+        """Scopes whose bump() invalidates this view's cached responses, GLOBAL_SCOPE is added."""
+        return [user_scope(self.request.user.id)]
+
+    def list(self, request, *args, **kwargs):
+        if self.response_cache:
+            cached = self.cached_response(request)
+            if cached is not None:
+                return cached
+        queryset = self.filter_queryset(self.get_queryset())
+        plan = values_plan(self.get_serializer_class()) if self.fast_serialization else None
+        if plan is not None:
+            queryset = plan.values(queryset, *(field.lstrip('-') for field in self.keyset_ordering))
+        page = self.paginate_queryset(queryset)
+        with timer('serializer'):
+            if plan is not None:
+                data = plan.serialize_many(page if page is not None else queryset)
+            else:
+                data = self.get_serializer(page if page is not None else queryset, many=True).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def cached_response(self, request):
+        """304 or the cached body when the current versions match, else None with self.etag set."""
+        cache = get_response_cache()
+        state = current_state()
+        settle = settings.DATABASE_ROUTING['STICKY_SECONDS'] if state is not None and state.replica else 0
+        self.etag = cache.etag(request, [GLOBAL_SCOPE, *self.get_cache_scopes()], settle)
+        if self.etag is None:
+            count('response_cache_bypass')
+            return None
+        tags = parse_etags(request.headers.get('If-None-Match', ''))
+        if self.etag in tags or '*' in tags:
+            count('response_cache_not_modified')
+            return HttpResponseNotModified()
+        cached = cache.get(self.etag)
+        if cached is None:
+            count('response_cache_miss')
+            return None
+        count('response_cache_hit')
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.etag is not None and response.status_code in (200, 304):
+            if isinstance(response, Response):
+                response.render()
+                get_response_cache().set(self.etag, response)
+            response['ETag'] = self.etag
+            # per user, and always revalidated
+            response['Cache-Control'] = 'private, no-cache'
+        return response
 
 class SuccessStatus(generics.GenericAPIView):
     throttle_classes = []
     permission_classes = []
     
     def get(self, request, *args, **kwargs):
-        return Response({"message" : "Success"})
\ No newline at end of file
+        return Response({"message" : "Success"})
+
+class RequestMetricsView(generics.GenericAPIView):
+    """Per-endpoint histograms and connection pool stats of this process, DELETE resets the histograms."""
+    throttle_classes = []
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'sample_rate': settings.REQUEST_METRICS['SAMPLE_RATE'],
+            'unit': 'ms',
+            'endpoints': get_registry().snapshot(),
+            'response_cache': {'entries': len(get_response_cache())},
+            'database_pools': {':'.join(str(part) for part in key[:2]): pool.stats() for key, pool in all_pools().items()},
+        })
+
+    def delete(self, request, *args, **kwargs):
+        get_registry().reset()
+        return Response(status=204)
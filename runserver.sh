@@ -11,7 +11,11 @@ python manage.py test
 # Check if tests were successful
 if [ $? -eq 0 ]; then
   echo "Tests passed. Starting server..."
-  gunicorn social_network.wsgi:application -b 0.0.0.0:8000 --reload --timeout=600
+  if [ "$SERVER_MODE" = "asgi" ]; then
+    gunicorn social_network.asgi:application -k uvicorn.workers.UvicornWorker -b 0.0.0.0:8000 --reload --timeout=600
+  else
+    gunicorn social_network.wsgi:application -b 0.0.0.0:8000 --reload --timeout=600
+  fi
 else
   echo "Tests failed. Server will not start."
   exit 1
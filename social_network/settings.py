@@ -34,6 +34,7 @@ ALLOWED_HOSTS = os.environ.get("ALLOWED_HOSTS").split(",")
 # Application definition
 DJANGO_APP = [
     'django.contrib.admin',
+    'django.contrib.postgres',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -55,6 +56,8 @@ SERVER_APP = [
 INSTALLED_APPS  =DJANGO_APP + THIRD_PART_APP + SERVER_APP
 
 MIDDLEWARE = [
+    'base.middleware.RequestMetricsMiddleware',
+    'base.middleware.DatabaseRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -100,6 +103,76 @@ DATABASES = {
     },
 }
 
+# Pooled connections (base.db.postgresql_pool): DATABASE_POOL=1. Each process
+# keeps MIN_SIZE..MAX_SIZE connections open and lends them out per request
+# (CONN_MAX_AGE 0 returns them after every request); a request waits at most
+# TIMEOUT seconds for a free one. Connections idle for CHECK_AFTER seconds are
+# health checked before reuse. Pool stats are served at /metrics/.
+if os.environ.get('DATABASE_POOL') == '1':
+    DATABASES['default'].update({
+        'ENGINE': 'base.db.postgresql_pool',
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10)),
+                'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 5)),
+                'max_idle': 300,
+                'max_lifetime': 3600,
+                'check_after': 30,
+            },
+        },
+    })
+
+# Read replicas: POSTGRES_REPLICA_HOSTS=host1,host2 adds replica_0, replica_1...
+# with the primary's credentials. Tests run them as mirrors of default.
+for index, host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+
+# Local test runs without a Postgres server: DATABASE_ENGINE=sqlite. `replica`
+# is a second SQLite file standing in for a replica, only routed to when it's
+# listed in DATABASE_ROUTING['REPLICAS'].
+if os.environ.get('DATABASE_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        },
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db_replica.sqlite3',
+        },
+    }
+
+DATABASE_ROUTERS = ['base.routers.ReplicaRouter']
+
+# Reads of views with read_replica (base.routers) go to a random alias of
+# REPLICAS. After a request that wrote, the user's reads stay on the primary
+# for STICKY_SECONDS, which must exceed the replicas' lag. The marker is kept
+# in the CACHE alias, which must be shared by all workers.
+DATABASE_ROUTING = {
+    'CACHE': 'default',
+    'REPLICAS': [alias for alias in DATABASES if alias.startswith('replica_')],
+    'STICKY_SECONDS': float(os.environ.get('DATABASE_STICKY_SECONDS', 10)),
+}
+
+# Django's cache holds state every worker must see (base.checks lists it).
+# Set REDIS_URL wherever more than one process serves requests: the
+# LocMemCache fallback is per process, only fit for runserver and tests.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -120,6 +193,19 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Executor for password hashing on login and signup (user.hashing).
+# MODE: 'process' (spawned process pool), 'thread' or 'inline' (request thread).
+# MAX_PENDING bounds hashes running or queued; callers wait at most
+# QUEUE_TIMEOUT seconds for a slot before getting a 503 with Retry-After.
+PASSWORD_HASHING = {
+    'MODE': os.environ.get('PASSWORD_HASHING_MODE', 'process'),
+    'WORKERS': int(os.environ['PASSWORD_HASHING_WORKERS']) if os.environ.get('PASSWORD_HASHING_WORKERS') else None,
+    'MAX_PENDING': 64,
+    'QUEUE_TIMEOUT': 0.5,
+    'RETRY_AFTER': 1,
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -154,10 +240,11 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        # JSONRenderer's output, encoded with orjson when it's installed
+        'base.renderers.FastJSONRenderer',
     ),
     'DEFAULT_THROTTLE_CLASSES': [
         'rest_framework.throttling.AnonRateThrottle',
@@ -171,6 +258,119 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10
 }
 
+# Two-tier cache for the user behind a JWT: a per-process LRU in front of
+# the CACHE alias, which must be shared by all workers. LOCAL_TTL bounds how
+# long another process can serve a user after it was changed, the shared
+# entry is invalidated on every User/UserData write.
+AUTH_USER_CACHE = {
+    'CACHE': 'default',
+    'LOCAL_MAXSIZE': 10000,
+    'LOCAL_TTL': 5,
+    'SHARED_TTL': 300,
+}
+
+# Sliding-window limits enforced by user.helper.rate_limit, DRF rate format.
+# Counted in the RATE_LIMIT_CACHE alias, which must be shared by all workers.
+# FRIEND_REQUEST_BULK_RATE_LIMIT counts bulk calls, and each request a bulk
+# call sends also counts against FRIEND_REQUEST_RATE_LIMIT.
+RATE_LIMIT_CACHE = 'default'
+FRIEND_REQUEST_RATE_LIMIT = os.environ.get('FRIEND_REQUEST_RATE_LIMIT', '3/minute')
+FRIEND_REQUEST_BULK_RATE_LIMIT = os.environ.get('FRIEND_REQUEST_BULK_RATE_LIMIT', '10/minute')
+EXPORT_RATE_LIMIT = os.environ.get('EXPORT_RATE_LIMIT', '5/hour')
+
+# Rows fetched per server-side cursor round trip by the NDJSON export (user.export)
+EXPORT_CHUNK_SIZE = 2000
+
+# Archival of answered friend requests (user.archive). Requests answered more
+# than AGE_DAYS[status] days ago are moved to ArchivedFriendRequest by the
+# archive_friend_requests command, BATCH_SIZE rows per transaction with SLEEP
+# seconds between transactions.
+FRIEND_REQUEST_ARCHIVE = {
+    'AGE_DAYS': {
+        'rejected': int(os.environ.get('FRIEND_REQUEST_ARCHIVE_REJECTED_DAYS', 30)),
+        'accepted': int(os.environ.get('FRIEND_REQUEST_ARCHIVE_ACCEPTED_DAYS', 180)),
+    },
+    'BATCH_SIZE': 1000,
+    'SLEEP': 0.1,
+}
+
+# Largest number of ids accepted by the bulk friend request endpoints
+FRIEND_REQUEST_BULK_MAX = 500
+
+# Length of each user's precomputed "people you may know" list
+FRIEND_SUGGESTIONS_TOP_K = 50
+
+# Server-sent friend request events (user.events). BACKEND feeds each
+# process's fan-out: DatabasePollingBackend polls the table every
+# POLL_INTERVAL seconds for connected users and sees every process's writes,
+# LocalEventBackend only sees this process's writes. Clients that fall
+# QUEUE_SIZE events behind are disconnected and resume from Last-Event-ID.
+FRIEND_REQUEST_EVENTS = {
+    'BACKEND': os.environ.get('FRIEND_REQUEST_EVENTS_BACKEND', 'user.events.DatabasePollingBackend'),
+    'POLL_INTERVAL': 1.0,
+    'POLL_OVERLAP': 5.0,
+    'HEARTBEAT': 15,
+    'QUEUE_SIZE': 100,
+    'REPLAY_BATCH': 500,
+    'RETRY_MS': 3000,
+}
+
+# Per-user response cache of BaseListView subclasses with response_cache = True
+# (base.response_cache). Scope versions are kept in the CACHE alias, which
+# must be shared by all workers (base.E001 outside ENVIRONMENT=LOCAL). Bodies are kept per process, at most MAXSIZE
+# of them and none over MAX_BODY_BYTES, so at most 64 MiB by default.
+RESPONSE_CACHE = {
+    'CACHE': 'default',
+    'MAXSIZE': int(os.environ.get('RESPONSE_CACHE_MAXSIZE', 2000)),
+    'MAX_BODY_BYTES': 32 * 1024,
+}
+
+# Pagination of BaseListView subclasses: 'page' (page number, COUNT + OFFSET)
+# or 'keyset' (signed cursor on the view's keyset_ordering, no OFFSET)
+LIST_PAGINATION_MODE = os.environ.get('LIST_PAGINATION_MODE', 'page')
+
+# Per-request instrumentation (base.middleware.RequestMetricsMiddleware).
+# SAMPLE_RATE is the share of requests that get a log line, a place in the
+# histograms at /metrics/ and, for staff users with SERVER_TIMING, a
+# Server-Timing header; 0 turns it off. Queries
+# slower than SLOW_QUERY_MS are logged with their SQL whether sampled or not,
+# which times every query; None leaves unsampled requests untimed.
+# BUCKETS_MS are the upper bounds of the latency histogram buckets.
+REQUEST_METRICS = {
+    'SAMPLE_RATE': float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', 1.0)),
+    'SERVER_TIMING': True,
+    'SLOW_QUERY_MS': 100,
+    'SLOW_REQUEST_MS': 1000,
+    'BUCKETS_MS': (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'base.metrics': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_METRICS_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
+
+# Revoked JWTs (user.revocation): a per-process Bloom filter sized for
+# CAPACITY revocations at ERROR_RATE false positives sits in front of the
+# RevokedToken table. Processes pull other processes' revocations every
+# SYNC_INTERVAL seconds and rebuild the filter every REBUILD_INTERVAL seconds.
+TOKEN_REVOCATION = {
+    'CAPACITY': 100000,
+    'ERROR_RATE': 0.001,
+    'SYNC_INTERVAL': 5,
+    'REBUILD_INTERVAL': 3600,
+}
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=120),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -182,4 +382,19 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'email',
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True
-}
\ No newline at end of file
+}
+
+# Dotted path of the user search engine, None picks one from the database vendor
+USER_SEARCH_BACKEND = os.environ.get('USER_SEARCH_BACKEND') or None
+
+# In-process prefix index behind the autocomplete endpoint (user.autocomplete).
+# TOP_K is the most results a lookup returns, each term keeps TOP_K + 1
+# users. Users past MEMORY_BUDGET_MB are looked up in the database instead.
+# Rows changed by other processes are pulled every SYNC_INTERVAL seconds,
+# the index is rebuilt in a background thread every REBUILD_INTERVAL seconds.
+AUTOCOMPLETE = {
+    'TOP_K': 10,
+    'MEMORY_BUDGET_MB': int(os.environ.get('AUTOCOMPLETE_MEMORY_BUDGET_MB', 256)),
+    'SYNC_INTERVAL': 5,
+    'REBUILD_INTERVAL': 3600,
+}
@@ -17,10 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
-from base.views import SuccessStatus
+from base.views import SuccessStatus, RequestMetricsView
 
 urlpatterns = [
     path("", SuccessStatus.as_view()),
+    path("metrics/", RequestMetricsView.as_view(), name='request-metrics'),
     path('admin/', admin.site.urls),
     path('api/user/', include('user.urls')),
 ]
@@ -0,0 +1,60 @@
+"""
+Lifecycle of answered friend requests. Requests answered long ago are
+rarely read, yet they would make up most of FriendRequest, the table
+behind the pending inbox, and bloat its indexes. archive_batch() moves
+the ones answered before a cutoff to ArchivedFriendRequest, keeping their
+ids, in one short transaction per batch; archive_friend_requests runs it
+in throttled batches.
+
+FriendRequestManager.send and statuses() read both tables, and user.export
+exports both, so a pair answered long ago can't be requested again and
+still shows in a user's history. The answered inbox only lists live rows.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from base.response_cache import bump, user_scope
+from user.models import ArchivedFriendRequest, FriendRequest
+
+COLUMNS = ('id', 'from_user_id', 'to_user_id', 'status', 'created_at', 'updated_at')
+
+
+def cutoffs(now=None):
+    """status -> requests answered before this are archived, from FRIEND_REQUEST_ARCHIVE['AGE_DAYS']."""
+    now = now or timezone.now()
+    return {
+        status: now - timedelta(days=days)
+        for status, days in settings.FRIEND_REQUEST_ARCHIVE['AGE_DAYS'].items()
+    }
+
+
+def archive_batch(status, cutoff, batch_size):
+    """
+    Move up to `batch_size` requests with `status` last updated before
+    `cutoff`, oldest first, to ArchivedFriendRequest. Returns how many moved.
+    """
+    connection = connections[router.db_for_write(FriendRequest)]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in COLUMNS)
+    with transaction.atomic(using=connection.alias):
+        rows = list(
+            FriendRequest.objects.select_for_update().filter(status=status, updated_at__lt=cutoff)
+            .order_by('updated_at', 'pk').values_list('pk', 'from_user_id', 'to_user_id')[:batch_size]
+        )
+        if not rows:
+            return 0
+        ids = [pk for pk, _, _ in rows]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(ArchivedFriendRequest._meta.db_table)} ({columns}, {quote("archived_at")}) '
+                f'SELECT {columns}, %s FROM {quote(FriendRequest._meta.db_table)} '
+                f'WHERE {quote("id")} IN ({", ".join(["%s"] * len(ids))})',
+                [connection.ops.adapt_datetimefield_value(timezone.now()), *ids],
+            )
+        FriendRequest.objects.filter(pk__in=ids).delete()
+        # archived requests leave the answered inboxes
+        bump(*{user_scope(user_id) for _, from_user_id, to_user_id in rows for user_id in (from_user_id, to_user_id)})
+    return len(ids)
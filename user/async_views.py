@@ -0,0 +1,225 @@
+"""
+Async versions of the hot endpoints, for the ASGI deployment. They run on
+Django's async ORM so a request waiting on Postgres holds no worker thread;
+work that is sync-only (cache, transactions, password hashing) goes through
+sync_to_async. Responses match the DRF views, lists use keyset pagination.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError
+from django.http import JsonResponse, QueryDict, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from base.metrics import timer
+from base.pagination import KeysetPagination
+from base.ratelimit import SlidingWindowRateLimiter
+from base.routers import route_reads_to_replica
+from base.serialization import values_plan
+
+from user.authentication import CachedJWTAuthentication
+from user.events import event_stream
+from user.hashing import PasswordHashingBusy, check_user_password
+from user.helper import generate_user_token
+from user.models import FriendRequest, User
+from user.search import get_search_backend
+from user.serializers import SelfFriendRequestSerializer, UserSearchSerializer, UserSerializer
+from user.views import SEND_ERRORS, FriendRequestView, UserSearchView, answer_friend_request, create_friend_request
+
+
+def get_data(request):
+    """The request's fields, {} for a JSON body that isn't an object."""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    if request.method == 'POST':
+        return request.POST
+    return QueryDict(request.body)
+
+
+def missing_fields_response(data, required_fields):
+    missing_fields = [field for field in required_fields if field not in data]
+    if missing_fields:
+        return JsonResponse({
+            'message': 'Missing required fields',
+            'error': 'missing_fields',
+            'missing_fields': missing_fields,
+            'required_fields': required_fields
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+
+def invalid_fields_response(data, string_fields):
+    """400 unless every field of `string_fields` is a string, JSON bodies can hold anything."""
+    invalid_fields = [field for field in string_fields if not isinstance(data.get(field), str)]
+    if invalid_fields:
+        return JsonResponse({
+            'message': 'Invalid fields',
+            'error': 'invalid_fields',
+            'invalid_fields': invalid_fields,
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+
+def async_authenticated(view):
+    """Authenticates with the same JWT class as the DRF views."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            result = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+        except (AuthenticationFailed, InvalidToken) as e:
+            detail = e.detail if isinstance(e.detail, dict) else {'detail': e.detail}
+            return JsonResponse(detail, status=status.HTTP_401_UNAUTHORIZED)
+        if result is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                                status=status.HTTP_401_UNAUTHORIZED)
+        request.user = result[0]
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def paginated_response(request, queryset, serializer_class, view_class):
+    paginator = KeysetPagination()
+    plan = values_plan(serializer_class) if view_class.fast_serialization else None
+    if plan is not None:
+        queryset = plan.values(queryset, *(field.lstrip('-') for field in view_class.keyset_ordering))
+    try:
+        page = await paginator.apaginate_queryset(queryset, request, view_class)
+    except NotFound as e:
+        return JsonResponse({'detail': e.detail}, status=status.HTTP_404_NOT_FOUND)
+    with timer('serializer'):
+        data = plan.serialize_many(page) if plan is not None else serializer_class(page, many=True).data
+    return JsonResponse(paginator.get_paginated_data(data))
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+async def login(request):
+    data = get_data(request)
+    invalid = missing_fields_response(data, ('email', 'password')) or invalid_fields_response(data, ('email', 'password'))
+    if invalid:
+        return invalid
+
+    email = data.get('email').lower()
+    user = await User.objects.select_related('user_data').filter(email=email).afirst()
+    if user is None:
+        return JsonResponse({'message': 'Invalid Email', 'error': 'invalid_email'}, status=status.HTTP_400_BAD_REQUEST)
+    # PBKDF2 is CPU bound, keep it off the shared sync thread
+    try:
+        valid = await sync_to_async(check_user_password, thread_sensitive=False)(user, data.get('password'))
+    except PasswordHashingBusy:
+        return JsonResponse({'message': 'Server is busy, please retry shortly', 'error': 'server_busy'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={'Retry-After': str(settings.PASSWORD_HASHING['RETRY_AFTER'])})
+    if not valid:
+        return JsonResponse({'message': 'Invalid Password', 'error': 'invalid_password'}, status=status.HTTP_400_BAD_REQUEST)
+    if not user.is_active:
+        return JsonResponse({'message': 'In Active Account', 'error': 'inactive_user'}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = generate_user_token(user)
+    response['user'] = UserSerializer(user).data
+    return JsonResponse(response)
+
+
+@csrf_exempt
+@require_http_methods(['GET'])
+@async_authenticated
+async def search(request):
+    query = request.GET.get('q', '')
+    await sync_to_async(route_reads_to_replica)(request.user.id)
+    queryset = await sync_to_async(get_search_backend().search)(query, exclude_user_id=request.user.id)
+    return await paginated_response(request, queryset, UserSearchSerializer, UserSearchView)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+@async_authenticated
+async def friend_requests(request):
+    if request.method == 'POST':
+        return await send_friend_request(request)
+
+    missing = missing_fields_response(request.GET, ('status',))
+    if missing:
+        return missing
+    await sync_to_async(route_reads_to_replica)(request.user.id)
+    queryset = FriendRequest.objects.select_related('from_user__user').filter(
+        to_user_id=request.user.id, status=request.GET.get('status')
+    )
+    return await paginated_response(request, queryset, SelfFriendRequestSerializer, FriendRequestView)
+
+
+async def send_friend_request(request):
+    data = get_data(request)
+    missing = missing_fields_response(data, ('to_user_id',))
+    if missing:
+        return missing
+    from_user_id = request.user.id
+    try:
+        to_user_id = int(data.get('to_user_id'))
+    except (TypeError, ValueError):
+        return JsonResponse({'message': 'Invalid User Id', "error": "invalid_id"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if to_user_id == from_user_id:
+        return JsonResponse({'message': 'You cant send request to yourself', "error": "circular error"}, status=status.HTTP_400_BAD_REQUEST)
+    limiter = SlidingWindowRateLimiter(settings.FRIEND_REQUEST_RATE_LIMIT, prefix='FRIEND_REQUEST_RATE_LIMIT',
+                                       cache_alias=settings.RATE_LIMIT_CACHE)
+    counter = await sync_to_async(limiter.hit)(from_user_id)
+    if counter is None:
+        return JsonResponse({
+            'message': f'You cannot send more than {limiter.limit} friend requests in a {limiter.period}',
+            "error": "limit_exceed"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        pk, existing = await sync_to_async(create_friend_request)(from_user_id, to_user_id)
+    except IntegrityError as e:
+        await sync_to_async(limiter.release)(counter)
+        return JsonResponse({'message': 'Something Went Wrong', "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if pk is None:
+        await sync_to_async(limiter.release)(counter)
+        message, error = SEND_ERRORS.get(existing, SEND_ERRORS['rejected'])
+        return JsonResponse({'message': message, "error": error}, status=status.HTTP_400_BAD_REQUEST)
+    return JsonResponse({'message': 'Friend Request Sent Successfully'}, status=status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@require_http_methods(['PATCH'])
+@async_authenticated
+async def respond_friend_request(request, pk):
+    data = get_data(request)
+    invalid = missing_fields_response(data, ('action',)) or invalid_fields_response(data, ('action',))
+    if invalid:
+        return invalid
+    action = data.get('action')
+    if action not in FriendRequest.TRANSITIONS['pending']:
+        return JsonResponse({'message': 'Invalid action', "error": "invalid_action"}, status=status.HTTP_400_BAD_REQUEST)
+    if not await sync_to_async(answer_friend_request)(pk, request.user.id, action):
+        return JsonResponse({'message': 'No Request Found', "error": "not_found"}, status=status.HTTP_400_BAD_REQUEST)
+    return JsonResponse({'message': 'Friend Request Accepted Successfully'})
+
+
+@csrf_exempt
+@require_http_methods(['GET'])
+@async_authenticated
+async def friend_request_events(request):
+    """
+    Server-sent events with the user's incoming friend requests as they are
+    created or answered. Reconnecting clients send Last-Event-ID (or
+    ?last_event_id=) and get what they missed first. ASGI only: a WSGI
+    worker would drain the endless stream into a list and never answer.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'message': 'Event streams need the ASGI server', 'error': 'asgi_required'},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    response = StreamingHttpResponse(event_stream(request.user.id, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,103 @@
+import pickle
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from base.cache import LRUCache
+from user.models import User
+from user.revocation import is_token_revoked
+
+
+def user_cache_key(email):
+    # the exact claim, User.email is case-sensitive like the lookup behind it
+    return f'auth:user:{email}'
+
+
+class UserCache:
+    """
+    A process's users by token email claim: a local LRU in front of the
+    shared cache alias, then the database. Entries hold pickled instances
+    so every request gets its own copy.
+    """
+
+    def __init__(self, alias, local_maxsize, local_ttl, shared_ttl):
+        self.alias = alias
+        self.shared_ttl = shared_ttl
+        self._local = LRUCache(maxsize=local_maxsize, ttl=local_ttl)
+
+    def get(self, email):
+        key = user_cache_key(email)
+        payload = self._local.get(key)
+        if payload is None:
+            shared = caches[self.alias]
+            payload = shared.get(key)
+            if payload is None:
+                user = User.objects.select_related('user_data').get(**{api_settings.USER_ID_FIELD: email})
+                payload = pickle.dumps(user)
+                shared.set(key, payload, self.shared_ttl)
+            self._local.set(key, payload)
+        return pickle.loads(payload)
+
+    def invalidate(self, email):
+        """
+        Drops the user from the shared cache and this process's LRU. Other
+        processes keep their local copy for at most LOCAL_TTL seconds.
+        """
+        key = user_cache_key(email)
+        self._local.delete(key)
+        caches[self.alias].delete(key)
+
+
+_users = UserCache(
+    settings.AUTH_USER_CACHE['CACHE'],
+    local_maxsize=settings.AUTH_USER_CACHE['LOCAL_MAXSIZE'],
+    local_ttl=settings.AUTH_USER_CACHE['LOCAL_TTL'],
+    shared_ttl=settings.AUTH_USER_CACHE['SHARED_TTL'],
+)
+
+
+def get_cached_user(email):
+    return _users.get(email)
+
+
+def invalidate_cached_user(email):
+    _users.invalidate(email)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that rejects revoked tokens and resolves the user through get_cached_user."""
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_token_revoked(validated_token):
+            raise InvalidToken(_("Token is revoked"))
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = get_cached_user(user_id)
+        except User.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
@@ -0,0 +1,327 @@
+"""
+In-process prefix index for type-ahead. Each user is indexed under their
+normalized name, the rest of the name from every later word ("smith" for
+"John Smith") and their normalized email. Terms are kept in one sorted
+list with a parallel array of user ids, so a lookup is a bisect plus a
+walk over at most a few times `limit` entries, without a query.
+
+Results come in term order, then user id. A term keeps the lowest
+TOP_K + 1 user ids: a lookup returns at most TOP_K users, the extra one
+stands in for the user excluded from their own results. Once a user is
+renamed or deleted out of a full term, that term can come up short until
+the next rebuild brings back the ids it had dropped. Users past
+MEMORY_BUDGET_MB are left out and autocomplete() tops the results up from
+the database.
+
+Each process builds the index in a background thread on first use and
+answers from the database until it is ready. Signups, name and email
+changes in the process update it right away; rows changed by other
+processes or bulk writes are pulled every SYNC_INTERVAL seconds and the
+index is rebuilt every REBUILD_INTERVAL seconds, again in the background
+with the old index serving until the new one is swapped in, which also
+drops users deleted elsewhere.
+"""
+import logging
+
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from user.models import UserData
+
+logger = logging.getLogger('user.autocomplete')
+
+# Rows saved this long before a sync started are pulled again
+SYNC_OVERLAP = timedelta(seconds=30)
+
+# Changed rows above which a sync rebuilds instead, each insert moves the arrays
+SYNC_MAX_UPDATES = 1000
+
+# dict slot, key int and (name, email) tuple of a user
+USER_OVERHEAD = 150
+
+
+def normalize(text):
+    """Lower-case `text` without accents and with single spaces."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+def user_terms(name, email):
+    """Index terms of a user, `email` already normalized so the term shares its string."""
+    name = normalize(name)
+    words = name.split(' ')
+    terms = {name, email}
+    terms.update(' '.join(words[index:]) for index in range(1, len(words)))
+    terms.discard('')
+    return terms
+
+
+class PrefixIndex:
+    """Sorted (term, user id) entries, see the module docstring."""
+
+    def __init__(self, top_k, memory_budget):
+        self.top_k = top_k
+        # one more than a lookup returns, see the module docstring
+        self.capacity = top_k + 1
+        self.memory_budget = memory_budget
+        self.complete = True
+        self.memory = 0
+        self._terms = []
+        self._ids = array('q')
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._users)
+
+    @property
+    def entries(self):
+        return len(self._terms)
+
+    def name(self, user_id):
+        record = self._users.get(user_id)
+        return record[0] if record is not None else None
+
+    def _cost(self, name, email, terms):
+        # a list slot and an array item per term, name terms are often shared with other users
+        return (USER_OVERHEAD + sys.getsizeof(name) + sys.getsizeof(email)
+                + sum(16 + (sys.getsizeof(term) if term != email else 0) for term in terms))
+
+    def build(self, rows):
+        """Load (user_id, name, email) rows into the empty index, one sort."""
+        entries = []
+        for user_id, name, email in rows:
+            terms = user_terms(name, email)
+            cost = self._cost(name, email, terms)
+            if self.memory + cost > self.memory_budget:
+                self.complete = False
+                continue
+            self.memory += cost
+            self._users[user_id] = (name, email)
+            entries.extend((term, user_id) for term in terms)
+        entries.sort()
+        previous, kept = None, 0
+        for term, user_id in entries:
+            if term == previous:
+                if kept == self.capacity:
+                    continue
+                # one string object per distinct term
+                term, kept = previous, kept + 1
+            else:
+                previous, kept = term, 1
+            self._terms.append(term)
+            self._ids.append(user_id)
+        return self
+
+    def add(self, user_id, name, email):
+        """Index `user_id` under `name` and `email`, replacing their previous terms."""
+        terms = user_terms(name, email)
+        with self._lock:
+            previous = self._users.get(user_id)
+            if previous is not None:
+                if previous == (name, email):
+                    return
+                self._remove(user_id)
+            cost = self._cost(name, email, terms)
+            if self.memory + cost > self.memory_budget:
+                self.complete = False
+                return
+            self.memory += cost
+            self._users[user_id] = (name, email)
+            for term in terms:
+                self._insert(term, user_id)
+
+    def remove(self, user_id):
+        with self._lock:
+            self._remove(user_id)
+
+    def _insert(self, term, user_id):
+        start, end = bisect_left(self._terms, term), bisect_right(self._terms, term)
+        # ids of one term are sorted, keep the lowest capacity
+        position = start + bisect_left(self._ids[start:end], user_id)
+        if end - start >= self.capacity:
+            if position == end:
+                return
+            del self._terms[end - 1]
+            del self._ids[end - 1]
+        self._terms.insert(position, term)
+        self._ids.insert(position, user_id)
+
+    def _remove(self, user_id):
+        record = self._users.pop(user_id, None)
+        if record is None:
+            return
+        terms = user_terms(*record)
+        self.memory -= self._cost(*record, terms)
+        for term in terms:
+            start, end = bisect_left(self._terms, term), bisect_right(self._terms, term)
+            position = start + bisect_left(self._ids[start:end], user_id)
+            if position < end and self._ids[position] == user_id:
+                del self._terms[position]
+                del self._ids[position]
+
+    def lookup(self, prefix, limit, exclude_user_id=None):
+        """Up to `limit` (user_id, name) whose terms start with normalized `prefix`."""
+        prefix = normalize(prefix)
+        results, seen = [], set()
+        if not prefix:
+            return results
+        with self._lock:
+            terms, ids = self._terms, self._ids
+            index = bisect_left(terms, prefix)
+            while index < len(terms) and len(results) < limit and terms[index].startswith(prefix):
+                user_id = ids[index]
+                if user_id not in seen and user_id != exclude_user_id:
+                    seen.add(user_id)
+                    results.append((user_id, self._users[user_id][0]))
+                index += 1
+        return results
+
+
+class AutocompleteStore:
+    """
+    The process's PrefixIndex, built, synced and rebuilt as configured in
+    settings.AUTOCOMPLETE. Builds run in a background thread and changes
+    made in the process meanwhile are replayed onto the new index before
+    it replaces the current one.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._built_at = self._synced_at = 0.0
+        self._sync_from = None
+        self._refresh_lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._changes = None
+        self._rebuilding = None
+
+    def index(self):
+        """The current PrefixIndex, None until the first build is done."""
+        config = settings.AUTOCOMPLETE
+        now = time.monotonic()
+        if self._index is None or now - self._built_at > config['REBUILD_INTERVAL']:
+            self.start_rebuild()
+        elif now - self._synced_at > config['SYNC_INTERVAL']:
+            # one thread syncs, the others keep using the index as it is
+            if self._refresh_lock.acquire(blocking=False):
+                try:
+                    if time.monotonic() - self._synced_at > config['SYNC_INTERVAL']:
+                        self.sync()
+                finally:
+                    self._refresh_lock.release()
+        return self._index
+
+    def start_rebuild(self):
+        """Rebuild in a background thread unless one is already running."""
+        with self._swap_lock:
+            if self._rebuilding is not None and self._rebuilding.is_alive():
+                return
+            self._rebuilding = threading.Thread(target=self._rebuild_in_background, name='autocomplete-rebuild',
+                                                daemon=True)
+            self._rebuilding.start()
+
+    def _rebuild_in_background(self):
+        try:
+            with self._refresh_lock:
+                self.rebuild()
+        except Exception:
+            logger.exception('Autocomplete index rebuild failed')
+        finally:
+            # the thread's own connection
+            connection.close()
+
+    def rebuild(self):
+        config = settings.AUTOCOMPLETE
+        started, build_started = timezone.now(), time.monotonic()
+        with self._swap_lock:
+            self._changes = []
+        try:
+            rows = UserData.objects.order_by('pk').values_list('user_id', 'name', 'email_normalized')
+            index = PrefixIndex(config['TOP_K'], config['MEMORY_BUDGET_MB'] * 1024 * 1024).build(
+                rows.iterator(chunk_size=10000)
+            )
+        except BaseException:
+            with self._swap_lock:
+                self._changes = None
+            raise
+        with self._swap_lock:
+            for user_id, name, email in self._changes:
+                self._apply(index, user_id, name, email)
+            self._changes = None
+            self._index = index
+            # rows saved during the build are pulled by the next sync
+            self._built_at = self._synced_at = build_started
+            self._sync_from = started
+
+    def sync(self):
+        started = timezone.now()
+        rows = list(UserData.objects.filter(updated_at__gte=self._sync_from - SYNC_OVERLAP).values_list(
+            'user_id', 'name', 'email_normalized'
+        )[:SYNC_MAX_UPDATES + 1])
+        if len(rows) > SYNC_MAX_UPDATES:
+            self._synced_at = time.monotonic()
+            self.start_rebuild()
+            return
+        for row in rows:
+            self._index.add(*row)
+        self._synced_at = time.monotonic()
+        self._sync_from = started
+
+    def _apply(self, index, user_id, name, email):
+        # name None is an email change, email None a removal
+        if email is None:
+            index.remove(user_id)
+            return
+        if name is None:
+            name = index.name(user_id)
+        if name is not None:
+            index.add(user_id, name, email)
+
+    def _change(self, user_id, name, email):
+        with self._swap_lock:
+            if self._index is not None:
+                self._apply(self._index, user_id, name, email)
+            if self._changes is not None:
+                self._changes.append((user_id, name, email))
+
+    def add(self, user_id, name, email):
+        self._change(user_id, name, email)
+
+    def remove(self, user_id):
+        self._change(user_id, None, None)
+
+    def change_email(self, user_id, email):
+        """Reindex `user_id` under a new email, User.save updates UserData without saving it."""
+        self._change(user_id, None, email)
+
+
+_store = AutocompleteStore()
+
+
+def get_autocomplete_store():
+    return _store
+
+
+def autocomplete(prefix, limit, exclude_user_id=None):
+    """(user_id, name) of up to `limit` users whose name or email starts with `prefix`."""
+    index = _store.index()
+    results = index.lookup(prefix, limit, exclude_user_id) if index is not None else []
+    if len(results) < limit and (index is None or not index.complete) and normalize(prefix):
+        # users over the memory budget, or all of them while the index is built, are only in the database
+        seen = {user_id for user_id, _ in results}
+        queryset = UserData.objects.filter(
+            Q(name__istartswith=prefix.strip()) | Q(email_normalized__startswith=prefix.strip().lower())
+        ).exclude(user_id__in=[*seen, exclude_user_id]).order_by('pk').values_list('user_id', 'name')
+        results.extend(queryset[:limit - len(results)])
+    return results
@@ -0,0 +1,118 @@
+"""
+Per-user badge counters: pending requests received, pending requests sent
+and friends, one UserCounters row per user. The send and answer paths in
+user.views add their changes with apply() inside the transaction that
+writes the requests and friendships, one upsert for every user touched,
+so the counts commit or roll back with the rows they count. A user
+without a row has every count at zero.
+
+Writes outside those paths (generate_social_data, cascading deletes of
+users) leave the counters behind; reconcile() recounts a batch of users
+from FriendRequest and Friendship and repairs the rows that drifted, see
+the reconcile_user_counters command.
+"""
+from collections import Counter, defaultdict
+
+from django.db import connections, router, transaction
+from django.db.models import Count
+
+from user.models import FriendRequest, Friendship, UserCounters
+
+FIELDS = ('pending_in', 'pending_out', 'friends')
+
+
+def get_counters(user_id):
+    """The counts of `user_id`, one primary key lookup."""
+    row = UserCounters.objects.filter(pk=user_id).values_list(*FIELDS).first()
+    return dict(zip(FIELDS, row or (0,) * len(FIELDS)))
+
+
+def sent(pairs):
+    """Deltas of requests sent, one (from_user_id, to_user_id) pair each."""
+    deltas = defaultdict(Counter)
+    for from_user_id, to_user_id in pairs:
+        deltas[from_user_id]['pending_out'] += 1
+        deltas[to_user_id]['pending_in'] += 1
+    return deltas
+
+
+def answered(pairs, edges=()):
+    """
+    Deltas of pending requests answered, one (from_user_id, to_user_id) pair
+    each, and of the friendship `edges` Friendship.objects.link_many created.
+    """
+    deltas = defaultdict(Counter)
+    for from_user_id, to_user_id in pairs:
+        deltas[from_user_id]['pending_out'] -= 1
+        deltas[to_user_id]['pending_in'] -= 1
+    for user_id, _ in edges:
+        deltas[user_id]['friends'] += 1
+    return deltas
+
+
+def apply(deltas):
+    """
+    Add `deltas`, user_id -> {field: change}, with one upsert. Rows are
+    written in user_id order so concurrent transactions lock them in the
+    same order.
+    """
+    rows = [(user_id, *(deltas[user_id].get(field, 0) for field in FIELDS)) for user_id in sorted(deltas)]
+    rows = [row for row in rows if any(row[1:])]
+    if not rows:
+        return
+    meta = UserCounters._meta
+    connection = connections[router.db_for_write(UserCounters)]
+    quote = connection.ops.quote_name
+    table, pk = quote(meta.db_table), quote(meta.pk.column)
+    columns = [quote(field) for field in FIELDS]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({pk}, {", ".join(columns)}) '
+            f'VALUES {", ".join(["(" + ", ".join(["%s"] * len(rows[0])) + ")"] * len(rows))} '
+            f'ON CONFLICT ({pk}) DO UPDATE SET '
+            + ', '.join(f'{column} = {table}.{column} + EXCLUDED.{column}' for column in columns),
+            [value for row in rows for value in row],
+        )
+
+
+def recount(user_ids):
+    """user_id -> counts of `user_ids` computed from FriendRequest and Friendship, three grouped queries."""
+    counts = {user_id: dict.fromkeys(FIELDS, 0) for user_id in user_ids}
+    pending = FriendRequest.objects.filter(status='pending').order_by()
+    queries = [
+        ('pending_in', 'to_user_id', pending.filter(to_user_id__in=user_ids)),
+        ('pending_out', 'from_user_id', pending.filter(from_user_id__in=user_ids)),
+        ('friends', 'user_id', Friendship.objects.filter(user_id__in=user_ids).order_by()),
+    ]
+    for field, column, queryset in queries:
+        for user_id, count in queryset.values(column).annotate(count=Count('pk')).values_list(column, 'count'):
+            counts[user_id][field] = count
+    return counts
+
+
+def reconcile(user_ids, repair=True):
+    """
+    Compare the stored counts of `user_ids` with a recount and, with
+    `repair`, overwrite the ones that drifted. Returns (user_id, stored,
+    actual) for each of them. The stored rows are locked first: a write
+    that commits before the lock is in both the rows and the recount, one
+    still running waits for the lock and then adds its delta to the
+    repaired row. Only a user without a row isn't covered by the lock.
+    """
+    with transaction.atomic():
+        stored = {
+            row[0]: dict(zip(FIELDS, row[1:]))
+            for row in UserCounters.objects.select_for_update().filter(pk__in=user_ids)
+            .order_by('pk').values_list('pk', *FIELDS)
+        }
+        drifted = []
+        for user_id, actual in recount(user_ids).items():
+            counts = stored.get(user_id, dict.fromkeys(FIELDS, 0))
+            if counts != actual:
+                drifted.append((user_id, counts, actual))
+        if repair and drifted:
+            UserCounters.objects.bulk_create(
+                [UserCounters(user_id=user_id, **actual) for user_id, _, actual in drifted],
+                update_conflicts=True, unique_fields=['user'], update_fields=list(FIELDS),
+            )
+    return drifted
@@ -0,0 +1,263 @@
+"""
+Server-sent events for incoming friend requests. Every connected client is
+a Subscription on the process-wide EventHub, an asyncio queue waited on by
+the streaming response, so an open stream holds no worker thread. The
+configured backend feeds the hub:
+
+- DatabasePollingBackend: one poll of the friend request table per process
+  and POLL_INTERVAL for the users connected to that process, so writes made
+  by any process reach every client. Writes made in this process wake the
+  poller right away.
+- LocalEventBackend: publishes this process's writes only, for a single
+  process deployment.
+
+A backend on a real broker (Postgres LISTEN/NOTIFY, Redis) only has to
+implement notify() and subscribed(). Event ids are (updated_at, id) cursors,
+so a client reconnecting with Last-Event-ID is replayed what it missed from
+the database.
+"""
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+
+from user.models import FriendRequest
+from user.serializers import SelfFriendRequestSerializer
+
+OVERFLOW = object()
+
+
+def event_id(friend_request):
+    return f'{friend_request.updated_at.isoformat()}_{friend_request.pk}'
+
+
+def parse_event_id(value):
+    """(updated_at, pk) of an event id, None when it isn't one."""
+    try:
+        updated_at, pk = value.rsplit('_', 1)
+        updated_at, pk = parse_datetime(updated_at), int(pk)
+    except (AttributeError, ValueError):
+        return None
+    return (updated_at, pk) if updated_at is not None else None
+
+
+def serialize_event(friend_request):
+    return {
+        'id': event_id(friend_request),
+        'user_id': friend_request.to_user_id,
+        'data': SelfFriendRequestSerializer(friend_request).data,
+    }
+
+
+def format_event(event):
+    return f'id: {event["id"]}\nevent: friend_request\ndata: {json.dumps(event["data"])}\n\n'
+
+
+def incoming(user_ids):
+    return FriendRequest.objects.select_related('from_user__user').filter(to_user_id__in=user_ids)
+
+
+class Subscription:
+
+    def __init__(self, user_id, maxsize):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        """Runs on the subscriber's loop. A client that can't keep up is cut off and resumes on reconnect."""
+        if self.overflowed:
+            return
+        if self.queue.full():
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = OVERFLOW
+        self.queue.put_nowait(event)
+
+
+class EventHub:
+    """In-process fan-out of friend request events to the subscriptions of their recipient."""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, maxsize):
+        subscription = Subscription(user_id, maxsize)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def user_ids(self):
+        with self._lock:
+            return set(self._subscriptions)
+
+    def publish(self, event):
+        """Thread-safe, callable from any thread or loop."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(event['user_id'], ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # the subscriber's loop is closed
+                self.unsubscribe(subscription)
+
+
+hub = EventHub()
+
+
+class BaseEventBackend:
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def notify(self, ids):
+        """Called after a commit that created or changed the friend requests `ids`."""
+
+    def subscribed(self):
+        """Called on the event loop when a client connects."""
+
+
+class LocalEventBackend(BaseEventBackend):
+
+    def notify(self, ids):
+        user_ids = self.hub.user_ids()
+        if not user_ids:
+            return
+        for friend_request in incoming(user_ids).filter(id__in=ids):
+            self.hub.publish(serialize_event(friend_request))
+
+
+class DatabasePollingBackend(BaseEventBackend):
+
+    def __init__(self, hub):
+        super().__init__(hub)
+        self._task = None
+        self._wake = None
+        self._recent = OrderedDict()
+
+    def subscribed(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    def notify(self, ids):
+        task, wake = self._task, self._wake
+        if task is not None and not task.done():
+            try:
+                task.get_loop().call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                pass
+
+    async def run(self):
+        config = settings.FRIEND_REQUEST_EVENTS
+        overlap = timedelta(seconds=config['POLL_OVERLAP'])
+        self.cursor = timezone.now() - overlap
+        while self.hub.user_ids():
+            try:
+                await asyncio.wait_for(self._wake.wait(), config['POLL_INTERVAL'])
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.poll(overlap)
+
+    async def poll(self, overlap):
+        # Rows are re-read for `overlap` behind the newest one seen, so a
+        # transaction that committed late with an older updated_at isn't lost.
+        user_ids = self.hub.user_ids()
+        if not user_ids:
+            return
+        changed = incoming(user_ids).filter(updated_at__gte=self.cursor - overlap).order_by('updated_at', 'id')
+        async for friend_request in changed:
+            key = event_id(friend_request)
+            if key in self._recent:
+                continue
+            self._recent[key] = friend_request.updated_at
+            self.cursor = max(self.cursor, friend_request.updated_at)
+            self.hub.publish(serialize_event(friend_request))
+        while self._recent and next(iter(self._recent.values())) < self.cursor - overlap:
+            self._recent.popitem(last=False)
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_event_backend():
+    path = settings.FRIEND_REQUEST_EVENTS['BACKEND']
+    backend = _backends.get(path)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(path)
+            if backend is None:
+                backend = _backends[path] = import_string(path)(hub)
+    return backend
+
+
+async def replay(user_id, cursor, batch_size):
+    """Events for `user_id` after the (updated_at, pk) cursor, oldest first."""
+    while True:
+        updated_at, pk = cursor
+        changed = incoming([user_id]).filter(
+            Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk)
+        ).order_by('updated_at', 'id')[:batch_size]
+        rows = [friend_request async for friend_request in changed]
+        for friend_request in rows:
+            yield serialize_event(friend_request)
+        if len(rows) < batch_size:
+            return
+        cursor = (rows[-1].updated_at, rows[-1].pk)
+
+
+async def event_stream(user_id, last_event_id=None):
+    config = settings.FRIEND_REQUEST_EVENTS
+    # subscribe before replaying so nothing committed in between is missed,
+    # events seen in both are sent once
+    subscription = hub.subscribe(user_id, config['QUEUE_SIZE'])
+    get_event_backend().subscribed()
+    sent = OrderedDict()
+
+    def first_time(event):
+        if event['id'] in sent:
+            return False
+        sent[event['id']] = None
+        if len(sent) > config['QUEUE_SIZE'] * 10:
+            sent.popitem(last=False)
+        return True
+
+    try:
+        yield f'retry: {config["RETRY_MS"]}\n\n'
+        cursor = parse_event_id(last_event_id)
+        if cursor is not None:
+            async for event in replay(user_id, cursor, config['REPLAY_BATCH']):
+                if first_time(event):
+                    yield format_event(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), config['HEARTBEAT'])
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event is OVERFLOW:
+                return
+            if first_time(event):
+                yield format_event(event)
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,52 @@
+"""
+NDJSON export of the social graph, one JSON object per line with a `type`
+of friend_request or friendship. Archived friend requests (user.archive)
+are exported as friend_request too. Rows are read with
+QuerySet.iterator(chunk_size), a server-side cursor on Postgres, and
+encoded one line at a time, so memory stays constant whatever the number
+of rows. Used by the export endpoint (one user) and by the
+export_social_graph command (one user or the whole database).
+"""
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+from user.models import ArchivedFriendRequest, FriendRequest, Friendship
+
+FRIEND_REQUEST_FIELDS = ('id', 'from_user_id', 'to_user_id', 'status', 'created_at', 'updated_at')
+FRIENDSHIP_FIELDS = ('id', 'user_id', 'friend_id', 'created_at')
+
+# (type, model, exported columns), in export order. The archive comes last:
+# a request archived during an export is then exported twice, never missed.
+TABLES = [
+    ('friend_request', FriendRequest, FRIEND_REQUEST_FIELDS),
+    ('friendship', Friendship, FRIENDSHIP_FIELDS),
+    ('friend_request', ArchivedFriendRequest, FRIEND_REQUEST_FIELDS),
+]
+
+
+def encode(record_type, fields, row):
+    record = {'type': record_type}
+    for field, value in zip(fields, row):
+        record[field] = value.isoformat() if isinstance(value, datetime) else value
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def export_rows(record_type, queryset, fields, chunk_size):
+    """(id, line) for every row of `queryset`, `fields` starting with the id."""
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        yield row[0], encode(record_type, fields, row)
+
+
+def user_export(user_id, chunk_size):
+    """NDJSON lines of the requests `user_id` sent or received, archived ones included, and of their friendships."""
+    # one query per side, each on its own index, instead of an OR
+    for model in (FriendRequest, ArchivedFriendRequest):
+        for condition in (Q(from_user_id=user_id), Q(to_user_id=user_id)):
+            queryset = model.objects.filter(condition).order_by('pk')
+            for _, line in export_rows('friend_request', queryset, FRIEND_REQUEST_FIELDS, chunk_size):
+                yield line
+    queryset = Friendship.objects.filter(user_id=user_id).order_by('pk')
+    for _, line in export_rows('friendship', queryset, FRIENDSHIP_FIELDS, chunk_size):
+        yield line
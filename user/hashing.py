@@ -0,0 +1,111 @@
+"""
+Password hashing off the request thread. PBKDF2 keeps a core busy for the
+whole hash, so logins and signups run it on a bounded pool; when the pool
+is saturated callers get PasswordHashingBusy instead of queueing forever,
+which the views turn into a 503 with Retry-After.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+
+
+class PasswordHashingBusy(Exception):
+    pass
+
+
+def _setup_worker():
+    import django
+    django.setup()
+
+
+def _check_password(raw_password, encoded):
+    return check_password(raw_password, encoded)
+
+
+def _make_password(raw_password):
+    return make_password(raw_password)
+
+
+class PasswordHashExecutor:
+    def __init__(self, mode='process', workers=None, max_pending=64, queue_timeout=0.5):
+        self.mode = mode
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        if mode == 'process':
+            self._pool = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn'), initializer=_setup_worker
+            )
+        elif mode == 'thread':
+            # hashlib.pbkdf2_hmac releases the GIL, so threads scale too
+            self._pool = ThreadPoolExecutor(workers, thread_name_prefix='password-hash')
+        else:
+            self._pool = None
+
+    def run(self, func, *args):
+        if self._pool is None:
+            return func(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise PasswordHashingBusy
+        try:
+            return self._pool.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def map(self, func, iterable, chunksize=64):
+        """Bulk variant for batch jobs, not bounded by MAX_PENDING."""
+        if self._pool is None:
+            return list(map(func, iterable))
+        if self.mode == 'process':
+            return list(self._pool.map(func, iterable, chunksize=chunksize))
+        return list(self._pool.map(func, iterable))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_hash_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = settings.PASSWORD_HASHING
+                _executor = PasswordHashExecutor(
+                    mode=config['MODE'],
+                    workers=config['WORKERS'],
+                    max_pending=config['MAX_PENDING'],
+                    queue_timeout=config['QUEUE_TIMEOUT'],
+                )
+    return _executor
+
+
+def hash_password(raw_password):
+    if raw_password is None:
+        return make_password(None)
+    return get_hash_executor().run(_make_password, raw_password)
+
+
+def hash_passwords(raw_passwords, executor=None):
+    """Hash many passwords across the executor's workers, None gives an unusable password."""
+    executor = executor or get_hash_executor()
+    hashed = executor.map(_make_password, [raw for raw in raw_passwords if raw is not None])
+    hashed = iter(hashed)
+    return [make_password(None) if raw is None else next(hashed) for raw in raw_passwords]
+
+
+def check_user_password(user, raw_password):
+    """user.check_password() with the hash on the executor, upgrades outdated hashes."""
+    if raw_password is None or not user.has_usable_password():
+        return False
+    valid = get_hash_executor().run(_check_password, raw_password, user.password)
+    if valid and identify_hasher(user.password).must_update(user.password):
+        user.password = hash_password(raw_password)
+        user.save(update_fields=['password'])
+    return valid
@@ -1,9 +1,12 @@
 from functools import wraps
 
+from django.conf import settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.response import Response
 from rest_framework import status
 
+from base.ratelimit import SlidingWindowRateLimiter
+
 def generate_user_token(user):
     refresh = RefreshToken.for_user(user)
     return {
@@ -12,6 +15,13 @@ def generate_user_token(user):
     }
 
 
+def hashing_busy_response():
+    return Response({
+        'message': 'Server is busy, please retry shortly',
+        'error': 'server_busy'
+    }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(settings.PASSWORD_HASHING['RETRY_AFTER'])})
+
+
 def check_missing_fields(*required_fields):
     def decorator(func):
         @wraps(func)
@@ -28,4 +38,30 @@ def check_missing_fields(*required_fields):
                 }, status=status.HTTP_400_BAD_REQUEST)
             return func(self, request, *args, **kwargs)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+
+def rate_limit(rate_setting, message):
+    """
+    Limits a view method per authenticated user to the rate in
+    settings.<rate_setting>. Responses with an error status don't count.
+    `message` may use {limit} and {period}.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            limiter = SlidingWindowRateLimiter(
+                getattr(settings, rate_setting), prefix=rate_setting, cache_alias=settings.RATE_LIMIT_CACHE
+            )
+            counter = limiter.hit(request.user.pk)
+            if counter is None:
+                return Response({
+                    'message': message.format(limit=limiter.limit, period=limiter.period),
+                    'error': 'limit_exceed'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            response = func(self, request, *args, **kwargs)
+            if response.status_code >= 400:
+                limiter.release(counter)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from user.archive import archive_batch, cutoffs
+from user.models import FriendRequest
+
+
+class Command(BaseCommand):
+    help = (
+        'Move friend requests answered more than FRIEND_REQUEST_ARCHIVE[\'AGE_DAYS\'] days ago to the '
+        'archive table, one transaction per batch with a pause in between. Run periodically, e.g. nightly.'
+    )
+
+    def add_arguments(self, parser):
+        archive = settings.FRIEND_REQUEST_ARCHIVE
+        parser.add_argument('--batch-size', type=int, default=archive['BATCH_SIZE'])
+        parser.add_argument('--sleep', type=float, default=archive['SLEEP'], help='Seconds to pause between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Count the requests to archive without moving them')
+
+    def handle(self, *args, **options):
+        for status, cutoff in cutoffs().items():
+            if options['dry_run']:
+                count = FriendRequest.objects.filter(status=status, updated_at__lt=cutoff).count()
+                self.stdout.write(f'{status}: {count} requests answered before {cutoff:%Y-%m-%d} to archive')
+                continue
+            start, archived = time.perf_counter(), 0
+            while True:
+                moved = archive_batch(status, cutoff, options['batch_size'])
+                archived += moved
+                if moved < options['batch_size']:
+                    break
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{status}: archived {archived} requests answered before {cutoff:%Y-%m-%d} '
+                f'in {time.perf_counter() - start:.1f}s'
+            ))
@@ -0,0 +1,79 @@
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base.benchmark import rolled_back, summarize, timed
+from user.archive import archive_batch
+from user.models import FriendRequest
+from user.synthetic import create_users, power_law_requests
+
+
+class Command(BaseCommand):
+    help = (
+        'Pending inbox and duplicate check latency against friend request table size, before and after '
+        'archiving the answered requests. All rows are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000', help='Comma separated friend request counts')
+        parser.add_argument('--requests-per-user', type=int, default=20)
+        parser.add_argument('--answered', type=float, default=0.9, help='Share of answered, archivable requests')
+        parser.add_argument('--queries', type=int, default=500, help='Queries per measurement')
+        parser.add_argument('--page-size', type=int, default=25)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"rows":>10} {"query":<16} {"when":<8} {"p50_ms":>10} {"p99_ms":>10} {"mean_ms":>10}')
+        for size in sorted(int(size) for size in options['sizes'].split(',')):
+            with rolled_back():
+                self.measure_size(size, options)
+
+    def measure_size(self, size, options):
+        rng = random.Random(options['seed'])
+        user_ids = create_users(max(size // options['requests_per_user'], 2), seed=options['seed'],
+                                prefix=f'archive{size}-')
+        pairs = list(itertools.islice(
+            power_law_requests(user_ids, options['requests_per_user'], seed=options['seed']), size
+        ))
+        requests = []
+        for from_user_id, to_user_id in pairs:
+            draw = rng.random()
+            status = 'pending' if draw >= options['answered'] else 'accepted' if draw < options['answered'] / 2 else 'rejected'
+            requests.append(FriendRequest(from_user_id=from_user_id, to_user_id=to_user_id, status=status))
+        last_pk = FriendRequest.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        FriendRequest.objects.bulk_create(requests, batch_size=options['batch_size'], ignore_conflicts=True)
+        old = timezone.now() - timedelta(days=365)
+        FriendRequest.objects.filter(pk__gt=last_pk).exclude(status='pending').update(updated_at=old)
+
+        self.report(size, 'before', options, rng, pairs, user_ids)
+        start, archived = time.perf_counter(), 0
+        for status in ('accepted', 'rejected'):
+            while moved := archive_batch(status, old + timedelta(seconds=1), options['batch_size']):
+                archived += moved
+        self.stdout.write(f'{size:>10} archived {archived} rows in {time.perf_counter() - start:.1f}s')
+        self.report(size, 'after', options, rng, pairs, user_ids)
+
+    def report(self, size, when, options, rng, pairs, user_ids):
+        cases = {
+            'pending inbox': lambda: self.inbox(rng.choice(user_ids), options['page_size']),
+            'duplicate check': lambda: self.duplicate_check(*rng.choice(pairs)),
+        }
+        for name, query in cases.items():
+            summary = summarize([timed(query)[0] for _ in range(options['queries'])])
+            self.stdout.write(
+                f'{size:>10} {name:<16} {when:<8} {summary["p50_ms"]:>10} {summary["p99_ms"]:>10} {summary["mean_ms"]:>10}'
+            )
+
+    def inbox(self, user_id, page_size):
+        # the COUNT and first page FriendRequestView runs
+        queryset = FriendRequest.objects.filter(to_user_id=user_id, status='pending').order_by('-created_at', '-pk')
+        return queryset.count(), list(queryset[:page_size])
+
+    def duplicate_check(self, from_user_id, to_user_id):
+        # what a send that found the pair taken runs, live and archived rows
+        return FriendRequest.objects.statuses(from_user_id, [to_user_id])
@@ -0,0 +1,68 @@
+import gc
+import random
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from user.autocomplete import PrefixIndex
+from user.synthetic import random_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Build time, memory per million users, lookups/sec and updates/sec of the autocomplete prefix '
+        'index over synthetic users. Runs in memory, nothing is written to the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000)
+        parser.add_argument('--lookups', type=int, default=200000)
+        parser.add_argument('--updates', type=int, default=2000)
+        parser.add_argument('--limit', type=int, default=settings.AUTOCOMPLETE['TOP_K'])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        users, rng = options['users'], random.Random(options['seed'])
+        top_k, budget = settings.AUTOCOMPLETE['TOP_K'], 1 << 62
+
+        start = time.perf_counter()
+        index = PrefixIndex(top_k, budget).build(self.rows(users, options['seed']))
+        self.stdout.write(f'build: {users} users, {index.entries} entries in {time.perf_counter() - start:.1f}s')
+        del index
+        gc.collect()
+        # rows are generated while traced, so the strings the index keeps are counted
+        tracemalloc.start()
+        index = PrefixIndex(top_k, budget).build(self.rows(users, options['seed']))
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        self.stdout.write(f'memory: {used / 2 ** 20:.1f} MiB, {used / users * 1e6 / 2 ** 20:.1f} MiB per million users '
+                          f'(budget estimate {index.memory / 2 ** 20:.1f} MiB)')
+
+        prefixes = []
+        for _ in range(options['lookups']):
+            user_id = rng.randrange(1, users + 1)
+            text = index.name(user_id) if rng.random() < 0.8 else self.email(user_id)
+            prefixes.append(text[:rng.randint(1, 6)])
+        start = time.perf_counter()
+        for prefix in prefixes:
+            index.lookup(prefix, options['limit'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'lookup: {len(prefixes) / elapsed:.0f}/s, {elapsed / len(prefixes) * 1e6:.1f} us each')
+
+        start = time.perf_counter()
+        for user_id in range(users + 1, users + options['updates'] + 1):
+            index.add(user_id, random_name(rng), self.email(user_id))
+        for user_id in range(users + 1, users + options['updates'] + 1):
+            index.remove(user_id)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'update: {2 * options["updates"] / elapsed:.0f}/s (add and remove)')
+
+    def rows(self, users, seed):
+        rng = random.Random(seed)
+        for user_id in range(1, users + 1):
+            yield user_id, random_name(rng), self.email(user_id)
+
+    def email(self, user_id):
+        return f'user{user_id}@example.com'
@@ -0,0 +1,73 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+from base.benchmark import summarize
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare throughput and tail latency of running servers, e.g. the WSGI '
+        'deployment against the ASGI one, under concurrent clients.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help='name=url, e.g. wsgi=http://localhost:8000/api/user/search/?q=a '
+                                 'asgi=http://localhost:8001/api/user/async/search/?q=a')
+        parser.add_argument('--token', help='Access token sent as "Authorization: Token <token>"')
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--duration', type=float, default=20, help='Seconds per target')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        headers = {'Authorization': f'Token {options["token"]}'} if options['token'] else {}
+        results = {}
+        for target in options['target']:
+            name, url = target.split('=', 1)
+            results[name] = self.run(url, headers, options['concurrency'], options['duration'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f'{"target":<10} {"req/s":>10} {"errors":>8} {"p50_ms":>10} {"p99_ms":>10}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<10} {result["throughput"]:>10} {result["errors"]:>8} '
+                f'{result["latency"]["p50_ms"]:>10} {result["latency"]["p99_ms"]:>10}'
+            )
+
+    def run(self, url, headers, concurrency, duration):
+        samples, errors = [], [0]
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def client():
+            session = requests.Session()
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    ok = session.get(url, headers=headers, timeout=30).status_code < 500
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    samples.append(elapsed)
+                    errors[0] += not ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(client)
+        elapsed = time.perf_counter() - started
+        return {
+            'url': url,
+            'concurrency': concurrency,
+            'throughput': round(len(samples) / elapsed, 1),
+            'errors': errors[0],
+            'latency': summarize(samples),
+        }
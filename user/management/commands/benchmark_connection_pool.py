@@ -0,0 +1,104 @@
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from base.benchmark import summarize
+from base.pool import ConnectionPool
+
+
+def ping(conn):
+    cursor = conn.cursor()
+    cursor.execute('SELECT 1')
+    cursor.fetchone()
+    cursor.close()
+    return True
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per-request connection setup with a new connection per request against '
+        'base.pool.ConnectionPool. Uses the configured Postgres database, or with --stand-in '
+        '(default on other databases) in-memory SQLite connections that sleep --connect-ms '
+        'on connect to stand in for the TCP and auth handshake.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--pool-size', type=int, help='Default: --concurrency')
+        parser.add_argument('--stand-in', action='store_true')
+        parser.add_argument('--connect-ms', type=float, default=5.0, help='Handshake cost of a stand-in connection')
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['stand_in'] or connection.vendor != 'postgresql':
+            connect_ms = options['connect_ms']
+            target = f'stand-in ({connect_ms}ms connect)'
+
+            def connect():
+                time.sleep(connect_ms / 1000)
+                return sqlite3.connect(':memory:', check_same_thread=False)
+        else:
+            params = connection.get_connection_params()
+            target = f'postgresql {params.get("host") or "local socket"}'
+
+            def connect():
+                return connection.Database.connect(**params)
+
+        pool = ConnectionPool(connect, max_size=options['pool_size'] or options['concurrency'],
+                              check=ping, check_after=30)
+
+        def direct():
+            conn = connect()
+            try:
+                ping(conn)
+            finally:
+                conn.close()
+
+        def pooled():
+            conn = pool.acquire()
+            try:
+                ping(conn)
+            finally:
+                pool.release(conn)
+
+        results = {
+            'target': target,
+            'concurrency': options['concurrency'],
+            'direct': self.run(direct, options),
+            'pooled': self.run(pooled, options),
+        }
+        results['pool'] = pool.stats()
+        pool.close_all()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f'target: {target}, concurrency {options["concurrency"]}')
+        self.stdout.write(f'{"mode":<8} {"req/s":>10} {"p50_ms":>10} {"p95_ms":>10} {"p99_ms":>10}')
+        for mode in ('direct', 'pooled'):
+            result = results[mode]
+            latency = result['latency']
+            self.stdout.write(f'{mode:<8} {result["throughput"]:>10} {latency["p50_ms"]:>10} '
+                              f'{latency["p95_ms"]:>10} {latency["p99_ms"]:>10}')
+        self.stdout.write(f'pool: {results["pool"]["created"]} connections opened for '
+                          f'{results["pool"]["acquired"]} requests, p99 wait {results["pool"]["wait_ms"]["p99"]}ms')
+
+    def run(self, request, options):
+        def timed_request(_):
+            start = time.perf_counter()
+            request()
+            return time.perf_counter() - start
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            samples = list(executor.map(timed_request, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+        return {
+            'throughput': round(len(samples) / elapsed, 1),
+            'latency': summarize(samples),
+        }
@@ -0,0 +1,151 @@
+import json
+import random
+import subprocess
+import time
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from base.benchmark import rolled_back, summarize
+from user.helper import generate_user_token
+from user.models import User, UserData
+from user.synthetic import FIRST_NAMES, LAST_NAMES
+
+DEFAULT_MIX = 'search=5,inbox=3,friends=1,suggestions=1,send=1'
+
+
+def search(rng, user_ids):
+    name = rng.choice(FIRST_NAMES + LAST_NAMES)
+    return 'get', reverse('user-search'), {'q': name[:rng.randint(2, len(name))]}
+
+
+def inbox(rng, user_ids):
+    return 'get', reverse('friend-request-list'), {'status': 'pending'}
+
+
+def friends(rng, user_ids):
+    return 'get', reverse('friend-list'), {}
+
+
+def suggestions(rng, user_ids):
+    return 'get', reverse('friend-suggestion-list'), {}
+
+
+def send(rng, user_ids):
+    return 'post', reverse('friend-request-list'), {'to_user_id': rng.choice(user_ids)}
+
+
+ENDPOINTS = {
+    'search': search,
+    'inbox': inbox,
+    'friends': friends,
+    'suggestions': suggestions,
+    'send': send,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a weighted endpoint mix as random existing users, through the Django '
+        'test client (default, writes rolled back) or a running server, and report '
+        'throughput, latency percentiles and queries per request as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help=f'endpoint=weight pairs from {", ".join(ENDPOINTS)} (default {DEFAULT_MIX})')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=1000, help='Distinct users to act as')
+        parser.add_argument('--base-url', help='Send over HTTP to a running server instead of the test client')
+        parser.add_argument('--output', help='Write the JSON report to this file as well')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        mix = {}
+        for item in options['mix'].split(','):
+            name, weight = item.split('=')
+            if name not in ENDPOINTS:
+                raise CommandError(f'Unknown endpoint {name}')
+            mix[name] = float(weight)
+
+        rng = random.Random(options['seed'])
+        user_ids = list(UserData.objects.order_by('?').values_list('user_id', flat=True)[:options['users']])
+        if not user_ids:
+            raise CommandError('No users, run generate_social_data first')
+        tokens = {
+            user.pk: generate_user_token(user)['access']
+            for user in User.objects.filter(pk__in=user_ids)
+        }
+
+        if options['base_url']:
+            results, elapsed = self.replay(mix, rng, user_ids, tokens, options)
+        else:
+            with rolled_back():
+                results, elapsed = self.replay(mix, rng, user_ids, tokens, options)
+
+        report = {
+            'commit': self.current_commit(),
+            'target': options['base_url'] or 'test-client',
+            'database': connection.vendor,
+            'pagination': settings.LIST_PAGINATION_MODE,
+            'requests': options['requests'],
+            'throughput': round(options['requests'] / elapsed, 1),
+            'endpoints': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        self.stdout.write(output)
+
+    def replay(self, mix, rng, user_ids, tokens, options):
+        names, weights = list(mix), list(mix.values())
+        samples = {name: [] for name in names}
+        queries = {name: [] for name in names}
+        statuses = {name: {} for name in names}
+        client = requests.Session() if options['base_url'] else Client()
+
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            name = rng.choices(names, weights)[0]
+            user_id = rng.choice(user_ids)
+            method, path, params = ENDPOINTS[name](rng, user_ids)
+            headers = {'Authorization': f'Token {tokens[user_id]}'}
+
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                if options['base_url']:
+                    url = options['base_url'].rstrip('/') + path
+                    kwargs = {'params': params} if method == 'get' else {'data': params}
+                    code = getattr(client, method)(url, headers=headers, timeout=30, **kwargs).status_code
+                else:
+                    code = getattr(client, method)(path, params, HTTP_AUTHORIZATION=headers['Authorization']).status_code
+                samples[name].append(time.perf_counter() - start)
+            queries[name].append(len(captured))
+            statuses[name][code] = statuses[name].get(code, 0) + 1
+        elapsed = time.perf_counter() - started
+
+        results = {}
+        for name in names:
+            if not samples[name]:
+                continue
+            results[name] = {
+                'latency': summarize(samples[name]),
+                'status_codes': {str(code): count for code, count in sorted(statuses[name].items())},
+                # only measurable in-process
+                'queries_per_request': None if options['base_url'] else round(sum(queries[name]) / len(queries[name]), 2),
+            }
+        return results, elapsed
+
+    def current_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+from base.benchmark import summarize
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure search latency on a running server alone, then while concurrent '
+        'logins hammer the password hashing executor.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000')
+        parser.add_argument('--email', required=True, help='Existing account used for logins and search')
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--search-concurrency', type=int, default=8)
+        parser.add_argument('--login-concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=15, help='Seconds per phase')
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        credentials = {'email': options['email'], 'password': options['password']}
+        login = requests.post(f'{base_url}/api/user/login/', data=credentials, timeout=30)
+        login.raise_for_status()
+        headers = {'Authorization': f'Token {login.json()["access"]}'}
+
+        def search(session):
+            return session.get(f'{base_url}/api/user/search/', params={'q': 'a'}, headers=headers, timeout=30)
+
+        def log_in(session):
+            return session.post(f'{base_url}/api/user/login/', data=credentials, timeout=30)
+
+        duration = options['duration']
+        baseline = self.run({'search': (search, options['search_concurrency'])}, duration)
+        storm = self.run({
+            'search': (search, options['search_concurrency']),
+            'login': (log_in, options['login_concurrency']),
+        }, duration)
+        results = {'baseline': baseline, 'storm': storm}
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f'{"phase":<10} {"endpoint":<8} {"req/s":>8} {"503s":>6} {"p50_ms":>10} {"p99_ms":>10}')
+        for phase, endpoints in results.items():
+            for name, result in endpoints.items():
+                self.stdout.write(
+                    f'{phase:<10} {name:<8} {result["throughput"]:>8} {result["busy"]:>6} '
+                    f'{result["latency"]["p50_ms"]:>10} {result["latency"]["p99_ms"]:>10}'
+                )
+
+    def run(self, workloads, duration):
+        samples = {name: [] for name in workloads}
+        busy = {name: 0 for name in workloads}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def client(name, request):
+            session = requests.Session()
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    rejected = request(session).status_code == 503
+                except requests.RequestException:
+                    rejected = True
+                elapsed = time.perf_counter() - start
+                with lock:
+                    samples[name].append(elapsed)
+                    busy[name] += rejected
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(sum(concurrency for _, concurrency in workloads.values())) as pool:
+            for name, (request, concurrency) in workloads.items():
+                for _ in range(concurrency):
+                    pool.submit(client, name, request)
+        elapsed = time.perf_counter() - started
+        return {
+            name: {
+                'throughput': round(len(samples[name]) / elapsed, 1),
+                'busy': busy[name],
+                'latency': summarize(samples[name]),
+            }
+            for name in workloads
+        }
@@ -0,0 +1,56 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from base.benchmark import rolled_back, summarize, timed
+from user.models import UserData
+from user.search import get_search_backend
+from user.synthetic import FIRST_NAMES, LAST_NAMES, create_users
+
+
+class Command(BaseCommand):
+    help = 'Measure user search p50/p99 latency against table size. All rows are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Comma separated table sizes to measure')
+        parser.add_argument('--queries', type=int, default=200, help='Queries per table size')
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        rng = random.Random(options['seed'])
+        backend = get_search_backend()
+        self.stdout.write(f'backend: {type(backend).__name__}')
+        self.stdout.write(f'{"rows":>10} {"p50_ms":>10} {"p99_ms":>10} {"mean_ms":>10}')
+
+        with rolled_back():
+            created = 0
+            for size in sizes:
+                existing = UserData.objects.count()
+                if size > existing:
+                    create_users(size - existing, start=created, seed=options['seed'])
+                    created += size - existing
+
+                samples = []
+                for _ in range(options['queries']):
+                    query = self.random_query(rng, created)
+                    duration, _ = timed(lambda: list(backend.search(query)[:options['page_size']]))
+                    samples.append(duration)
+
+                summary = summarize(samples)
+                self.stdout.write(
+                    f'{size:>10} {summary["p50_ms"]:>10} {summary["p99_ms"]:>10} {summary["mean_ms"]:>10}'
+                )
+
+    def random_query(self, rng, created):
+        kind = rng.random()
+        if kind < 0.3:
+            return f'user{rng.randrange(max(created, 1))}@example.com'
+        name = rng.choice(FIRST_NAMES + LAST_NAMES)
+        if kind < 0.7:
+            return name[:rng.randint(2, len(name))]
+        # one-character typo to exercise the similarity path
+        position = rng.randrange(len(name))
+        return name[:position] + 'x' + name[position + 1:]
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from base.benchmark import rolled_back
+from base.renderers import FastJSONRenderer, orjson
+from base.serialization import values_plan
+from user.models import FriendRequest, UserData
+from user.serializers import SelfFriendRequestSerializer, UserSearchSerializer
+from user.synthetic import create_users
+
+
+class Command(BaseCommand):
+    help = ('Rows/sec of the list serializers against their values() fast path, and of JSONRenderer against '
+            'FastJSONRenderer. All rows are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Rows serialized per pass')
+        parser.add_argument('--repeat', type=int, default=5, help='Passes per measurement, the best one is reported')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        self.stdout.write(f'orjson: {"yes" if orjson is not None else "no"}')
+        self.stdout.write(f'{"serializer":<30} {"path":<12} {"rows/s":>12} {"speedup":>8}')
+
+        with rolled_back():
+            user_ids = create_users(rows + 1, prefix='serialization')
+            FriendRequest.objects.bulk_create([
+                FriendRequest(from_user_id=user_id, to_user_id=user_ids[0]) for user_id in user_ids[1:]
+            ])
+            cases = [
+                (UserSearchSerializer, UserData.objects.select_related('user').filter(user_id__in=user_ids[1:])),
+                (SelfFriendRequestSerializer,
+                 FriendRequest.objects.select_related('from_user__user').filter(to_user_id=user_ids[0])),
+            ]
+            for serializer_class, queryset in cases:
+                name = serializer_class.__name__
+                queryset = queryset.order_by('-created_at', '-pk')
+                plan = values_plan(serializer_class)
+                # query + serialization, then serialization alone over fetched rows
+                slow, expected = self.best(options['repeat'], lambda: serializer_class(queryset, many=True).data)
+                fast, data = self.best(options['repeat'], lambda: plan.serialize_many(plan.values(queryset)))
+                if JSONRenderer().render(data) != JSONRenderer().render(expected):
+                    raise CommandError(f'{name}: fast path output differs')
+                self.report(name, 'instances', rows / slow)
+                self.report(name, 'values', rows / fast, slow / fast)
+
+                instances, values = list(queryset), list(plan.values(queryset))
+                slow, _ = self.best(options['repeat'], lambda: serializer_class(instances, many=True).data)
+                fast, _ = self.best(options['repeat'], lambda: plan.serialize_many(values))
+                self.report(name, 'serializer', rows / slow)
+                self.report(name, 'plan', rows / fast, slow / fast)
+
+                slow, rendered = self.best(options['repeat'], lambda: JSONRenderer().render(data))
+                fast, fast_rendered = self.best(options['repeat'], lambda: FastJSONRenderer().render(data))
+                if fast_rendered != rendered:
+                    raise CommandError(f'{name}: FastJSONRenderer output differs')
+                self.report(name, 'render', rows / slow)
+                self.report(name, 'fast render', rows / fast, slow / fast)
+
+    def best(self, repeat, func):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def report(self, name, path, rate, speedup=None):
+        speedup = f'{speedup:.1f}x' if speedup is not None else ''
+        self.stdout.write(f'{name:<30} {path:<12} {rate:>12.0f} {speedup:>8}')
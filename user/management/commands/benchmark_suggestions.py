@@ -0,0 +1,48 @@
+import random
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from base.benchmark import summarize, timed
+from user.suggestions import top_suggestions
+from user.synthetic import power_law_edges
+
+
+class Command(BaseCommand):
+    help = 'Benchmark suggestion computation on an in-memory synthetic power-law friendship graph.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--edges-per-user', type=int, default=5)
+        parser.add_argument('--top-k', type=int, default=50)
+        parser.add_argument('--samples', type=int, default=2000, help='Users timed individually for p50/p99')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        adjacency = defaultdict(set)
+        for user_id, friend_id in power_law_edges(options['users'], options['edges_per_user'], options['seed']):
+            adjacency[user_id].add(friend_id)
+            adjacency[friend_id].add(user_id)
+        degrees = sorted(len(friends) for friends in adjacency.values())
+        self.stdout.write(
+            f'users={len(adjacency)} edges={sum(degrees) // 2} '
+            f'median_degree={degrees[len(degrees) // 2]} max_degree={degrees[-1]}'
+        )
+
+        start = time.perf_counter()
+        for user_id in adjacency:
+            top_suggestions(adjacency, user_id, options['top_k'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'batch: {len(adjacency) / elapsed:.0f} users/s, {elapsed:.2f}s total')
+
+        rng = random.Random(options['seed'])
+        hubs = sorted(adjacency, key=lambda user_id: len(adjacency[user_id]), reverse=True)[:10]
+        sample = rng.sample(list(adjacency), min(options['samples'], len(adjacency)))
+        per_user = [timed(top_suggestions, adjacency, user_id, options['top_k'])[0] for user_id in sample]
+        hub_times = [timed(top_suggestions, adjacency, user_id, options['top_k'])[0] for user_id in hubs]
+        summary = summarize(per_user)
+        self.stdout.write(
+            f'per user: p50={summary["p50_ms"]}ms p99={summary["p99_ms"]}ms, '
+            f'top-10 hubs max={max(hub_times) * 1000:.3f}ms'
+        )
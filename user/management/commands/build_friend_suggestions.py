@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from user.suggestions import load_adjacency, rebuild_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Precompute every user\'s top-K friends-of-friends suggestions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=settings.FRIEND_SUGGESTIONS_TOP_K)
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users written per transaction')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        adjacency = load_adjacency()
+        loaded = time.perf_counter()
+        self.stdout.write(f'loaded {sum(map(len, adjacency.values()))} edges in {loaded - start:.1f}s')
+
+        users = rebuild_suggestions(adjacency, top_k=options['top_k'], batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - loaded
+        self.stdout.write(self.style.SUCCESS(
+            f'rebuilt suggestions for {users} users in {elapsed:.1f}s ({users / max(elapsed, 1e-9):.0f} users/s)'
+        ))
@@ -0,0 +1,81 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from user.export import TABLES, export_rows, user_export
+from user.models import UserData
+
+
+class Command(BaseCommand):
+    help = (
+        'Export friend requests and friendships as NDJSON, for one user (--user) or the whole '
+        'database. Rows are streamed with a server-side cursor, so memory stays flat. A whole '
+        'database export is checkpointed every chunk; rerun the same command to resume it. '
+        'Each row is exported as it was when read.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='NDJSON file to write')
+        parser.add_argument('--user', type=int, help='Only the requests and friendships of this user id')
+        parser.add_argument('--chunk-size', type=int, default=settings.EXPORT_CHUNK_SIZE)
+        parser.add_argument('--checkpoint', help='Default: <output>.checkpoint')
+
+    def handle(self, *args, **options):
+        if options['user'] is not None:
+            if not UserData.objects.filter(user_id=options['user']).exists():
+                raise CommandError(f'no user with id {options["user"]}')
+            with open(options['output'], 'w') as output:
+                output.writelines(user_export(options['user'], options['chunk_size']))
+            self.stdout.write(self.style.SUCCESS(f'exported user {options["user"]} to {options["output"]}'))
+            return
+
+        checkpoint_path = options['checkpoint'] or f'{options["output"]}.checkpoint'
+        checkpoint = self.load_checkpoint(checkpoint_path)
+        if checkpoint['table'] >= len(TABLES):
+            self.stdout.write(f'already complete, delete {checkpoint_path} to export again')
+            return
+
+        start = time.perf_counter()
+        rows_at_start = checkpoint['rows']
+        with open(options['output'], 'r+b' if checkpoint['offset'] else 'wb') as output:
+            # lines written after the last checkpoint are written again
+            output.truncate(checkpoint['offset'])
+            output.seek(checkpoint['offset'])
+            for index in range(checkpoint['table'], len(TABLES)):
+                record_type, model, fields = TABLES[index]
+                queryset = model.objects.filter(pk__gt=checkpoint['last_id']).order_by('pk')
+                pending = 0
+                for pk, line in export_rows(record_type, queryset, fields, options['chunk_size']):
+                    output.write(line.encode())
+                    checkpoint['last_id'] = pk
+                    checkpoint['rows'] += 1
+                    pending += 1
+                    if pending == options['chunk_size']:
+                        self.save_checkpoint(checkpoint_path, output, checkpoint)
+                        pending = 0
+                        rate = (checkpoint['rows'] - rows_at_start) / (time.perf_counter() - start)
+                        self.stdout.write(f'{record_type}: id {pk}, {checkpoint["rows"]} rows ({rate:.0f} rows/s)')
+                checkpoint.update(table=index + 1, last_id=0)
+                self.save_checkpoint(checkpoint_path, output, checkpoint)
+        self.stdout.write(self.style.SUCCESS(f'done: {checkpoint["rows"]} rows in {options["output"]}'))
+
+    def load_checkpoint(self, path):
+        if os.path.exists(path):
+            with open(path) as checkpoint:
+                data = json.load(checkpoint)
+            self.stdout.write(f'resuming at byte {data["offset"]} after {data["rows"]} rows')
+            return data
+        return {'table': 0, 'last_id': 0, 'offset': 0, 'rows': 0}
+
+    def save_checkpoint(self, path, output, checkpoint):
+        # the data must be on disk before the checkpoint that points past it
+        output.flush()
+        os.fsync(output.fileno())
+        checkpoint['offset'] = output.tell()
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.replace(temporary, path)
@@ -0,0 +1,62 @@
+import itertools
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from base.response_cache import GLOBAL_SCOPE, bump
+from user.models import FriendRequest, Friendship
+from user.synthetic import create_users, power_law_requests
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk generate synthetic users, UserData rows and a power-law friend request '
+        'graph for load testing. Every account uses the same password.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--requests-per-user', type=int, default=10)
+        parser.add_argument('--accepted', type=float, default=0.5, help='Share of accepted requests')
+        parser.add_argument('--rejected', type=float, default=0.2, help='Share of rejected requests, the rest is pending')
+        parser.add_argument('--exponent', type=float, default=2.1, help='Power-law exponent of the in-degree')
+        parser.add_argument('--prefix', default='synthetic', help='Email prefix, <prefix><n>@example.com')
+        parser.add_argument('--password', default='password123')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        user_ids = create_users(options['users'], seed=options['seed'], password=options['password'],
+                                batch_size=options['batch_size'], prefix=options['prefix'])
+        self.stdout.write(f'created {len(user_ids)} users in {time.perf_counter() - start:.1f}s')
+
+        start = time.perf_counter()
+        rng = random.Random(options['seed'])
+        accepted, rejected = options['accepted'], options['accepted'] + options['rejected']
+        pairs = power_law_requests(user_ids, options['requests_per_user'], options['exponent'], options['seed'])
+        created = 0
+        while True:
+            batch = list(itertools.islice(pairs, options['batch_size']))
+            if not batch:
+                break
+            requests, friendships = [], []
+            for from_user_id, to_user_id in batch:
+                draw = rng.random()
+                status = 'accepted' if draw < accepted else 'rejected' if draw < rejected else 'pending'
+                requests.append(FriendRequest(from_user_id=from_user_id, to_user_id=to_user_id, status=status))
+                if status == 'accepted':
+                    friendships.append((from_user_id, to_user_id))
+            with transaction.atomic():
+                FriendRequest.objects.bulk_create(requests, ignore_conflicts=True)
+                Friendship.objects.link_many(friendships)
+            created += len(requests)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'\r{created} friend requests ({created / elapsed:.0f}/s)', ending='')
+            self.stdout.flush()
+        self.stdout.write('')
+        # bulk inserts send no signals, drop every cached response
+        bump(GLOBAL_SCOPE)
+        self.stdout.write(self.style.SUCCESS(f'created {created} friend requests in {time.perf_counter() - start:.1f}s'))
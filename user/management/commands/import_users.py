@@ -0,0 +1,177 @@
+import csv
+import io
+import json
+import os
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import EmailValidator
+from django.db import connection, transaction
+from django.utils import timezone
+
+from base.response_cache import bump
+from user.hashing import PasswordHashExecutor, hash_passwords
+from user.models import User, UserData
+from user.signals import SEARCH_SCOPE
+
+# keys of a record, CSV header or NDJSON object
+FIELDS = ('email', 'password', 'name')
+
+
+class Command(BaseCommand):
+    help = (
+        'Import users from a CSV (email,password,name header) or NDJSON file in chunks. '
+        'Emails are deduplicated against the database per chunk, passwords are hashed '
+        'across all cores, and progress is checkpointed so a rerun resumes after the '
+        'last committed chunk.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Default: from the file extension')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--checkpoint', help='Default: <path>.checkpoint')
+        parser.add_argument('--workers', type=int, help='Hashing processes, default: CPU count')
+        parser.add_argument('--hash-mode', choices=['process', 'thread', 'inline'], default='process')
+        parser.add_argument('--copy', action='store_true', help='Insert with COPY (Postgres only)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy needs Postgres')
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        checkpoint = self.load_checkpoint(checkpoint_path)
+        executor = PasswordHashExecutor(mode=options['hash_mode'], workers=options['workers'])
+        self.email_validator = EmailValidator()
+
+        stats = checkpoint['stats']
+        start = time.perf_counter()
+        rows_at_start = stats['read']
+        try:
+            with open(path, 'rb') as source:
+                header = source.readline() if file_format == 'csv' else None
+                if checkpoint['offset']:
+                    source.seek(checkpoint['offset'])
+                records = self.read_records(source, header, file_format)
+                while True:
+                    chunk = self.take(records, options['chunk_size'])
+                    if not chunk:
+                        break
+                    self.import_chunk(chunk, executor, options['copy'], stats)
+                    # bulk inserts send no post_save
+                    bump(SEARCH_SCOPE)
+                    stats['read'] += len(chunk)
+                    self.save_checkpoint(checkpoint_path, source.tell(), stats)
+                    rate = (stats['read'] - rows_at_start) / (time.perf_counter() - start)
+                    self.stdout.write(
+                        f'read={stats["read"]} imported={stats["imported"]} existing={stats["existing"]} '
+                        f'duplicate={stats["duplicate"]} invalid={stats["invalid"]} ({rate:.0f} rows/s)'
+                    )
+        finally:
+            executor.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'done: {json.dumps(stats)}'))
+
+    def read_records(self, source, header, file_format):
+        lines = (line.decode('utf-8') for line in iter(source.readline, b''))
+        if file_format == 'ndjson':
+            for line in lines:
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        record = None
+                    # counted as invalid like an unparsable line
+                    if not isinstance(record, dict) or not all(
+                        isinstance(record.get(field), (str, type(None))) for field in FIELDS
+                    ):
+                        record = {}
+                    yield record
+        else:
+            fields = next(csv.reader([header.decode('utf-8')]))
+            yield from csv.DictReader(lines, fieldnames=fields)
+
+    def take(self, records, size):
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) == size:
+                break
+        return chunk
+
+    def import_chunk(self, chunk, executor, use_copy, stats):
+        rows = {}
+        for record in chunk:
+            email = (record.get('email') or '').strip().lower()
+            try:
+                self.email_validator(email)
+            except ValidationError:
+                stats['invalid'] += 1
+                continue
+            if email in rows:
+                stats['duplicate'] += 1
+                continue
+            rows[email] = record
+
+        existing = set(User.objects.filter(email__in=list(rows)).values_list('email', flat=True))
+        stats['existing'] += len(existing)
+        for email in existing:
+            del rows[email]
+        if not rows:
+            return
+
+        emails = list(rows)
+        passwords = hash_passwords([rows[email].get('password') or None for email in emails], executor)
+        names = [(rows[email].get('name') or email.split('@')[0])[:155] for email in emails]
+        with transaction.atomic():
+            if use_copy:
+                self.copy_rows(emails, passwords, names)
+            else:
+                users = User.objects.bulk_create([
+                    User(email=email, password=password) for email, password in zip(emails, passwords)
+                ])
+                UserData.objects.bulk_create([
+                    UserData(user_id=user.pk, name=name, email_normalized=user.email)
+                    for user, name in zip(users, names)
+                ])
+        stats['imported'] += len(emails)
+
+    def copy_rows(self, emails, passwords, names):
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                "COPY user_user (email, password, username, is_staff, is_active, is_superuser, created_at, updated_at) "
+                "FROM STDIN WITH (FORMAT csv)",
+                self.copy_buffer([email, password, '', False, True, False] for email, password in zip(emails, passwords)),
+            )
+            ids = dict(User.objects.filter(email__in=emails).values_list('email', 'pk'))
+            cursor.cursor.copy_expert(
+                "COPY user_userdata (user_id, name, email_normalized, created_at, updated_at) "
+                "FROM STDIN WITH (FORMAT csv)",
+                self.copy_buffer([ids[email], name, email] for email, name in zip(emails, names)),
+            )
+
+    def copy_buffer(self, rows):
+        """CSV of `rows` with created_at and updated_at appended, quoted by csv.writer."""
+        # naive local time, as Django writes it with USE_TZ = False
+        now = timezone.now().isoformat()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([*row, now, now])
+        buffer.seek(0)
+        return buffer
+
+    def load_checkpoint(self, path):
+        if os.path.exists(path):
+            with open(path) as checkpoint:
+                data = json.load(checkpoint)
+            self.stdout.write(f'resuming at byte {data["offset"]} after {data["stats"]["read"]} rows')
+            return data
+        return {'offset': 0, 'stats': {'read': 0, 'imported': 0, 'existing': 0, 'duplicate': 0, 'invalid': 0}}
+
+    def save_checkpoint(self, path, offset, stats):
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump({'offset': offset, 'stats': stats}, checkpoint)
+        os.replace(temporary, path)
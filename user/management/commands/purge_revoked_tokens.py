@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from user.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete revocations of tokens that have expired anyway, in batches. Processes '
+        'drop them from their filters on the next rebuild. Run periodically, e.g. hourly.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = RevokedToken.objects.filter(expires_at__lte=now)
+        purged = 0
+        while True:
+            ids = list(expired.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            purged += RevokedToken.objects.filter(id__in=ids).delete()[0]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'purged {purged} expired revocations'))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.counters import reconcile
+from user.models import UserData
+
+
+class Command(BaseCommand):
+    help = (
+        'Recount the pending and friend counters of every user from FriendRequest and Friendship, '
+        'in batches, and repair the ones that drifted. Run after bulk loads and periodically, e.g. nightly.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without repairing it')
+
+    def handle(self, *args, **options):
+        last_id, checked, drifted = 0, 0, 0
+        while True:
+            user_ids = list(UserData.objects.filter(pk__gt=last_id).order_by('pk')
+                            .values_list('pk', flat=True)[:options['batch_size']])
+            if not user_ids:
+                break
+            for user_id, stored, actual in reconcile(user_ids, repair=not options['dry_run']):
+                drifted += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'user {user_id}: {stored} -> {actual}')
+            checked += len(user_ids)
+            last_id = user_ids[-1]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        action = 'found' if options['dry_run'] else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f'checked {checked} users, {action} {drifted} drifted counters'))
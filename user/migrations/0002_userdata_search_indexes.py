@@ -0,0 +1,50 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:47
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Lower
+
+
+def backfill_email_normalized(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    UserData = apps.get_model('user', 'UserData')
+    UserData.objects.update(
+        email_normalized=Subquery(
+            User.objects.filter(pk=OuterRef('user_id')).values(email_lower=Lower('email'))[:1]
+        )
+    )
+
+
+def create_name_trigram_index(apps, schema_editor):
+    # Matches the UPPER(name::text) expression Django emits for icontains/istartswith
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS user_userdata_name_trgm '
+        'ON user_userdata USING gin (UPPER(name::text) gin_trgm_ops)'
+    )
+
+
+def drop_name_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS user_userdata_name_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdata',
+            name='email_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.RunPython(backfill_email_normalized, migrations.RunPython.noop),
+        TrigramExtension(),
+        migrations.RunPython(create_name_trigram_index, drop_name_trigram_index),
+    ]
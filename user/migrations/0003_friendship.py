@@ -0,0 +1,51 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Greatest, Least
+
+
+def backfill_friendships(apps, schema_editor):
+    FriendRequest = apps.get_model('user', 'FriendRequest')
+    Friendship = apps.get_model('user', 'Friendship')
+    db_alias = schema_editor.connection.alias
+    edges = []
+    # one row per pair: requests both ways may both be accepted, and the
+    # unique index that would absorb the repeats is only built after this runs
+    accepted = FriendRequest.objects.using(db_alias).filter(status='accepted').values_list(
+        Least('from_user_id', 'to_user_id'), Greatest('from_user_id', 'to_user_id'),
+    ).order_by().distinct()
+    for from_user_id, to_user_id in accepted.iterator(chunk_size=2000):
+        edges.append(Friendship(user_id=from_user_id, friend_id=to_user_id))
+        edges.append(Friendship(user_id=to_user_id, friend_id=from_user_id))
+        if len(edges) >= 4000:
+            Friendship.objects.using(db_alias).bulk_create(edges, ignore_conflicts=True)
+            edges = []
+    Friendship.objects.using(db_alias).bulk_create(edges, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0002_userdata_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Friendship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='user.userdata')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendships', to='user.userdata')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+                'abstract': False,
+                'indexes': [models.Index(fields=['user', '-created_at', '-id'], name='friendship_user_created_idx')],
+                'unique_together': {('user', 'friend')},
+            },
+        ),
+        migrations.RunPython(backfill_friendships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_friendship'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('mutual_count', models.PositiveIntegerField(default=0)),
+                ('suggested', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='user.userdata')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='suggestions', to='user.userdata')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+                'abstract': False,
+                'indexes': [models.Index(fields=['user', '-mutual_count', '-id'], name='suggestion_user_rank_idx')],
+                'unique_together': {('user', 'suggested')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """CREATE INDEX CONCURRENTLY on Postgres, so the live table keeps taking writes, a plain AddIndex elsewhere."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('user', '0004_friendsuggestion'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='friendrequest',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['to_user', '-created_at', '-id'], name='friend_request_pending_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='friendrequest',
+            index=models.Index(condition=models.Q(('status__in', ['accepted', 'rejected'])), fields=['to_user', 'status', '-created_at', '-id'], name='friend_request_answered_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    # the same grouped counts as user.counters.recount, for every user at once
+    FriendRequest = apps.get_model('user', 'FriendRequest')
+    Friendship = apps.get_model('user', 'Friendship')
+    UserCounters = apps.get_model('user', 'UserCounters')
+    db_alias = schema_editor.connection.alias
+    pending = FriendRequest.objects.using(db_alias).filter(status='pending').order_by()
+    queries = [
+        ('pending_in', 'to_user_id', pending),
+        ('pending_out', 'from_user_id', pending),
+        ('friends', 'user_id', Friendship.objects.using(db_alias).order_by()),
+    ]
+    counts = {}
+    for field, column, queryset in queries:
+        for user_id, count in queryset.values(column).annotate(count=Count('pk')).values_list(column, 'count'):
+            counts.setdefault(user_id, {})[field] = count
+    UserCounters.objects.using(db_alias).bulk_create(
+        [UserCounters(user_id=user_id, **fields) for user_id, fields in counts.items()], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0006_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to='user.userdata')),
+                ('pending_in', models.IntegerField(default=0)),
+                ('pending_out', models.IntegerField(default=0)),
+                ('friends', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0007_usercounters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedFriendRequest',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('rejected', 'Rejected')], max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField()),
+                ('from_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='user.userdata')),
+                ('to_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='user.userdata')),
+            ],
+            options={
+                'unique_together': {('from_user', 'to_user')},
+            },
+        ),
+    ]
@@ -1,8 +1,9 @@
 
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser
 
-from user.models_manager import UserManager
+from user.models_manager import UserManager, FriendshipManager, FriendRequestManager
 from user.model_choices import FRIEND_REQUEST_CHOICES
 
 class BaseModel(models.Model):
@@ -26,21 +27,142 @@ class User(AbstractBaseUser, BaseModel):
 
     def __str__(self):
         return self.email
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # tokens issued before an email change carry this one, see user.signals
+        instance._loaded_email = instance.__dict__.get('email')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'email' in update_fields:
+            # updated_at lets other processes' autocomplete indexes pick the change up
+            UserData.objects.filter(user_id=self.pk).exclude(
+                email_normalized=self.email.lower()
+            ).update(email_normalized=self.email.lower(), updated_at=timezone.now())
     
 class UserData(BaseModel):
     user = models.OneToOneField(User, related_name='user_data', on_delete=models.CASCADE, primary_key=True)
     name = models.CharField(max_length=155)
+    # Lower-cased copy of user.email so search can match name and email on one table
+    email_normalized = models.CharField(max_length=254, db_index=True, editable=False, default='')
 
     def __str__(self):
         return f'{self.user} - {self.name}'
+
+    def save(self, *args, **kwargs):
+        if not self.email_normalized:
+            self.email_normalized = self.user.email.lower()
+        super().save(*args, **kwargs)
     
 class FriendRequest(BaseModel):
     from_user = models.ForeignKey(UserData, related_name='sent_requests', on_delete=models.CASCADE)
     to_user = models.ForeignKey(UserData, related_name='received_requests', on_delete=models.CASCADE)
     status = models.CharField(max_length=10, choices=FRIEND_REQUEST_CHOICES, default="pending")
 
+    INITIAL_STATUS = 'pending'
+    # status -> statuses it can move to, enforced by FriendRequestManager.transition
+    TRANSITIONS = {
+        'pending': ('accepted', 'rejected'),
+    }
+
+    objects = FriendRequestManager()
+
+    class Meta:
+        # (from_user, to_user) also serves the duplicate check on send. The
+        # inbox lists pending requests far more often than answered ones, so
+        # the two are split into partial indexes that no row is in twice.
+        unique_together = ('from_user', 'to_user')
+        indexes = [
+            models.Index(fields=['to_user', '-created_at', '-id'], condition=models.Q(status='pending'),
+                         name='friend_request_pending_idx'),
+            models.Index(fields=['to_user', 'status', '-created_at', '-id'],
+                         condition=models.Q(status__in=['accepted', 'rejected']), name='friend_request_answered_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.from_user} -> {self.to_user} ({self.status})'
+
+
+class ArchivedFriendRequest(models.Model):
+    """
+    Answered FriendRequest moved out of the hot table by user.archive, with
+    its original id and timestamps. Duplicate checks and exports read both.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    from_user = models.ForeignKey(UserData, related_name='+', on_delete=models.CASCADE)
+    to_user = models.ForeignKey(UserData, related_name='+', on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=FRIEND_REQUEST_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
     class Meta:
         unique_together = ('from_user', 'to_user')
 
     def __str__(self):
-        return f'{self.from_user} -> {self.to_user} ({self.status})'
\ No newline at end of file
+        return f'{self.from_user_id} -> {self.to_user_id} ({self.status}, archived)'
+
+
+class Friendship(BaseModel):
+    """
+    Materialized friendship edge, stored once per direction so a user's
+    friends are a range scan on (user, created_at).
+    """
+    user = models.ForeignKey(UserData, related_name='friendships', on_delete=models.CASCADE)
+    friend = models.ForeignKey(UserData, related_name='+', on_delete=models.CASCADE)
+
+    objects = FriendshipManager()
+
+    class Meta(BaseModel.Meta):
+        unique_together = ('user', 'friend')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='friendship_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} <-> {self.friend}'
+
+
+class UserCounters(models.Model):
+    """
+    Badge counts of `user`, changed by user.counters in the transaction that
+    changes the requests or friendships they count, so reading them is one
+    primary key lookup. reconcile_user_counters repairs any drift.
+    """
+    user = models.OneToOneField(UserData, related_name='counters', on_delete=models.CASCADE, primary_key=True)
+    pending_in = models.IntegerField(default=0)
+    pending_out = models.IntegerField(default=0)
+    friends = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.pending_in} in, {self.pending_out} out, {self.friends} friends'
+
+
+class FriendSuggestion(BaseModel):
+    """Precomputed friends-of-friends for `user`, see user.suggestions."""
+    user = models.ForeignKey(UserData, related_name='suggestions', on_delete=models.CASCADE)
+    suggested = models.ForeignKey(UserData, related_name='+', on_delete=models.CASCADE)
+    mutual_count = models.PositiveIntegerField(default=0)
+
+    class Meta(BaseModel.Meta):
+        unique_together = ('user', 'suggested')
+        indexes = [
+            models.Index(fields=['user', '-mutual_count', '-id'], name='suggestion_user_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} -> {self.suggested} ({self.mutual_count})'
+
+
+class RevokedToken(BaseModel):
+    """JWT id revoked before its expiry, see user.revocation."""
+    jti = models.CharField(max_length=255, unique=True)
+    token_type = models.CharField(max_length=10)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.token_type} {self.jti}'
@@ -1,4 +1,9 @@
 from django.contrib.auth.models import BaseUserManager
+from django.db import connections, models, router
+from django.db.models import Value
+from django.utils import timezone
+
+from user.hashing import hash_password
 
 
 class UserManager(BaseUserManager):
@@ -7,7 +12,7 @@ class UserManager(BaseUserManager):
             raise ValueError('The Email field must be set')
         email = self.normalize_email(email)
         user = self.model(email=email, **extra_fields)
-        user.set_password(password)
+        user.password = hash_password(password)
         user.save(using=self._db)
         return user
 
@@ -15,4 +20,170 @@ class UserManager(BaseUserManager):
         extra_fields.setdefault('is_staff', True)
         extra_fields.setdefault('is_superuser', True)
 
-        return self.create_user(email, password, **extra_fields)
\ No newline at end of file
+        return self.create_user(email, password, **extra_fields)
+
+
+class FriendshipManager(models.Manager):
+    # edges per INSERT, 4 parameters each
+    LINK_BATCH_SIZE = 1000
+
+    def link(self, user_id, friend_id):
+        return self.link_many([(user_id, friend_id)])
+
+    def link_many(self, pairs):
+        """
+        Create both directions of every (user_id, friend_id) pair, skipping
+        existing edges. Returns the (user_id, friend_id) edges that were
+        created, so callers can count new friendships exactly.
+        """
+        edges = list(dict.fromkeys(
+            edge for user_id, friend_id in pairs for edge in ((user_id, friend_id), (friend_id, user_id))
+        ))
+        if not edges:
+            return []
+        meta = self.model._meta
+        connection = connections[router.db_for_write(self.model)]
+        quote = connection.ops.quote_name
+        user, friend, created_at, updated_at = (
+            quote(meta.get_field(name).column) for name in ('user', 'friend', 'created_at', 'updated_at')
+        )
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        created = []
+        with connection.cursor() as cursor:
+            for start in range(0, len(edges), self.LINK_BATCH_SIZE):
+                batch = edges[start:start + self.LINK_BATCH_SIZE]
+                cursor.execute(
+                    f'INSERT INTO {quote(meta.db_table)} ({user}, {friend}, {created_at}, {updated_at}) '
+                    f'VALUES {", ".join(["(%s, %s, %s, %s)"] * len(batch))} '
+                    f'ON CONFLICT ({user}, {friend}) DO NOTHING RETURNING {user}, {friend}',
+                    [value for user_id, friend_id in batch for value in (user_id, friend_id, now, now)],
+                )
+                created.extend(tuple(row) for row in cursor.fetchall())
+        return created
+
+    def mutual(self, user_id, other_id):
+        """`user_id`'s edges whose friend is also a friend of `other_id`."""
+        return self.filter(
+            user_id=user_id,
+            friend_id__in=self.filter(user_id=other_id).values('friend_id'),
+        )
+
+
+class FriendRequestManager(models.Manager):
+    """
+    State changes of friend requests as single conditional statements, so
+    they are decided by the database and not by an earlier read: of two
+    concurrent sends or answers exactly one applies. Neither sends
+    post_save; callers send friend_requests_changed.
+    """
+
+    def _fetch_one(self, connection, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()
+
+    def send(self, from_user_id, to_user_id):
+        """
+        Create a pending request from `from_user_id` to `to_user_id` unless
+        the recipient doesn't exist, a request between the two already does
+        or they are friends. Returns (id, None) when created and
+        (None, reason) otherwise, reason being 'invalid_id' or the status
+        statuses() reports. One INSERT when the request is created, one more
+        SELECT when not. A send racing archive_friend_requests moving the
+        same pair can miss the archived row.
+        """
+        created = self._insert(from_user_id, [to_user_id])
+        if created:
+            return created[0][0], None
+        existing = self.statuses(from_user_id, [to_user_id])
+        return None, existing.get(to_user_id, 'invalid_id')
+
+    def send_many(self, from_user_id, to_user_ids):
+        """
+        send() to each of `to_user_ids` in one INSERT. Returns to_user_id ->
+        id of the requests created; callers look up why the others weren't
+        with statuses().
+        """
+        if not to_user_ids:
+            return {}
+        return {to_user_id: pk for pk, to_user_id in self._insert(from_user_id, to_user_ids)}
+
+    def _insert(self, from_user_id, to_user_ids):
+        meta = self.model._meta
+        recipients = meta.get_field('to_user').related_model._meta
+        connection = connections[router.db_for_write(self.model)]
+        quote = connection.ops.quote_name
+        from_user, to_user, status, created_at, updated_at = (
+            quote(meta.get_field(name).column) for name in ('from_user', 'to_user', 'status', 'created_at', 'updated_at')
+        )
+        recipient_id = f'{quote(recipients.db_table)}.{quote(recipients.pk.column)}'
+        archive, friendship = self.archive_model._meta, self.friendship_model._meta
+        friendship_user, friendship_friend = (quote(friendship.get_field(name).column) for name in ('user', 'friend'))
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        # the WHERE also keeps SQLite from reading ON CONFLICT as a join constraint
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(meta.db_table)} ({from_user}, {to_user}, {status}, {created_at}, {updated_at}) '
+                f'SELECT %s, {recipient_id}, %s, %s, %s FROM {quote(recipients.db_table)} '
+                f'WHERE {recipient_id} IN ({", ".join(["%s"] * len(to_user_ids))}) '
+                f'AND NOT EXISTS (SELECT 1 FROM {quote(archive.db_table)} '
+                f'WHERE {from_user} = %s AND {to_user} = {recipient_id}) '
+                f'AND NOT EXISTS (SELECT 1 FROM {quote(friendship.db_table)} '
+                f'WHERE {friendship_user} = %s AND {friendship_friend} = {recipient_id}) '
+                f'ON CONFLICT ({from_user}, {to_user}) DO NOTHING RETURNING {quote(meta.pk.column)}, {to_user}',
+                [from_user_id, self.model.INITIAL_STATUS, now, now, *to_user_ids, from_user_id, from_user_id],
+            )
+            return cursor.fetchall()
+
+    @property
+    def archive_model(self):
+        # declared after FriendRequest in user.models
+        return self.model._meta.apps.get_model(self.model._meta.app_label, 'ArchivedFriendRequest')
+
+    @property
+    def friendship_model(self):
+        return self.model._meta.apps.get_model(self.model._meta.app_label, 'Friendship')
+
+    def statuses(self, from_user_id, to_user_ids):
+        """
+        to_user_id -> status of the requests `from_user_id` sent to
+        `to_user_ids`, live or archived, in one query. Users who are already
+        friends are 'accepted', whoever sent the request.
+        """
+        live, archived = (
+            model.objects.filter(from_user_id=from_user_id, to_user_id__in=to_user_ids)
+            .order_by().values_list('to_user_id', 'status')
+            for model in (self.model, self.archive_model)
+        )
+        friends = self.friendship_model.objects.filter(user_id=from_user_id, friend_id__in=to_user_ids).order_by() \
+            .annotate(status=Value('accepted', output_field=models.CharField())).values_list('friend_id', 'status')
+        result = {}
+        for to_user_id, status in live.union(archived, friends, all=True):
+            if result.get(to_user_id) != 'accepted':
+                result[to_user_id] = status
+        return result
+
+    def transition(self, pk, to_user_id, status):
+        """
+        Move request `pk` received by `to_user_id` to `status` with one
+        UPDATE that only applies from a status allowed to move there by
+        FriendRequest.TRANSITIONS. Returns the sender's id, None when no
+        such request is in such a status.
+        """
+        sources = [source for source, targets in self.model.TRANSITIONS.items() if status in targets]
+        if not sources:
+            raise ValueError(f'no transition to {status!r}')
+        meta = self.model._meta
+        connection = connections[router.db_for_write(self.model)]
+        quote = connection.ops.quote_name
+        from_user, to_user, status_column, updated_at = (
+            quote(meta.get_field(name).column) for name in ('from_user', 'to_user', 'status', 'updated_at')
+        )
+        row = self._fetch_one(
+            connection,
+            f'UPDATE {quote(meta.db_table)} SET {status_column} = %s, {updated_at} = %s '
+            f'WHERE {quote(meta.pk.column)} = %s AND {to_user} = %s '
+            f'AND {status_column} IN ({", ".join(["%s"] * len(sources))}) RETURNING {from_user}',
+            [status, connection.ops.adapt_datetimefield_value(timezone.now()), pk, to_user_id, *sources],
+        )
+        return row[0] if row is not None else None
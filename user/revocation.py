@@ -0,0 +1,125 @@
+"""
+Revoked JWTs. Revocations are rows in RevokedToken; every process keeps a
+Bloom filter of their jtis, so checking a token that was never revoked,
+the common case, costs no query. A filter hit is confirmed against the
+table because of false positives.
+
+A process builds its filter on first use, pulls rows revoked by other
+processes every SYNC_INTERVAL seconds and rebuilds it every
+REBUILD_INTERVAL seconds, which also drops rows removed by
+purge_revoked_tokens. A token revoked in another process can therefore
+still pass here for up to SYNC_INTERVAL seconds.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from base.bloom import BloomFilter
+from base.cache import LRUCache
+from user.models import RevokedToken
+
+# Rows committed this long after their created_at are still picked up by a sync
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class RevocationStore:
+
+    def __init__(self):
+        self._filter = None
+        self._built_at = self._synced_at = 0.0
+        self._sync_from = None
+        self._add_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._confirmed = LRUCache(maxsize=10000)
+
+    def is_revoked(self, jti):
+        bloom = self._fresh_filter()
+        if jti not in bloom:
+            return False
+        if self._confirmed.get(jti):
+            return True
+        revoked = RevokedToken.objects.filter(jti=jti).exists()
+        if revoked:
+            self._confirmed.set(jti, True)
+        return revoked
+
+    def add(self, jti):
+        with self._add_lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+    def _fresh_filter(self):
+        config = settings.TOKEN_REVOCATION
+        now = time.monotonic()
+        stale = self._filter is None or now - self._built_at > config['REBUILD_INTERVAL']
+        behind = now - self._synced_at > config['SYNC_INTERVAL']
+        if stale or behind:
+            # one thread refreshes, the others keep using the current filter
+            if self._refresh_lock.acquire(blocking=self._filter is None):
+                try:
+                    if self._filter is None or time.monotonic() - self._built_at > config['REBUILD_INTERVAL']:
+                        self.rebuild()
+                    elif time.monotonic() - self._synced_at > config['SYNC_INTERVAL']:
+                        self.sync()
+                finally:
+                    self._refresh_lock.release()
+        return self._filter
+
+    def rebuild(self):
+        config = settings.TOKEN_REVOCATION
+        started = timezone.now()
+        jtis = list(RevokedToken.objects.filter(expires_at__gt=started).values_list('jti', flat=True))
+        bloom = BloomFilter(max(config['CAPACITY'], 2 * len(jtis)), config['ERROR_RATE'])
+        for jti in jtis:
+            bloom.add(jti)
+        with self._add_lock:
+            self._filter = bloom
+        self._built_at = self._synced_at = time.monotonic()
+        self._sync_from = started
+
+    def sync(self):
+        started = timezone.now()
+        jtis = list(RevokedToken.objects.filter(
+            created_at__gte=self._sync_from - SYNC_OVERLAP
+        ).values_list('jti', flat=True))
+        with self._add_lock:
+            for jti in jtis:
+                self._filter.add(jti)
+            if len(self._filter) > self._filter.capacity:
+                # over capacity the error rate climbs, resize on the next check
+                self._built_at = 0.0
+        self._synced_at = time.monotonic()
+        self._sync_from = started
+
+
+_store = RevocationStore()
+
+
+def get_revocation_store():
+    return _store
+
+
+def is_token_revoked(token):
+    return _store.is_revoked(token[api_settings.JTI_CLAIM])
+
+
+def revoke_token(token):
+    """Revoke a validated token until it expires. False if it already was revoked."""
+    jti = token[api_settings.JTI_CLAIM]
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(
+                jti=jti,
+                token_type=token[api_settings.TOKEN_TYPE_CLAIM],
+                expires_at=datetime.fromtimestamp(token['exp']),
+            )
+    except IntegrityError:
+        return False
+    # before commit is fine, a filter hit is always confirmed in the table
+    _store.add(jti)
+    return True
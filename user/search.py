@@ -0,0 +1,154 @@
+import heapq
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.functions import Cast, Upper
+from django.utils.module_loading import import_string
+
+from user.models import UserData
+
+RANK_EXACT_EMAIL = 0
+RANK_PREFIX = 1
+RANK_SIMILAR = 2
+
+# pg_trgm.similarity_threshold default, used by the `%` operator on Postgres
+TRIGRAM_THRESHOLD = 0.3
+
+SEARCH_ORDERING = ('search_rank', '-search_similarity', '-created_at', '-pk')
+
+# Best matches PythonSearchBackend returns, each one is a few bound parameters
+PYTHON_MAX_CANDIDATES = 200
+
+_word_re = re.compile(r'[^\W_]+')
+
+
+def trigrams(text):
+    """Trigram set of `text` built the same way pg_trgm builds it."""
+    result = set()
+    for word in _word_re.findall(text.lower()):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(a, b):
+    a, b = trigrams(a), trigrams(b)
+    if not a or not b:
+        return 0.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+class BaseSearchBackend:
+    """
+    Returns a UserData queryset annotated with `search_rank` and
+    `search_similarity`, ordered by SEARCH_ORDERING.
+    """
+
+    def search(self, query, exclude_user_id=None):
+        raise NotImplementedError
+
+    def base_queryset(self, exclude_user_id=None):
+        queryset = UserData.objects.select_related('user')
+        if exclude_user_id is not None:
+            queryset = queryset.exclude(user_id=exclude_user_id)
+        return queryset
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Uses the btree index on email_normalized and the trigram GIN index on
+    UPPER(name) created in migration 0002.
+    """
+
+    def search(self, query, exclude_user_id=None):
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        query = query.strip()
+        queryset = self.base_queryset(exclude_user_id)
+        if not query:
+            return queryset.annotate(
+                search_rank=Value(RANK_SIMILAR, output_field=IntegerField()),
+                search_similarity=Value(0.0, output_field=FloatField()),
+            ).order_by(*SEARCH_ORDERING)
+
+        email = query.lower()
+        return queryset.annotate(
+            search_name=Upper('name'),
+        ).filter(
+            Q(email_normalized=email) |
+            Q(name__icontains=query) |
+            Q(search_name__trigram_similar=query)
+        ).annotate(
+            search_rank=Case(
+                When(email_normalized=email, then=Value(RANK_EXACT_EMAIL)),
+                When(name__istartswith=query, then=Value(RANK_PREFIX)),
+                default=Value(RANK_SIMILAR),
+                output_field=IntegerField(),
+            ),
+            # float4 -> float8 so the value round-trips exactly through keyset cursors
+            search_similarity=Cast(TrigramSimilarity('search_name', query), FloatField()),
+        ).order_by(*SEARCH_ORDERING)
+
+
+class PythonSearchBackend(BaseSearchBackend):
+    """
+    Ranks in Python over a full scan of (id, name, email) and returns the
+    PYTHON_MAX_CANDIDATES best matches, so the query stays within SQLite's
+    bound parameter limit. Only meant for SQLite test runs and small
+    databases.
+    """
+
+    def search(self, query, exclude_user_id=None):
+        query = query.strip()
+        email = query.lower()
+        rows = UserData.objects.values_list('user_id', 'name', 'email_normalized', 'created_at')
+        if exclude_user_id is not None:
+            rows = rows.exclude(user_id=exclude_user_id)
+
+        matches = []
+        for user_id, name, email_normalized, created_at in rows.iterator():
+            name_lower = name.lower()
+            score = similarity(query, name) if query else 0.0
+            if query and email_normalized == email:
+                rank = RANK_EXACT_EMAIL
+            elif query and name_lower.startswith(email):
+                rank = RANK_PREFIX
+            elif email in name_lower or score >= TRIGRAM_THRESHOLD:
+                rank = RANK_SIMILAR
+            else:
+                continue
+            matches.append((rank, score, created_at, user_id))
+        # SEARCH_ORDERING, UserData's pk is user_id
+        matches = heapq.nsmallest(PYTHON_MAX_CANDIDATES, matches,
+                                  key=lambda match: (match[0], -match[1], -match[2].timestamp(), -match[3]))
+
+        if not matches:
+            return self.base_queryset().none().annotate(
+                search_rank=Value(RANK_SIMILAR, output_field=IntegerField()),
+                search_similarity=Value(0.0, output_field=FloatField()),
+            )
+
+        ranks = {}
+        for rank, _, _, user_id in matches:
+            ranks.setdefault(rank, []).append(user_id)
+        return self.base_queryset().filter(user_id__in=[user_id for *_, user_id in matches]).annotate(
+            search_rank=Case(
+                *[When(user_id__in=user_ids, then=Value(rank)) for rank, user_ids in ranks.items()],
+                output_field=IntegerField(),
+            ),
+            search_similarity=Case(
+                *[When(user_id=user_id, then=Value(score)) for _, score, _, user_id in matches],
+                output_field=FloatField(),
+            ),
+        ).order_by(*SEARCH_ORDERING)
+
+
+def get_search_backend():
+    if settings.USER_SEARCH_BACKEND:
+        return import_string(settings.USER_SEARCH_BACKEND)()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return PythonSearchBackend()
@@ -1,5 +1,11 @@
 from rest_framework import serializers
-from user.models import User, FriendRequest, UserData
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from user.hashing import check_user_password
+from user.models import User, FriendRequest, UserData, Friendship, FriendSuggestion
+from user.revocation import is_token_revoked, revoke_token
 
 
 class ErrorSerializer(serializers.Serializer):
@@ -43,7 +49,7 @@ class LoginSerializer(serializers.Serializer):
         
         user = User.objects.get(email=email)
 
-        if not user.check_password(password):
+        if not check_user_password(user, password):
             raise serializers.ValidationError({'message' : 'Invalid Password', 'error' : 'invalid_password'})
 
 
@@ -79,4 +85,36 @@ class SelfFriendRequestSerializer(serializers.ModelSerializer):
     class Meta:
         model = FriendRequest
         fields = ['id', 'from_user', 'status', 'created_at', 'updated_at', 'from_user_id']
-        
\ No newline at end of file
+
+
+class FriendSerializer(serializers.ModelSerializer):
+    friend = UserSearchSerializer(read_only=True)
+
+    class Meta:
+        model = Friendship
+        fields = ['id', 'friend', 'created_at']
+
+
+class FriendSuggestionSerializer(serializers.ModelSerializer):
+    suggested = UserSearchSerializer(read_only=True)
+
+    class Meta:
+        model = FriendSuggestion
+        fields = ['suggested', 'mutual_count']
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refuses revoked refresh tokens and, with BLACKLIST_AFTER_ROTATION,
+    revokes the one it rotates. The revocation row is unique per token, so
+    of two concurrent refreshes with the same token only one succeeds.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_token_revoked(refresh):
+            raise TokenError('Token is revoked')
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            if not revoke_token(refresh):
+                raise TokenError('Token is revoked')
+        return super().validate(attrs)
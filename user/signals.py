@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from base.response_cache import bump, user_scope
+from user.authentication import invalidate_cached_user
+from user.autocomplete import get_autocomplete_store
+from user.events import get_event_backend
+from user.models import FriendRequest, User, UserData
+
+# Sent with `ids`, and the `user_ids` of their senders and recipients, when
+# friend requests are created or change status. Saves send it from
+# post_save, bulk writes (bulk_create, update) send it explicitly.
+friend_requests_changed = Signal()
+
+# Response cache scopes (base.response_cache): every user's search results,
+# and the names and emails of users shown in other users' lists
+SEARCH_SCOPE = 'user_search'
+PROFILES_SCOPE = 'user_profiles'
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    invalidate_cached_user(instance.email)
+    loaded_email = getattr(instance, '_loaded_email', None)
+    if loaded_email is not None and loaded_email != instance.email:
+        invalidate_cached_user(loaded_email)
+    instance._loaded_email = instance.email
+
+
+@receiver([post_save, post_delete], sender=UserData)
+def invalidate_user_data(sender, instance, **kwargs):
+    # cached under User.email, email_normalized is lower-cased
+    if UserData.user.is_cached(instance):
+        email = instance.user.email
+    else:
+        email = User.objects.filter(pk=instance.user_id).values_list('email', flat=True).first()
+    if email is not None:
+        invalidate_cached_user(email)
+
+
+@receiver(post_save, sender=User)
+def reindex_user_email(sender, instance, **kwargs):
+    get_autocomplete_store().change_email(instance.pk, instance.email.lower())
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=UserData)
+def bump_user_responses(sender, instance, created=False, **kwargs):
+    # a new user can only show up in searches, they are in nobody's lists
+    # yet; their own scope goes too in case their id was used before
+    if created:
+        bump(SEARCH_SCOPE, user_scope(instance.pk if sender is User else instance.user_id))
+    else:
+        bump(SEARCH_SCOPE, PROFILES_SCOPE)
+
+
+@receiver(post_save, sender=UserData)
+def index_user_data(sender, instance, **kwargs):
+    get_autocomplete_store().add(instance.user_id, instance.name, instance.email_normalized)
+
+
+@receiver(post_delete, sender=UserData)
+def unindex_user_data(sender, instance, **kwargs):
+    get_autocomplete_store().remove(instance.user_id)
+
+
+@receiver(post_save, sender=FriendRequest)
+def friend_request_saved(sender, instance, **kwargs):
+    friend_requests_changed.send(sender=FriendRequest, ids=[instance.pk],
+                                 user_ids=[instance.from_user_id, instance.to_user_id])
+
+
+@receiver(friend_requests_changed)
+def publish_friend_request_events(sender, ids, **kwargs):
+    transaction.on_commit(lambda: get_event_backend().notify(ids))
+
+
+@receiver(friend_requests_changed)
+def bump_friend_request_responses(sender, ids, user_ids=(), **kwargs):
+    bump(*(user_scope(user_id) for user_id in set(user_ids)))
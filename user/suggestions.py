@@ -0,0 +1,131 @@
+import heapq
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from user.models import Friendship, FriendSuggestion
+
+
+def load_adjacency():
+    """user_id -> set of friend ids, from the materialized Friendship edges."""
+    adjacency = defaultdict(set)
+    edges = Friendship.objects.values_list('user_id', 'friend_id')
+    for user_id, friend_id in edges.iterator(chunk_size=10000):
+        adjacency[user_id].add(friend_id)
+    return adjacency
+
+
+def top_suggestions(adjacency, user_id, top_k):
+    """Friends of friends of `user_id` ranked by mutual-friend count."""
+    friends = adjacency.get(user_id, ())
+    counts = Counter()
+    for friend_id in friends:
+        counts.update(adjacency[friend_id])
+    counts.pop(user_id, None)
+    for friend_id in friends:
+        counts.pop(friend_id, None)
+    return heapq.nlargest(top_k, counts.items(), key=lambda item: (item[1], -item[0]))
+
+
+def rebuild_suggestions(adjacency=None, top_k=None, batch_size=1000, user_ids=None):
+    """
+    Replace the stored top-K list of every user in `user_ids` (default all
+    users with friends). Each batch is written in its own transaction.
+    Returns the number of users processed.
+    """
+    adjacency = load_adjacency() if adjacency is None else adjacency
+    top_k = top_k or settings.FRIEND_SUGGESTIONS_TOP_K
+    user_ids = sorted(adjacency) if user_ids is None else list(user_ids)
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        rows = [
+            FriendSuggestion(user_id=user_id, suggested_id=suggested_id, mutual_count=count)
+            for user_id in batch
+            for suggested_id, count in top_suggestions(adjacency, user_id, top_k)
+        ]
+        with transaction.atomic():
+            FriendSuggestion.objects.filter(user_id__in=batch).delete()
+            FriendSuggestion.objects.bulk_create(rows, batch_size=5000)
+    return len(user_ids)
+
+
+def _trim(user_ids, top_k):
+    """Cut the lists of `user_ids` back to their top_k rows, one ranking query and one delete."""
+    ranked = FriendSuggestion.objects.filter(user_id__in=user_ids).annotate(rank=Window(
+        RowNumber(), partition_by=F('user_id'), order_by=[F('mutual_count').desc(), F('pk').desc()],
+    ))
+    extra = list(ranked.filter(rank__gt=top_k).values_list('pk', flat=True))
+    if extra:
+        FriendSuggestion.objects.filter(pk__in=extra).delete()
+
+
+def apply_new_friendships(edges, top_k=None):
+    """
+    Incrementally adjust stored suggestions after the friendship `edges`
+    were created, in one transaction. Only the users of the edges and
+    their direct friends change: every friend of one side gains a mutual
+    friend with the other side. The edges are replayed one at a time so
+    that a mutual friend made by two of them counts once. Stored rows get
+    the mutual friends gained; missing rows, which may have been trimmed,
+    are inserted with their full mutual count. The lists of the edges'
+    users and of everyone who got a row inserted are trimmed back to top-K.
+    """
+    pairs = sorted({(min(edge), max(edge)) for edge in edges})
+    if not pairs:
+        return
+    top_k = top_k or settings.FRIEND_SUGGESTIONS_TOP_K
+    endpoints = {user_id for pair in pairs for user_id in pair}
+    adjacency = defaultdict(set)
+    for owner_id, other_id in Friendship.objects.filter(user_id__in=endpoints).values_list('user_id', 'friend_id'):
+        adjacency[owner_id].add(other_id)
+    for user_id, friend_id in pairs:
+        adjacency[user_id].discard(friend_id)
+        adjacency[friend_id].discard(user_id)
+
+    gained = Counter()
+    for user_id, friend_id in pairs:
+        for owner_id, new_friend_id in ((user_id, friend_id), (friend_id, user_id)):
+            # owner now shares new_friend_id with everyone in its friends
+            for candidate_id in adjacency[new_friend_id] - adjacency[owner_id] - {owner_id}:
+                gained[owner_id, candidate_id] += 1
+                gained[candidate_id, owner_id] += 1
+        adjacency[user_id].add(friend_id)
+        adjacency[friend_id].add(user_id)
+    # one side of every key is an endpoint, whose adjacency is loaded
+    gained = {
+        (owner_id, suggested_id): count for (owner_id, suggested_id), count in gained.items()
+        if suggested_id not in adjacency[owner_id] and owner_id not in adjacency[suggested_id]
+    }
+
+    with transaction.atomic():
+        FriendSuggestion.objects.filter(
+            Q(*[Q(user_id=user_id, suggested_id=friend_id) | Q(user_id=friend_id, suggested_id=user_id)
+                for user_id, friend_id in pairs], _connector=Q.OR)
+        ).delete()
+        stored = FriendSuggestion.objects.filter(
+            user_id__in={owner_id for owner_id, _ in gained},
+            suggested_id__in={suggested_id for _, suggested_id in gained},
+        ).values_list('pk', 'user_id', 'suggested_id')
+        by_count, found = defaultdict(list), set()
+        for pk, owner_id, suggested_id in stored:
+            if (owner_id, suggested_id) in gained:
+                by_count[gained[owner_id, suggested_id]].append(pk)
+                found.add((owner_id, suggested_id))
+        for count, pks in by_count.items():
+            FriendSuggestion.objects.filter(pk__in=pks).update(mutual_count=F('mutual_count') + count)
+
+        missing = [key for key in gained if key not in found]
+        if missing:
+            friends = defaultdict(set)
+            rows = Friendship.objects.filter(user_id__in={user_id for key in missing for user_id in key})
+            for owner_id, other_id in rows.values_list('user_id', 'friend_id').iterator(chunk_size=10000):
+                friends[owner_id].add(other_id)
+            FriendSuggestion.objects.bulk_create([
+                FriendSuggestion(user_id=owner_id, suggested_id=suggested_id,
+                                 mutual_count=len(friends[owner_id] & friends[suggested_id]))
+                for owner_id, suggested_id in missing
+            ], ignore_conflicts=True)
+        _trim(endpoints | {owner_id for owner_id, _ in missing}, top_k)
@@ -0,0 +1,82 @@
+import itertools
+import random
+
+from django.contrib.auth.hashers import make_password
+
+from user.models import User, UserData
+
+FIRST_NAMES = (
+    'Aarav', 'Aditi', 'Alex', 'Ananya', 'Arjun', 'Chen', 'Diya', 'Elena', 'Fatima', 'Hiro',
+    'Ishaan', 'Kavya', 'Liam', 'Maya', 'Noah', 'Olivia', 'Priya', 'Rahul', 'Sara', 'Vivaan',
+)
+LAST_NAMES = (
+    'Agarwal', 'Brown', 'Das', 'Garcia', 'Gupta', 'Iyer', 'Khan', 'Kim', 'Mehta', 'Nair',
+    'Patel', 'Reddy', 'Rossi', 'Sharma', 'Singh', 'Smith', 'Tanaka', 'Verma', 'Wang', 'Yadav',
+)
+
+
+def random_name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def create_users(count, start=0, seed=0, password='password123', batch_size=5000, prefix='user'):
+    """
+    Bulk create `count` users with UserData rows, emails
+    `<prefix><n>@example.com` for n from `start`. All users share one
+    precomputed password hash so generation is not bound by hashing.
+    Returns the list of created user ids.
+    """
+    rng = random.Random(seed + start)
+    password_hash = make_password(password)
+    user_ids = []
+    for offset in range(start, start + count, batch_size):
+        size = min(batch_size, start + count - offset)
+        users = User.objects.bulk_create([
+            User(email=f'{prefix}{offset + i}@example.com', password=password_hash)
+            for i in range(size)
+        ])
+        UserData.objects.bulk_create([
+            UserData(user_id=user.pk, name=random_name(rng), email_normalized=user.email)
+            for user in users
+        ])
+        user_ids.extend(user.pk for user in users)
+    return user_ids
+
+
+def power_law_edges(count, edges_per_node=3, seed=0):
+    """
+    Barabasi-Albert preferential attachment over node indexes 0..count-1.
+    Degree follows a power law, so a few nodes end up with very high degree.
+    """
+    rng = random.Random(seed)
+    targets = list(range(edges_per_node))
+    repeated = []
+    edges = []
+    for node in range(edges_per_node, count):
+        chosen = set()
+        while len(chosen) < edges_per_node:
+            chosen.add(rng.choice(repeated) if repeated else rng.choice(targets))
+        for target in chosen:
+            edges.append((node, target))
+            repeated.extend((node, target))
+    return edges
+
+
+def power_law_requests(user_ids, per_user, exponent=2.1, seed=0):
+    """
+    Yield (from_user_id, to_user_id) pairs, about `per_user` per sender.
+    Recipients are drawn with weight rank ** (-1 / (exponent - 1)), which gives
+    a power-law in-degree (a few very popular users) in O(len(user_ids))
+    memory, so tens of millions of pairs can be streamed.
+    """
+    rng = random.Random(seed)
+    popularity = list(user_ids)
+    rng.shuffle(popularity)
+    cum_weights = list(itertools.accumulate(
+        (rank + 1) ** (-1 / (exponent - 1)) for rank in range(len(popularity))
+    ))
+    for from_user_id in user_ids:
+        targets = set(rng.choices(popularity, cum_weights=cum_weights, k=per_user))
+        targets.discard(from_user_id)
+        for to_user_id in targets:
+            yield from_user_id, to_user_id
@@ -1,11 +1,86 @@
+import asyncio
+import csv
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
 from django.urls import reverse
-from rest_framework.test import APITestCase
-from rest_framework import status
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APITestCase
+from rest_framework import serializers, status
 from django.contrib.auth import get_user_model
 
-from user.models import UserData, FriendRequest, User
+from base.bloom import BloomFilter
+from base.checks import check_shared_caches
+from base.metrics import get_registry
+from base.pagination import KeysetPagination
+from base.pool import ConnectionPool, PoolTimeout
+from base.ratelimit import SlidingWindowRateLimiter
+from base.renderers import FastJSONRenderer
+from base.response_cache import get_response_cache
+from base.routers import sticky_key
+from base.serialization import ValuesPlan, values_plan
+from user.archive import archive_batch
+from user.autocomplete import AutocompleteStore, PrefixIndex, autocomplete, get_autocomplete_store
+from user.counters import get_counters
+from user.models import (UserData, FriendRequest, User, Friendship, FriendSuggestion, RevokedToken, UserCounters,
+                         ArchivedFriendRequest)
 from user.helper import generate_user_token, check_missing_fields
-from user.serializers import UserSerializer, FriendRequestSerializer
+from user.serializers import (UserSerializer, FriendRequestSerializer, FriendSerializer, FriendSuggestionSerializer,
+                              SelfFriendRequestSerializer, UserSearchSerializer)
+from user.authentication import UserCache
+from user.hashing import PasswordHashExecutor, PasswordHashingBusy
+from user.events import OVERFLOW, event_id, get_event_backend, hub, parse_event_id
+from user.export import user_export
+from user.revocation import RevocationStore
+from user.search import PythonSearchBackend, similarity
+from user.suggestions import apply_new_friendships, rebuild_suggestions
+from user.views import FriendListView, FriendRequestView, UserSearchView, answer_friend_request, create_friend_request
+
+
+class QueryBudgetMixin:
+    """
+    Renders a list endpoint at growing row counts and fails when the number
+    of queries grows with them, i.e. when a serializer lazily loads a
+    relation per row.
+    """
+    budget_page_size = 25
+
+    def assertQueryBudget(self, url, params, make_rows, budget, sizes=(1, 5, 25)):
+        counts = []
+        with mock.patch.object(PageNumberPagination, 'page_size', self.budget_page_size), \
+                mock.patch.object(KeysetPagination, 'page_size', self.budget_page_size):
+            for size in sizes:
+                make_rows(size)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(len(response.data['results']), size)
+                counts.append(len(queries))
+        self.assertEqual(len(set(counts)), 1, f'{url} query count grows with rows: {dict(zip(sizes, counts))}')
+        self.assertLessEqual(counts[0], budget, f'{url} ran {counts[0]} queries, budget is {budget}')
 
 
 class SignupViewTest(APITestCase):
@@ -103,6 +178,51 @@ class UserSearchViewTest(APITestCase):
         self.assertEqual(len(response.data['results']), 1)
         self.assertEqual(response.data['results'][0]['name'], 'Test User2')
 
+    def test_user_search_ranking(self):
+        user3 = get_user_model().objects.create_user(email='mayank@example.com', password='testpassword')
+        UserData.objects.create(user=user3, name='Maya Patel')
+        user4 = get_user_model().objects.create_user(email='maya@example.com', password='testpassword')
+        UserData.objects.create(user=user4, name='Riya Sharma')
+        user5 = get_user_model().objects.create_user(email='other@example.com', password='testpassword')
+        UserData.objects.create(user=user5, name='Mayaa Patel')
+        response = self.client.get(self.search_url, {'q': 'MAYA@example.com'})
+        self.assertEqual(response.data['results'][0]['name'], 'Riya Sharma')
+
+        response = self.client.get(self.search_url, {'q': 'maya'})
+        names = [result['name'] for result in response.data['results']]
+        self.assertEqual(names[:2], ['Maya Patel', 'Mayaa Patel'])
+
+    def test_user_fuzzy_search(self):
+        response = self.client.get(self.search_url, {'q': 'Tst User2'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['name'], 'Test User2')
+
+    def test_python_backend_keeps_best_candidates(self):
+        for index in range(6):
+            user = get_user_model().objects.create_user(email=f'many{index}@example.com', password='testpassword')
+            UserData.objects.create(user=user, name=f'Test Many {index}')
+        expected = list(PythonSearchBackend().search('test', exclude_user_id=self.user.id).values_list('name', flat=True))
+        with mock.patch('user.search.PYTHON_MAX_CANDIDATES', 3):
+            queryset = PythonSearchBackend().search('test', exclude_user_id=self.user.id)
+            self.assertEqual(list(queryset.values_list('name', flat=True)), expected[:3])
+
+
+class SearchEngineTest(TestCase):
+
+    def test_similarity_matches_pg_trgm(self):
+        # SELECT similarity('word', 'two words') = 0.36363637
+        self.assertAlmostEqual(similarity('word', 'two words'), 4 / 11)
+        self.assertEqual(similarity('', 'anything'), 0.0)
+
+    def test_email_normalized_follows_user_email(self):
+        user = get_user_model().objects.create_user(email='Mixed@Example.com', password='testpassword')
+        user_data = UserData.objects.create(user=user, name='Mixed Case')
+        self.assertEqual(user_data.email_normalized, 'mixed@example.com')
+        user.email = 'renamed@example.com'
+        user.save()
+        user_data.refresh_from_db()
+        self.assertEqual(user_data.email_normalized, 'renamed@example.com')
+
 
 
 class FriendRequestViewTests(APITestCase):
@@ -112,6 +232,7 @@ class FriendRequestViewTests(APITestCase):
         self.user2 = User.objects.create_user(email='user2@example.com', password='password123')
         self.user_data1 = UserData.objects.create(user=self.user1, name='User One')
         self.user_data2 = UserData.objects.create(user=self.user2, name='User Two')
+        cache.clear()
         self.client.force_authenticate(user=self.user1)
         self.friend_request_url = reverse('friend-request-list')  # Adjust according to your URL patterns
 
@@ -134,4 +255,1714 @@ class FriendRequestViewTests(APITestCase):
         response = self.client.patch(url, {'action': 'accepted'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         friend_request.refresh_from_db()
-        self.assertEqual(friend_request.status, 'accepted')
\ No newline at end of file
+        self.assertEqual(friend_request.status, 'accepted')
+        self.assertTrue(Friendship.objects.filter(user=self.user_data1, friend=self.user_data2).exists())
+        self.assertTrue(Friendship.objects.filter(user=self.user_data2, friend=self.user_data1).exists())
+
+    def test_send_friend_request_existing(self):
+        friend_request = FriendRequest.objects.create(from_user=self.user_data1, to_user=self.user_data2)
+        for request_status, error in [('pending', 'request_in_pending_queue'), ('accepted', 'already_a_friend'),
+                                      ('rejected', 'request_exists')]:
+            FriendRequest.objects.filter(pk=friend_request.pk).update(status=request_status)
+            response = self.client.post(self.friend_request_url, {'to_user_id': self.user2.id})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data['error'], error)
+
+    def test_send_friend_request_to_friend(self):
+        # user2 asked and user1 accepted, user1 sending back is refused
+        friend_request = FriendRequest.objects.create(from_user=self.user_data2, to_user=self.user_data1)
+        response = self.client.patch(reverse('friend-request-detail', args=[friend_request.id]), {'action': 'accepted'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(self.friend_request_url, {'to_user_id': self.user2.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'already_a_friend')
+        self.assertFalse(FriendRequest.objects.filter(from_user=self.user_data1).exists())
+
+    @override_settings(FRIEND_REQUEST_RATE_LIMIT='2/minute')
+    def test_send_friend_request_rate_limit(self):
+        for index in range(3):
+            user = User.objects.create(email=f'limit{index}@example.com')
+            UserData.objects.create(user=user, name=f'Limit {index}')
+            response = self.client.post(self.friend_request_url, {'to_user_id': user.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'limit_exceed')
+        self.assertEqual(response.data['message'], 'You cannot send more than 2 friend requests in a minute')
+        self.assertEqual(FriendRequest.objects.filter(from_user=self.user_data1).count(), 2)
+
+    @override_settings(FRIEND_REQUEST_RATE_LIMIT='1/minute')
+    def test_failed_send_does_not_count(self):
+        self.client.post(self.friend_request_url, {'to_user_id': self.user1.id})
+        response = self.client.post(self.friend_request_url, {'to_user_id': self.user2.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class SlidingWindowRateLimiterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_window_slides(self):
+        limiter = SlidingWindowRateLimiter('3/minute', prefix='test')
+        self.assertTrue(all(limiter.hit('key', now=60 + second) for second in range(3)))
+        self.assertFalse(limiter.hit('key', now=63))
+        # half of the previous window still overlaps: 3 * 0.5 + 1 <= 3
+        self.assertTrue(limiter.hit('key', now=150))
+        self.assertFalse(limiter.hit('key', now=150))
+        self.assertTrue(limiter.hit('key', now=180))
+
+    def test_release_after_window_rolled_over(self):
+        limiter = SlidingWindowRateLimiter('1/minute', prefix='test')
+        counter = limiter.hit('key', now=59.5)
+        self.assertFalse(limiter.hit('key', now=60.5))
+        # the request that took the hit ended in the next window
+        limiter.release(counter)
+        self.assertTrue(limiter.hit('key', now=60.6))
+        self.assertFalse(limiter.hit('key', now=60.7))
+
+    def test_take_grants_what_fits(self):
+        limiter = SlidingWindowRateLimiter('5/minute', prefix='test')
+        self.assertTrue(limiter.hit('key', now=60))
+        counter, granted = limiter.take('key', 10, now=61)
+        self.assertEqual(granted, 4)
+        self.assertEqual(limiter.take('key', 2, now=62), (counter, 0))
+        limiter.release(counter, 2)
+        self.assertEqual(limiter.take('key', 3, now=63)[1], 2)
+
+    def test_file_backed_cache(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        }):
+            limiter = SlidingWindowRateLimiter('1/second', prefix='test')
+            counter = limiter.hit('key', now=10)
+            self.assertTrue(counter)
+            self.assertFalse(limiter.hit('key', now=10.5))
+            limiter.release(counter)
+            self.assertTrue(limiter.hit('key', now=11.9))
+
+
+class KeysetPaginationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='owner@example.com', password='password123')
+        cls.user_data = UserData.objects.create(user=cls.user, name='Owner')
+        for index in range(15):
+            sender = User.objects.create(email=f'sender{index}@example.com')
+            sender_data = UserData.objects.create(user=sender, name=f'Sender {index}')
+            FriendRequest.objects.create(from_user=sender_data, to_user=cls.user_data)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def collect(self, url, params):
+        ids, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(result['id'] for result in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    @mock.patch.object(FriendRequestView, 'pagination_mode', 'keyset')
+    def test_inbox_keyset_pages(self):
+        ids, last = self.collect(reverse('friend-request-list'), {'status': 'pending'})
+        expected = list(FriendRequest.objects.order_by('-created_at', '-pk').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(last.data['count'], 15)
+
+        previous = self.client.get(last.data['previous'])
+        self.assertEqual([result['id'] for result in previous.data['results']], expected[:10])
+        self.assertIsNone(previous.data['previous'])
+
+    @mock.patch.object(UserSearchView, 'pagination_mode', 'keyset')
+    def test_search_keyset_pages_without_count(self):
+        ids, last = self.collect(reverse('user-search'), {'q': 'sender'})
+        self.assertEqual(len(ids), 15)
+        self.assertEqual(len(set(ids)), 15)
+        self.assertIsNone(last.data['count'])
+
+    @mock.patch.object(FriendRequestView, 'pagination_mode', 'keyset')
+    def test_tampered_cursor_rejected(self):
+        response = self.client.get(reverse('friend-request-list'), {'status': 'pending'})
+        cursor = response.data['next'].split('cursor=')[1]
+        response = self.client.get(reverse('friend-request-list'), {'status': 'pending', 'cursor': cursor[:-2] + 'xx'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+
+class ListQueryBudgetTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='owner@example.com')
+        self.user_data = UserData.objects.create(user=self.user, name='Owner')
+        self.senders = []
+        self.client.force_authenticate(user=self.user)
+
+    def make_requests(self, size):
+        while len(self.senders) < size:
+            sender = User.objects.create(email=f'sender{len(self.senders)}@example.com')
+            sender_data = UserData.objects.create(user=sender, name=f'Sender {len(self.senders)}')
+            FriendRequest.objects.create(from_user=sender_data, to_user=self.user_data)
+            self.senders.append(sender_data)
+
+    def test_inbox_query_budget(self):
+        # COUNT + page
+        self.assertQueryBudget(reverse('friend-request-list'), {'status': 'pending'}, self.make_requests, budget=2)
+
+    @mock.patch.object(FriendRequestView, 'pagination_mode', 'keyset')
+    def test_inbox_keyset_query_budget(self):
+        self.assertQueryBudget(reverse('friend-request-list'), {'status': 'pending'}, self.make_requests, budget=2)
+
+    def test_search_query_budget(self):
+        # candidate scan on the Python engine + COUNT + page
+        self.assertQueryBudget(reverse('user-search'), {'q': 'sender'}, self.make_requests, budget=3)
+
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='cached@example.com', password='password123')
+        UserData.objects.create(user=self.user, name='Cached User')
+        access = generate_user_token(self.user)['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {access}')
+        self.search_url = reverse('user-search')
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.search_url, {'q': 'nobody'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [query['sql'] for query in queries if 'FROM "user_user"' in query['sql']]
+
+    def test_user_resolved_from_cache(self):
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(self.user_queries(), [])
+
+    def test_cache_invalidated_on_deactivation(self):
+        self.user_queries()
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.search_url, {'q': 'nobody'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_invalidated_on_user_data_change(self):
+        self.user_queries()
+        self.user.user_data.name = 'Renamed'
+        self.user.user_data.save()
+        self.assertEqual(len(self.user_queries()), 1)
+
+    def token_email(self, user):
+        access = generate_user_token(user)['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {access}')
+        response = self.client.get(reverse('user-counters'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.wsgi_request.user.email
+
+    def test_emails_differing_in_case_are_separate_users(self):
+        other = User.objects.create_user(email='Cached@example.com', password='password123')
+        UserData.objects.create(user=other, name='Other Cached')
+        self.assertEqual(self.token_email(self.user), 'cached@example.com')
+        self.assertEqual(self.token_email(other), 'Cached@example.com')
+
+    def test_email_change_drops_old_entry(self):
+        access = generate_user_token(self.user)['access']
+        self.user_queries()
+        user = User.objects.get(pk=self.user.pk)
+        user.email = 'moved@example.com'
+        user.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {access}')
+        response = self.client.get(self.search_url, {'q': 'nobody'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalidation_reaches_other_processes(self):
+        # two workers: their own LRUs in front of the same shared cache
+        config = settings.AUTH_USER_CACHE
+        first, second = [UserCache(config['CACHE'], 100, config['LOCAL_TTL'], config['SHARED_TTL']) for _ in range(2)]
+        self.assertTrue(first.get(self.user.email).is_active)
+        self.assertTrue(second.get(self.user.email).is_active)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        first.invalidate(self.user.email)
+        self.assertFalse(first.get(self.user.email).is_active)
+        later = time.monotonic() + config['LOCAL_TTL'] + 1
+        with mock.patch('base.cache.time.monotonic', return_value=later):
+            self.assertFalse(second.get(self.user.email).is_active)
+
+    def test_process_local_cache_rejected_outside_local(self):
+        self.assertEqual(check_shared_caches(None), [])
+        with override_settings(ENVIRONMENT='PRODUCTION'):
+            errors = check_shared_caches(None)
+        self.assertEqual([error.id for error in errors], ['base.E001'])
+        self.assertIn('AUTH_USER_CACHE, RATE_LIMIT_CACHE, RESPONSE_CACHE', errors[0].msg)
+        with override_settings(ENVIRONMENT='PRODUCTION',
+                               DATABASE_ROUTING={**settings.DATABASE_ROUTING, 'REPLICAS': ['replica']}):
+            self.assertIn('DATABASE_ROUTING', check_shared_caches(None)[0].msg)
+
+
+
+class FriendListViewTests(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for index in range(4):
+            user = User.objects.create(email=f'friend{index}@example.com')
+            cls.users.append(UserData.objects.create(user=user, name=f'Friend {index}'))
+        me, other, both, only_me = cls.users
+        Friendship.objects.link_many([(me.pk, other.pk), (me.pk, both.pk), (other.pk, both.pk), (me.pk, only_me.pk)])
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.users[0].user)
+
+    def test_friend_list(self):
+        response = self.client.get(reverse('friend-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({result['friend']['email'] for result in response.data['results']},
+                         {'friend1@example.com', 'friend2@example.com', 'friend3@example.com'})
+
+    def test_mutual_friends(self):
+        response = self.client.get(reverse('mutual-friend-list', args=[self.users[1].pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result['friend']['email'] for result in response.data['results']], ['friend2@example.com'])
+
+    def test_mutual_friends_invalid_user(self):
+        response = self.client.get(reverse('mutual-friend-list', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_friend_list_query_budget(self):
+        me = self.users[0]
+        Friendship.objects.filter(user=me).delete()
+
+        def make_friends(size):
+            while Friendship.objects.filter(user=me).count() < size:
+                index = Friendship.objects.filter(user=me).count()
+                user = User.objects.create(email=f'budget{index}@example.com')
+                Friendship.objects.link(me.pk, UserData.objects.create(user=user, name=f'Budget {index}').pk)
+
+        self.assertQueryBudget(reverse('friend-list'), {}, make_friends, budget=2)
+
+
+
+class FriendSuggestionTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for index in range(6):
+            user = User.objects.create(email=f'suggest{index}@example.com')
+            cls.users.append(UserData.objects.create(user=user, name=f'Suggest {index}'))
+        ids = [user.pk for user in cls.users]
+        # 0-1, 0-2, 1-3, 2-3, 2-4, 5-3
+        Friendship.objects.link_many([(ids[0], ids[1]), (ids[0], ids[2]), (ids[1], ids[3]),
+                                      (ids[2], ids[3]), (ids[2], ids[4]), (ids[5], ids[3])])
+
+    def stored(self):
+        return {(s.user_id, s.suggested_id): s.mutual_count for s in FriendSuggestion.objects.all()}
+
+    def test_rebuild_ranks_by_mutual_count(self):
+        rebuild_suggestions()
+        ids = [user.pk for user in self.users]
+        self.client.force_authenticate(user=self.users[0].user)
+        response = self.client.get(reverse('friend-suggestion-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(result['suggested']['id'], result['mutual_count']) for result in response.data['results']],
+            [(str(ids[3]), 2), (str(ids[4]), 1)],
+        )
+
+    def test_accept_updates_incrementally(self):
+        rebuild_suggestions()
+        sender, recipient = self.users[4], self.users[5]
+        friend_request = FriendRequest.objects.create(from_user=sender, to_user=recipient)
+        self.client.force_authenticate(user=recipient.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('friend-request-detail', args=[friend_request.id]), {'action': 'accepted'})
+        incremental = self.stored()
+        rebuild_suggestions()
+        self.assertEqual(incremental, self.stored())
+
+    def test_bulk_accept_updates_incrementally(self):
+        rebuild_suggestions()
+        recipient = self.users[1]
+        ids = [FriendRequest.objects.create(from_user=sender, to_user=recipient).pk for sender in self.users[4:]]
+        self.client.force_authenticate(user=recipient.user)
+        with mock.patch('user.views.apply_new_friendships', wraps=apply_new_friendships) as apply, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('friend-request-bulk'), {'ids': ids, 'action': 'accepted'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(apply.call_count, 1)
+        incremental = self.stored()
+        rebuild_suggestions()
+        self.assertEqual(incremental, self.stored())
+
+    def test_trimmed_rows_come_back_with_full_count(self):
+        ids = [user.pk for user in self.users]
+        rebuild_suggestions(top_k=1)
+        self.assertNotIn((ids[0], ids[4]), self.stored())
+        # 4 and 0 now share 1 and 2
+        apply_new_friendships(Friendship.objects.link(ids[4], ids[1]), top_k=1)
+        self.assertEqual(self.stored()[ids[0], ids[4]], 2)
+        # friends of both ends got rows inserted, their lists are cut too
+        owners = Counter(owner_id for owner_id, _ in self.stored())
+        self.assertEqual(max(owners.values()), 1)
+
+
+
+class FriendshipBackfillTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def test_backfill_uses_migrated_database(self):
+        users = []
+        for index in range(2):
+            user = User.objects.db_manager('replica').create(email=f'backfill{index}@example.com')
+            users.append(UserData.objects.using('replica').create(user=user, name=f'Backfill {index}'))
+        FriendRequest.objects.using('replica').bulk_create([
+            FriendRequest(from_user=users[0], to_user=users[1], status='accepted'),
+            FriendRequest(from_user=users[1], to_user=users[0], status='accepted'),
+        ])
+        migration = importlib.import_module('user.migrations.0003_friendship')
+        apps = MigrationExecutor(connection).loader.project_state(('user', '0003_friendship')).apps
+        migration.backfill_friendships(apps, mock.Mock(connection=connections['replica']))
+        self.assertEqual(Friendship.objects.using('replica').count(), 2)
+        self.assertFalse(Friendship.objects.using('default').exists())
+
+
+class BulkFriendRequestViewTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for index in range(6):
+            user = User.objects.create(email=f'bulk{index}@example.com')
+            cls.users.append(UserData.objects.create(user=user, name=f'Bulk {index}'))
+
+    def setUp(self):
+        cache.clear()
+        self.me = self.users[0]
+        self.client.force_authenticate(user=self.me.user)
+        self.url = reverse('friend-request-bulk')
+
+    def test_bulk_send(self):
+        me, pending, friend, fresh, other, _ = [user.pk for user in self.users]
+        FriendRequest.objects.create(from_user_id=me, to_user_id=pending)
+        Friendship.objects.link(me, friend)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'to_user_ids': [fresh, pending, friend, me, 0, fresh, other]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([(result['to_user_id'], result.get('error')) for result in response.data['results']], [
+            (fresh, None), (pending, 'request_in_pending_queue'), (friend, 'already_a_friend'),
+            (me, 'circular error'), (0, 'invalid_id'), (fresh, 'duplicate_id'), (other, None),
+        ])
+        self.assertEqual(set(FriendRequest.objects.filter(from_user_id=me).values_list('to_user_id', flat=True)),
+                         {pending, fresh, other})
+        # exists + request status + insert + counters, and the savepoint pair
+        self.assertLessEqual(len(queries), 7)
+
+    @override_settings(FRIEND_REQUEST_RATE_LIMIT='2/minute')
+    def test_bulk_send_counts_each_request(self):
+        first, second, third = [user.pk for user in self.users[1:4]]
+        response = self.client.post(self.url, {'to_user_ids': [first, second, third]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([result.get('error') for result in response.data['results']], [None, None, 'limit_exceed'])
+        self.assertEqual(FriendRequest.objects.filter(from_user=self.me).count(), 2)
+        response = self.client.post(reverse('friend-request-list'), {'to_user_id': third})
+        self.assertEqual(response.data['error'], 'limit_exceed')
+
+    @override_settings(FRIEND_REQUEST_RATE_LIMIT='2/minute')
+    def test_bulk_send_racing_a_send(self):
+        me, taken, fresh, other = [user.pk for user in self.users[:4]]
+        FriendRequest.objects.create(from_user_id=me, to_user_id=taken)
+        statuses = FriendRequest.objects.statuses
+        # the checks ran before the concurrent send committed
+        with mock.patch.object(FriendRequest.objects, 'statuses', side_effect=[{}, statuses(me, [taken])]):
+            response = self.client.post(self.url, {'to_user_ids': [taken, fresh]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([result.get('error') for result in response.data['results']],
+                         ['request_in_pending_queue', None])
+        # the request that wasn't sent gave its hit back
+        response = self.client.post(reverse('friend-request-list'), {'to_user_id': other})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_send_batch_limit(self):
+        with override_settings(FRIEND_REQUEST_BULK_MAX=2):
+            response = self.client.post(self.url, {'to_user_ids': [1, 2, 3]}, format='json')
+        self.assertEqual(response.data['error'], 'batch_too_large')
+
+    def test_bulk_respond(self):
+        me = self.me.pk
+        first = FriendRequest.objects.create(from_user=self.users[1], to_user=self.me)
+        second = FriendRequest.objects.create(from_user=self.users[2], to_user=self.me)
+        outgoing = FriendRequest.objects.create(from_user=self.me, to_user=self.users[3])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.url, {'ids': [first.id, second.id, outgoing.id], 'action': 'accepted'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result['status'] for result in response.data['results']], ['accepted', 'accepted', 'error'])
+        self.assertEqual(FriendRequest.objects.filter(to_user_id=me, status='accepted').count(), 2)
+        self.assertEqual(set(Friendship.objects.filter(user_id=me).values_list('friend_id', flat=True)),
+                         {self.users[1].pk, self.users[2].pk})
+
+
+
+class AsyncViewTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user1 = User.objects.create_user(email='async1@example.com', password='password123')
+        cls.user_data1 = UserData.objects.create(user=cls.user1, name='Async One')
+        cls.user2 = User.objects.create(email='async2@example.com')
+        cls.user_data2 = UserData.objects.create(user=cls.user2, name='Async Two')
+
+    def setUp(self):
+        cache.clear()
+        access = generate_user_token(self.user1)['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {access}')
+
+    def test_login(self):
+        self.client.credentials()
+        response = self.client.post(reverse('async-login'), {'email': 'ASYNC1@example.com', 'password': 'password123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.json())
+        self.assertEqual(response.json()['user']['name'], 'Async One')
+        response = self.client.post(reverse('async-login'), {'email': 'async1@example.com', 'password': 'wrong'})
+        self.assertEqual(response.json()['error'], 'invalid_password')
+
+    def test_malformed_bodies_rejected(self):
+        response = self.client.post(reverse('async-login'), ['async1@example.com', 'password123'], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['error'], 'missing_fields')
+        response = self.client.post(reverse('async-login'), {'email': 1, 'password': 'password123'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['invalid_fields'], ['email'])
+        response = self.client.patch(reverse('async-friend-request-detail', args=[1]), {'action': ['accepted']},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['error'], 'invalid_fields')
+
+    def test_requires_authentication(self):
+        self.client.credentials()
+        response = self.client.get(reverse('async-user-search'), {'q': 'async'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_search_matches_sync_view(self):
+        response = self.client.get(reverse('async-user-search'), {'q': 'async'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'], self.client.get(reverse('user-search'), {'q': 'async'}).data['results'])
+
+    def test_send_list_and_accept(self):
+        response = self.client.post(reverse('async-friend-request-list'), {'to_user_id': self.user2.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('async-friend-request-list'), {'to_user_id': self.user2.id}, format='json')
+        self.assertEqual(response.json()['error'], 'request_in_pending_queue')
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {generate_user_token(self.user2)["access"]}')
+        response = self.client.get(reverse('async-friend-request-list'), {'status': 'pending'})
+        results = response.json()['results']
+        self.assertEqual([result['from_user']['email'] for result in results], ['async1@example.com'])
+
+        response = self.client.patch(reverse('async-friend-request-detail', args=[results[0]['id']]),
+                                     {'action': 'accepted'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(Friendship.objects.filter(user=self.user_data1, friend=self.user_data2).exists())
+
+    @override_settings(FRIEND_REQUEST_RATE_LIMIT='1/minute')
+    def test_failed_send_does_not_count(self):
+        url = reverse('async-friend-request-list')
+        response = self.client.post(url, {'to_user_id': 10 ** 9}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'to_user_id': self.user2.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+
+class PasswordHashExecutorTests(APITestCase):
+
+    def test_saturated_pool_rejects(self):
+        executor = PasswordHashExecutor(mode='thread', workers=1, max_pending=1, queue_timeout=0)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_hash():
+            started.set()
+            release.wait(5)
+            return True
+
+        worker = threading.Thread(target=executor.run, args=(slow_hash,))
+        worker.start()
+        started.wait(5)
+        with self.assertRaises(PasswordHashingBusy):
+            executor.run(lambda: True)
+        release.set()
+        worker.join()
+        self.assertTrue(executor.run(lambda: True))
+        executor.shutdown()
+
+    def test_login_backpressure(self):
+        User.objects.create_user(email='busy@example.com', password='password123')
+        with mock.patch('user.hashing.PasswordHashExecutor.run', side_effect=PasswordHashingBusy):
+            response = self.client.post(reverse('login'), {'email': 'busy@example.com', 'password': 'password123'})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.data['error'], 'server_busy')
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_signup_backpressure(self):
+        with mock.patch('user.hashing.PasswordHashExecutor.run', side_effect=PasswordHashingBusy):
+            response = self.client.post(reverse('signup'), {'email': 'new@example.com', 'password': 'pw', 'name': 'New'})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(User.objects.filter(email='new@example.com').exists())
+
+
+
+class LoadTestCommandTests(TestCase):
+
+    def test_generate_and_benchmark(self):
+        call_command('generate_social_data', users=30, requests_per_user=4, stdout=io.StringIO())
+        self.assertEqual(UserData.objects.filter(email_normalized__startswith='synthetic').count(), 30)
+        self.assertTrue(FriendRequest.objects.exists())
+        accepted = FriendRequest.objects.filter(status='accepted').first()
+        self.assertTrue(Friendship.objects.filter(user_id=accepted.to_user_id, friend_id=accepted.from_user_id).exists())
+
+        requests_before = FriendRequest.objects.count()
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'report.json')
+            call_command('benchmark_endpoints', requests=20, users=5, output=output, stdout=io.StringIO())
+            with open(output) as report_file:
+                report = json.load(report_file)
+        self.assertEqual(sum(result['latency']['count'] for result in report['endpoints'].values()), 20)
+        self.assertIn('p99_ms', report['endpoints']['search']['latency'])
+        self.assertEqual(FriendRequest.objects.count(), requests_before)
+
+
+
+class ImportUsersCommandTests(TestCase):
+
+    def write(self, directory, name, content):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as source:
+            source.write(content)
+        return path
+
+    def test_csv_import_dedupes(self):
+        User.objects.create(email='taken@example.com')
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.write(directory, 'users.csv', (
+                'email,password,name\n'
+                'New@Example.com,secret123,New User\n'
+                'new@example.com,other,Duplicate\n'
+                'taken@example.com,secret123,Taken\n'
+                'not-an-email,secret123,Broken\n'
+                'second@example.com,,"Second, User"\n'
+            ))
+            call_command('import_users', path, chunk_size=2, hash_mode='inline', stdout=io.StringIO())
+
+        user = User.objects.get(email='new@example.com')
+        self.assertTrue(user.check_password('secret123'))
+        self.assertEqual(user.user_data.name, 'New User')
+        second = User.objects.get(email='second@example.com')
+        self.assertFalse(second.has_usable_password())
+        self.assertEqual(second.user_data.name, 'Second, User')
+        self.assertEqual(User.objects.count(), 3)
+
+    def test_ndjson_import_resumes_from_checkpoint(self):
+        lines = ''.join(json.dumps({'email': f'resume{index}@example.com', 'name': f'Resume {index}'}) + '\n'
+                        for index in range(5))
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.write(directory, 'users.ndjson', lines)
+            first_two = len(''.join(lines.splitlines(keepends=True)[:2]).encode())
+            self.write(directory, 'users.ndjson.checkpoint', json.dumps({
+                'offset': first_two,
+                'stats': {'read': 2, 'imported': 2, 'existing': 0, 'duplicate': 0, 'invalid': 0},
+            }))
+            call_command('import_users', path, hash_mode='inline', stdout=io.StringIO())
+            with open(f'{path}.checkpoint') as checkpoint:
+                stats = json.load(checkpoint)['stats']
+        self.assertEqual(sorted(User.objects.values_list('email', flat=True)),
+                         ['resume2@example.com', 'resume3@example.com', 'resume4@example.com'])
+        self.assertEqual(stats['read'], 5)
+
+    def test_ndjson_non_object_lines_are_invalid(self):
+        lines = '[1]\n"x"\n{"email": 5}\n{"email": "kept@example.com", "name": "Kept"}\nnot json\n'
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.write(directory, 'users.ndjson', lines)
+            call_command('import_users', path, hash_mode='inline', stdout=io.StringIO())
+            with open(f'{path}.checkpoint') as checkpoint:
+                stats = json.load(checkpoint)['stats']
+        self.assertEqual(list(User.objects.values_list('email', flat=True)), ['kept@example.com'])
+        self.assertEqual((stats['imported'], stats['invalid']), (1, 4))
+
+    def test_copy_buffer_keeps_quoted_fields(self):
+        from user.management.commands.import_users import Command
+        rows = [[1, 'Two\nLines', 'a@example.com'], [2, 'Trailing  ', 'b@example.com']]
+        parsed = list(csv.reader(Command().copy_buffer(rows)))
+        self.assertEqual([row[:3] for row in parsed], [['1', 'Two\nLines', 'a@example.com'],
+                                                       ['2', 'Trailing  ', 'b@example.com']])
+        self.assertEqual(len(parsed[0]), 5)
+
+
+
+METRICS = {'SAMPLE_RATE': 1.0, 'SERVER_TIMING': True, 'SLOW_QUERY_MS': None,
+           'SLOW_REQUEST_MS': None, 'BUCKETS_MS': (5, 10, 25, 50, 100)}
+
+
+@override_settings(REQUEST_METRICS=METRICS)
+class RequestMetricsTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='metrics@example.com')
+        cls.user_data = UserData.objects.create(user=cls.user, name='Metrics User')
+        cls.staff = User.objects.create(email='staff@example.com', is_staff=True)
+        UserData.objects.create(user=cls.staff, name='Staff User')
+
+    def setUp(self):
+        cache.clear()
+        get_registry().reset()
+        self.login(self.user)
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {generate_user_token(user)["access"]}')
+
+    def server_timing(self, response):
+        return dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+
+    def test_server_timing_counts_queries(self):
+        self.login(self.staff)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('user-search'), {'q': 'metrics'})
+        timing = self.server_timing(response)
+        self.assertIn(f'desc="{len(captured)} queries"', timing['db'])
+        self.assertEqual(set(timing), {'db', 'serializer', 'view', 'total'})
+
+    def test_async_view_queries_counted(self):
+        self.login(self.staff)
+        response = self.client.get(reverse('async-user-search'), {'q': 'metrics'})
+        self.assertNotIn('desc="0 queries"', self.server_timing(response)['db'])
+
+    def test_server_timing_staff_only(self):
+        self.assertFalse(self.client.get(reverse('user-search'), {'q': 'metrics'}).has_header('Server-Timing'))
+        self.client.credentials()
+        self.assertFalse(self.client.post(reverse('login'), {}).has_header('Server-Timing'))
+        self.assertEqual(get_registry().snapshot()['GET /api/user/search/']['total']['count'], 1)
+
+    def test_metrics_endpoint_staff_only(self):
+        self.client.get(reverse('user-search'), {'q': 'metrics'})
+        self.client.get(reverse('user-search'), {'q': 'staff'})
+        response = self.client.get(reverse('request-metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.login(self.staff)
+        endpoint = self.client.get(reverse('request-metrics')).data['endpoints']['GET /api/user/search/']
+        self.assertEqual(endpoint['total']['count'], 2)
+        self.assertEqual(endpoint['status'], {'200': 2})
+        self.assertEqual(sum(endpoint['queries']['buckets'].values()), 2)
+
+        self.assertEqual(self.client.delete(reverse('request-metrics')).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(get_registry().snapshot(), {'DELETE /metrics/': mock.ANY})
+
+    @override_settings(REQUEST_METRICS={**METRICS, 'SAMPLE_RATE': 0})
+    def test_unsampled_requests_untouched(self):
+        response = self.client.get(reverse('user-search'), {'q': 'metrics'})
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(get_registry().snapshot(), {})
+
+    @override_settings(REQUEST_METRICS={**METRICS, 'SLOW_QUERY_MS': 0})
+    def test_slow_queries_logged(self):
+        with self.assertLogs('base.metrics.slow_query', 'WARNING') as logs:
+            self.client.get(reverse('user-search'), {'q': 'metrics'})
+        self.assertIn('user_userdata', json.loads(logs.records[0].getMessage())['sql'])
+
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(TestCase):
+
+    def pool(self, **kwargs):
+        return ConnectionPool(FakeConnection, check=lambda conn: conn.healthy,
+                              reset=lambda conn: not conn.closed, **kwargs)
+
+    def test_reuses_connections(self):
+        pool = self.pool(min_size=1, max_size=2)
+        pool.fill()
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(pool.stats()['created'], 1)
+
+    def test_timeout_when_exhausted(self):
+        pool = self.pool(max_size=1, timeout=0.05)
+        held = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+        threading.Timer(0.05, pool.release, [held]).start()
+        pool.timeout = 5
+        self.assertIs(pool.acquire(), held)
+
+    def test_unhealthy_connection_replaced(self):
+        pool = self.pool(check_after=0)
+        broken = pool.acquire()
+        pool.release(broken)
+        broken.healthy = False
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, broken)
+        self.assertTrue(broken.closed)
+        stats = pool.stats()
+        self.assertEqual((stats['health_check_failures'], stats['size']), (1, 1))
+
+    def test_failed_reset_and_lifetime_discard(self):
+        pool = self.pool(max_lifetime=60)
+        conn = pool.acquire()
+        conn.close()
+        pool.release(conn)
+        self.assertEqual(pool.stats()['reset_failures'], 1)
+
+        conn = pool.acquire()
+        with mock.patch('base.pool.time.monotonic', return_value=time.monotonic() + 61):
+            pool.release(conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('benchmark_connection_pool', requests=20, concurrency=2, connect_ms=1, json=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['pooled']['latency']['count'], 20)
+        self.assertLessEqual(report['pool']['created'], 2)
+
+
+
+class FriendRequestIndexTests(TestCase):
+    """The inbox and duplicate-check queries must be answered from an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for index in range(3):
+            user = User.objects.create(email=f'index{index}@example.com')
+            cls.users.append(UserData.objects.create(user=user, name=f'Index {index}'))
+        FriendRequest.objects.create(from_user=cls.users[1], to_user=cls.users[0])
+        FriendRequest.objects.create(from_user=cls.users[2], to_user=cls.users[0], status='accepted')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # tiny test tables would otherwise be scanned sequentially
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        self.assertIn(index_name, queryset.explain())
+
+    def inbox(self, request_status):
+        request = RequestFactory().get('/', {'status': request_status})
+        view = FriendRequestView()
+        view.request = Request(request)
+        view.request.user = self.users[0].user
+        return view.get_queryset()
+
+    def test_pending_inbox(self):
+        self.assertUsesIndex(self.inbox('pending'), 'friend_request_pending_idx')
+
+    @skipUnless(connection.vendor == 'postgresql', "SQLite can't prove status IN (...) for a bound status")
+    def test_answered_inbox(self):
+        self.assertUsesIndex(self.inbox('accepted'), 'friend_request_answered_idx')
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def test_duplicate_check(self):
+        # the statements FriendRequestManager.send runs for a pair that is taken
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            self.assertEqual(FriendRequest.objects.send(self.users[1].pk, self.users[0].pk), (None, 'pending'))
+        insert, select = [self.explain(sql, params) for sql, params in statements]
+        self.assertIn('user_archivedfriendrequest_from_user_id_to_user_id', insert)
+        self.assertIn('user_friendship_user_id_friend_id', insert)
+        if connection.vendor == 'postgresql':
+            # ON CONFLICT's arbiter, SQLite doesn't list it
+            self.assertIn('user_friendrequest_from_user_id_to_user_id', insert)
+        self.assertIn('user_friendrequest_from_user_id_to_user_id', select)
+        self.assertIn('user_archivedfriendrequest_from_user_id_to_user_id', select)
+
+
+
+EVENTS = {'BACKEND': 'user.events.DatabasePollingBackend', 'POLL_INTERVAL': 0.02, 'POLL_OVERLAP': 5.0,
+          'HEARTBEAT': 5, 'QUEUE_SIZE': 10, 'REPLAY_BATCH': 1, 'RETRY_MS': 3000}
+
+
+@override_settings(FRIEND_REQUEST_EVENTS=EVENTS)
+class FriendRequestEventTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for index in range(3):
+            user = User.objects.create(email=f'events{index}@example.com')
+            cls.users.append(UserData.objects.create(user=user, name=f'Events {index}'))
+
+    async def open_stream(self, **headers):
+        access = generate_user_token(self.users[0].user)['access']
+        response = await AsyncClient().get(reverse('async-friend-request-events'),
+                                           headers={'Authorization': f'Token {access}', **headers})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        return stream
+
+    def test_wsgi_not_implemented(self):
+        access = generate_user_token(self.users[0].user)['access']
+        response = self.client.get(reverse('async-friend-request-events'), headers={'Authorization': f'Token {access}'})
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertEqual(response.json()['error'], 'asgi_required')
+
+    async def next_event(self, stream):
+        while True:
+            chunk = (await asyncio.wait_for(anext(stream), 2)).decode()
+            if chunk.startswith('id:'):
+                lines = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+                return lines['id'], json.loads(lines['data'])
+
+    async def test_streams_new_requests(self):
+        stream = await self.open_stream()
+        await FriendRequest.objects.acreate(from_user=self.users[1], to_user=self.users[0])
+        await FriendRequest.objects.acreate(from_user=self.users[0], to_user=self.users[2])
+        event_id, data = await self.next_event(stream)
+        self.assertEqual((data['from_user']['email'], data['status']), ('events1@example.com', 'pending'))
+        self.assertIsNotNone(parse_event_id(event_id))
+        await stream.aclose()
+
+    async def test_resume_from_last_event_id(self):
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        missed = []
+        for index in (1, 2):
+            friend_request = await FriendRequest.objects.acreate(from_user=self.users[index], to_user=self.users[0])
+            await FriendRequest.objects.filter(pk=friend_request.pk).aupdate(
+                updated_at=an_hour_ago + timedelta(minutes=index))
+            missed.append(await FriendRequest.objects.aget(pk=friend_request.pk))
+
+        stream = await self.open_stream(**{'Last-Event-ID': event_id(missed[0])})
+        resumed_id, data = await self.next_event(stream)
+        self.assertEqual((resumed_id, data['id']), (event_id(missed[1]), missed[1].pk))
+        await stream.aclose()
+
+    @override_settings(FRIEND_REQUEST_EVENTS={**EVENTS, 'BACKEND': 'user.events.LocalEventBackend'})
+    async def test_local_backend(self):
+        stream = await self.open_stream()
+        friend_request = await FriendRequest.objects.acreate(from_user=self.users[2], to_user=self.users[0])
+        await sync_to_async(get_event_backend().notify)([friend_request.pk])
+        _, data = await self.next_event(stream)
+        self.assertEqual(data['id'], friend_request.pk)
+        await stream.aclose()
+
+    async def test_slow_client_cut_off(self):
+        subscription = hub.subscribe(self.users[0].pk, maxsize=2)
+        for index in range(3):
+            subscription.put({'id': str(index)})
+        hub.unsubscribe(subscription)
+        self.assertIs(await subscription.queue.get(), OVERFLOW)
+
+    def test_writes_notify_after_commit(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0].user)
+        with mock.patch('user.signals.get_event_backend') as get_backend, \
+                self.captureOnCommitCallbacks(execute=True):
+            client.post(reverse('friend-request-bulk'), {'to_user_ids': [self.users[1].pk, self.users[2].pk]},
+                        format='json')
+        created = list(FriendRequest.objects.filter(from_user=self.users[0]).values_list('pk', flat=True))
+        get_backend.return_value.notify.assert_called_once_with(created)
+
+
+
+class TokenRevocationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='revoke@example.com')
+        UserData.objects.create(user=cls.user, name='Revoke User')
+
+    def setUp(self):
+        cache.clear()
+        self.tokens = generate_user_token(self.user)
+
+    def test_rotated_refresh_token_is_revoked(self):
+        response = self.client.post(reverse('token_refresh'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('refresh', response.data)
+        response = self.client.post(reverse('token_refresh'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_revokes_both_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.tokens["access"]}')
+        response = self.client.post(reverse('logout'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('user-search'), {'q': 'a'}).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials()
+        response = self.client.post(reverse('token_refresh'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_unrevoked_token_costs_no_query(self):
+        store = RevocationStore()
+        self.assertFalse(store.is_revoked('warm-up'))
+        with self.assertNumQueries(0):
+            self.assertFalse(store.is_revoked('never-revoked'))
+
+    @override_settings(TOKEN_REVOCATION={**settings.TOKEN_REVOCATION, 'SYNC_INTERVAL': 0})
+    def test_sync_picks_up_other_processes(self):
+        store = RevocationStore()
+        store.rebuild()
+        RevokedToken.objects.create(jti='elsewhere', token_type='access', expires_at=timezone.now() + timedelta(hours=1))
+        self.assertTrue(store.is_revoked('elsewhere'))
+
+    def test_purge_expired(self):
+        now = timezone.now()
+        RevokedToken.objects.create(jti='expired', token_type='access', expires_at=now - timedelta(minutes=1))
+        RevokedToken.objects.create(jti='live', token_type='refresh', expires_at=now + timedelta(hours=1))
+        call_command('purge_revoked_tokens', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        for index in range(1000):
+            bloom.add(f'in-{index}')
+        self.assertTrue(all(f'in-{index}' in bloom for index in range(1000)))
+        false_positives = sum(f'out-{index}' in bloom for index in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class FastSerializationTests(APITestCase):
+    """The values() fast path and FastJSONRenderer must produce the serializers' bytes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='fast@example.com', password='password123')
+        cls.user_data = UserData.objects.create(user=cls.user, name='Fäst \u2028 "quoted"')
+        for index in range(12):
+            sender = User.objects.create(email=f'fast{index}@example.com')
+            sender_data = UserData.objects.create(user=sender, name=f'Fast ✓ {index}')
+            FriendRequest.objects.create(from_user=sender_data, to_user=cls.user_data)
+            Friendship.objects.create(user=cls.user_data, friend=sender_data)
+            FriendSuggestion.objects.create(user=cls.user_data, suggested=sender_data, mutual_count=index)
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def test_plans_match_serializers(self):
+        cases = [
+            (UserSearchSerializer, UserData.objects.select_related('user')),
+            (SelfFriendRequestSerializer, FriendRequest.objects.select_related('from_user__user')),
+            (FriendSerializer, Friendship.objects.select_related('friend__user')),
+            (FriendSuggestionSerializer, FriendSuggestion.objects.select_related('suggested__user')),
+        ]
+        for serializer_class, queryset in cases:
+            with self.subTest(serializer_class.__name__):
+                queryset = queryset.order_by('pk')
+                expected = serializer_class(queryset, many=True).data
+                plan = values_plan(serializer_class)
+                data = plan.serialize_many(plan.values(queryset))
+                self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(expected))
+                self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(expected))
+
+    def test_endpoints_byte_identical(self):
+        urls = [
+            (FriendRequestView, reverse('friend-request-list'), {'status': 'pending'}),
+            (UserSearchView, reverse('user-search'), {'q': 'fast'}),
+            (FriendListView, reverse('friend-list'), {}),
+        ]
+        for view, url, params in urls:
+            for mode in ('page', 'keyset'):
+                with self.subTest(view.__name__, mode=mode), mock.patch.object(view, 'pagination_mode', mode):
+                    fast = self.client.get(url, params)
+                    self.assertEqual(fast.status_code, status.HTTP_200_OK)
+                    with mock.patch.object(view, 'fast_serialization', False), \
+                            mock.patch.object(view, 'renderer_classes', [JSONRenderer]):
+                        self.assertEqual(self.client.get(url, params).content, fast.content)
+                    next_page = self.client.get(fast.json()['next'])
+                    self.assertEqual(next_page.status_code, status.HTTP_200_OK)
+
+    def test_renderer_matches_json_renderer(self):
+        payloads = [
+            {'floats': [0.1, 1e16, 1e-05, 123.456, -0.0]},
+            {1: 'non-str key'},
+            {'when': datetime(2024, 1, 2, 3, 4, 5, 678901), 'price': Decimal('1.10'), 'big': 2 ** 70},
+            {'text': 'line\u2028separator\u2029 "é" \x00', 'nested': [{'a': None, 'b': True}]},
+        ]
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+        self.assertEqual(FastJSONRenderer().render(payloads[0], 'application/json; indent=4'),
+                         JSONRenderer().render(payloads[0], 'application/json; indent=4'))
+
+    def test_renderer_non_finite_floats(self):
+        payload = {'results': [{'score': None}, {'score': float('nan')}]}
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            with self.subTest(renderer=renderer), self.assertRaises(ValueError):
+                renderer.render(payload)
+        with mock.patch.object(JSONRenderer, 'strict', False):
+            self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+
+    def test_unsupported_serializer_refused(self):
+        class MethodSerializer(serializers.ModelSerializer):
+            label = serializers.SerializerMethodField()
+
+            class Meta:
+                model = UserData
+                fields = ['name', 'label']
+
+            def get_label(self, obj):
+                return obj.name
+
+        with self.assertRaises(ImproperlyConfigured):
+            ValuesPlan(MethodSerializer)
+
+
+@override_settings(DATABASE_ROUTING={'CACHE': 'default', 'REPLICAS': ['replica'], 'STICKY_SECONDS': 60})
+class ReplicaRoutingTests(APITestCase):
+    """`replica` is a second SQLite database holding different rows than the primary."""
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        for alias, sender_name in [('default', 'Primary Sender'), ('replica', 'Replica Sender')]:
+            user = User.objects.db_manager(alias).create_user(email='reader@example.com', password='password123')
+            reader = UserData.objects.using(alias).create(user=user, name='Reader')
+            sender = User.objects.db_manager(alias).create(email=f'{alias}@example.com')
+            sender_data = UserData.objects.using(alias).create(user=sender, name=sender_name)
+            FriendRequest.objects.using(alias).create(from_user=sender_data, to_user=reader)
+        cls.user = User.objects.get(email='reader@example.com')
+        cls.recipient = UserData.objects.get(name='Primary Sender')
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {generate_user_token(self.user)["access"]}')
+
+    def inbox_names(self, url_name='friend-request-list'):
+        response = self.client.get(reverse(url_name), {'status': 'pending'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [result['from_user']['name'] for result in response.json()['results']]
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.inbox_names(), ['Replica Sender'])
+        self.assertEqual(self.inbox_names('async-friend-request-list'), ['Replica Sender'])
+        response = self.client.get(reverse('user-search'), {'q': 'sender'})
+        self.assertEqual([result['name'] for result in response.json()['results']], ['Replica Sender'])
+        # outside an opted-in view reads stay on the primary
+        self.assertEqual(FriendRequest.objects.get().from_user.name, 'Primary Sender')
+
+    def test_reads_stick_to_primary_after_write(self):
+        FriendRequest.objects.all().delete()
+        response = self.client.post(reverse('friend-request-list'), {'to_user_id': self.recipient.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(FriendRequest.objects.using('replica').count(), 1)
+        self.assertEqual(self.inbox_names(), [])
+        self.assertEqual(self.inbox_names('async-friend-request-list'), [])
+
+        cache.delete(sticky_key(self.user.pk))
+        self.assertEqual(self.inbox_names(), ['Replica Sender'])
+
+    @override_settings(DATABASE_ROUTING={'CACHE': 'default', 'REPLICAS': [], 'STICKY_SECONDS': 60})
+    def test_without_replicas(self):
+        self.assertEqual(self.inbox_names(), ['Primary Sender'])
+
+
+class ExportTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for index in range(4):
+            user = User.objects.create(email=f'export{index}@example.com')
+            cls.users.append(UserData.objects.create(user=user, name=f'Export {index}'))
+        owner = cls.users[0]
+        FriendRequest.objects.create(from_user=owner, to_user=cls.users[1])
+        FriendRequest.objects.create(from_user=cls.users[2], to_user=owner, status='accepted')
+        FriendRequest.objects.create(from_user=cls.users[3], to_user=cls.users[1])
+        Friendship.objects.link(owner.pk, cls.users[2].pk)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.users[0].user)
+
+    def read(self, path):
+        with open(path) as export:
+            return [json.loads(line) for line in export]
+
+    def test_endpoint_streams_own_graph(self):
+        response = self.client.get(reverse('export'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        requests = [record for record in records if record['type'] == 'friend_request']
+        self.assertEqual([(record['from_user_id'], record['to_user_id']) for record in requests],
+                         [(self.users[0].pk, self.users[1].pk), (self.users[2].pk, self.users[0].pk)])
+        self.assertEqual([record['friend_id'] for record in records if record['type'] == 'friendship'],
+                         [self.users[2].pk])
+
+    def test_export_is_lazy(self):
+        with self.assertNumQueries(0):
+            lines = user_export(self.users[0].pk, chunk_size=1)
+        # sent and received, live and archived, then friendships
+        with self.assertNumQueries(5):
+            self.assertEqual(len(list(lines)), 3)
+
+    def test_command_resumes_whole_database_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            complete = os.path.join(directory, 'complete.ndjson')
+            call_command('export_social_graph', complete, chunk_size=2, stdout=io.StringIO())
+            expected = self.read(complete)
+            self.assertEqual(len(expected), FriendRequest.objects.count() + Friendship.objects.count())
+
+            from user.management.commands import export_social_graph
+            original = export_social_graph.export_rows
+            exported = []
+
+            def crashing(*args):
+                for row in original(*args):
+                    if len(exported) == 3:
+                        raise RuntimeError('crash')
+                    exported.append(row)
+                    yield row
+
+            resumed = os.path.join(directory, 'resumed.ndjson')
+            with mock.patch.object(export_social_graph, 'export_rows', crashing), self.assertRaises(RuntimeError):
+                call_command('export_social_graph', resumed, chunk_size=2, stdout=io.StringIO())
+            call_command('export_social_graph', resumed, chunk_size=2, stdout=io.StringIO())
+            self.assertEqual(self.read(resumed), expected)
+
+    def test_command_single_user(self):
+        with tempfile.NamedTemporaryFile(suffix='.ndjson') as output:
+            call_command('export_social_graph', output.name, user=self.users[0].pk, stdout=io.StringIO())
+            self.assertEqual(len(self.read(output.name)), 3)
+
+
+class FriendRequestConcurrencyTests(TransactionTestCase):
+    """
+    Parallel sends and answers from separate threads, each on its own
+    connection, so they race on committed rows.
+    """
+    threads = 8
+
+    def setUp(self):
+        cache.clear()
+        self.users = []
+        for index in range(3):
+            user = User.objects.create(email=f'race{index}@example.com')
+            self.users.append(UserData.objects.create(user=user, name=f'Race {index}'))
+
+    def run_parallel(self, func):
+        barrier = threading.Barrier(self.threads)
+        results, errors = [None] * self.threads, []
+
+        def call(index):
+            while True:
+                try:
+                    return func(index)
+                except OperationalError as e:
+                    # SQLite's shared-cache test database fails on a lock instead of waiting for it
+                    if connection.vendor != 'sqlite' or 'locked' not in str(e):
+                        raise
+                    time.sleep(0.001)
+
+        def worker(index):
+            try:
+                barrier.wait()
+                results[index] = call(index)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(index,)) for index in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    @contextmanager
+    def assertStatements(self, expected):
+        """Like assertNumQueries, without the BEGIN/COMMIT that only SQLite logs."""
+        with CaptureQueriesContext(connection) as context:
+            yield
+        statements = [query['sql'] for query in context.captured_queries if query['sql'] not in ('BEGIN', 'COMMIT')]
+        self.assertEqual(len(statements), expected, statements)
+
+    def test_parallel_sends_create_one_request(self):
+        sender, recipient = self.users[0].pk, self.users[1].pk
+        results = self.run_parallel(lambda index: create_friend_request(sender, recipient))
+        created = [pk for pk, _ in results if pk is not None]
+        self.assertEqual(len(created), 1)
+        self.assertEqual(sorted(reason for _, reason in results if reason is not None), ['pending'] * (self.threads - 1))
+        self.assertEqual(list(FriendRequest.objects.values_list('pk', flat=True)), created)
+        self.assertEqual(get_counters(sender), {'pending_in': 0, 'pending_out': 1, 'friends': 0})
+        self.assertEqual(get_counters(recipient), {'pending_in': 1, 'pending_out': 0, 'friends': 0})
+
+    def test_parallel_answers_apply_once(self):
+        pk, _ = create_friend_request(self.users[0].pk, self.users[1].pk)
+        friend_request = FriendRequest.objects.get(pk=pk)
+        actions = ['accepted' if index % 2 else 'rejected' for index in range(self.threads)]
+        with mock.patch('user.views.apply_new_friendships'):
+            results = self.run_parallel(
+                lambda index: answer_friend_request(friend_request.pk, self.users[1].pk, actions[index])
+            )
+        self.assertEqual(results.count(True), 1)
+        winner = actions[results.index(True)]
+        friend_request.refresh_from_db()
+        self.assertEqual(friend_request.status, winner)
+        self.assertEqual(Friendship.objects.count(), 2 if winner == 'accepted' else 0)
+        friends = 1 if winner == 'accepted' else 0
+        self.assertEqual(get_counters(self.users[0].pk), {'pending_in': 0, 'pending_out': 0, 'friends': friends})
+        self.assertEqual(get_counters(self.users[1].pk), {'pending_in': 0, 'pending_out': 0, 'friends': friends})
+
+    def test_round_trips(self):
+        sender, recipient = self.users[0].pk, self.users[1].pk
+        with self.assertStatements(1):
+            pk, _ = FriendRequest.objects.send(sender, recipient)
+        with self.assertStatements(2):
+            self.assertEqual(FriendRequest.objects.send(sender, recipient), (None, 'pending'))
+        with self.assertStatements(2):
+            self.assertEqual(FriendRequest.objects.send(sender, 10 ** 9), (None, 'invalid_id'))
+        with self.assertStatements(2):
+            self.assertEqual(create_friend_request(recipient, self.users[2].pk)[1], None)
+        # the UPDATE, the friendship edges and the counters
+        with self.assertStatements(3), mock.patch('user.views.apply_new_friendships'):
+            self.assertTrue(answer_friend_request(pk, recipient, 'accepted'))
+        with self.assertStatements(1):
+            self.assertFalse(answer_friend_request(pk, recipient, 'rejected'))
+        with self.assertRaises(ValueError):
+            FriendRequest.objects.transition(pk, recipient, 'pending')
+
+    def test_view_round_trips(self):
+        client = APIClient()
+        client.force_authenticate(user=self.users[2].user)
+        with self.assertStatements(2):
+            response = client.post(reverse('friend-request-list'), {'to_user_id': self.users[0].pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        client.force_authenticate(user=self.users[0].user)
+        pk = FriendRequest.objects.get().pk
+        with self.assertStatements(2):
+            response = client.patch(reverse('friend-request-detail', args=[pk]), {'action': 'rejected'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class UserCountersTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for index in range(4):
+            user = User.objects.create(email=f'counters{index}@example.com')
+            cls.users.append(UserData.objects.create(user=user, name=f'Counters {index}'))
+
+    def setUp(self):
+        cache.clear()
+
+    def counts(self, user_data):
+        self.client.force_authenticate(user=user_data.user)
+        response = self.client.get(reverse('user-counters'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def send(self, from_user, to_user):
+        self.client.force_authenticate(user=from_user.user)
+        response = self.client.post(reverse('friend-request-list'), {'to_user_id': to_user.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return FriendRequest.objects.get(from_user=from_user, to_user=to_user).pk
+
+    def answer(self, user_data, pk, action):
+        self.client.force_authenticate(user=user_data.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('friend-request-detail', args=[pk]), {'action': action})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_endpoint_is_one_lookup(self):
+        self.client.force_authenticate(user=self.users[0].user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('user-counters'))
+        self.assertEqual(response.data, {'pending_in': 0, 'pending_out': 0, 'friends': 0})
+
+    def test_send_accept_reject(self):
+        a, b, c, _ = self.users
+        first, second = self.send(a, b), self.send(c, b)
+        self.assertEqual(self.counts(b), {'pending_in': 2, 'pending_out': 0, 'friends': 0})
+        self.assertEqual(self.counts(a), {'pending_in': 0, 'pending_out': 1, 'friends': 0})
+        self.answer(b, first, 'accepted')
+        self.answer(b, second, 'rejected')
+        self.assertEqual(self.counts(b), {'pending_in': 0, 'pending_out': 0, 'friends': 1})
+        self.assertEqual(self.counts(a), {'pending_in': 0, 'pending_out': 0, 'friends': 1})
+        self.assertEqual(self.counts(c), {'pending_in': 0, 'pending_out': 0, 'friends': 0})
+
+    def test_crossing_requests_count_one_friendship(self):
+        a, b = self.users[:2]
+        first, second = self.send(a, b), self.send(b, a)
+        self.answer(b, first, 'accepted')
+        self.answer(a, second, 'accepted')
+        self.assertEqual(self.counts(a), {'pending_in': 0, 'pending_out': 0, 'friends': 1})
+        self.assertEqual(self.counts(b), {'pending_in': 0, 'pending_out': 0, 'friends': 1})
+
+    def test_bulk_send_and_answer(self):
+        me, others = self.users[0], self.users[1:]
+        self.client.force_authenticate(user=me.user)
+        self.client.post(reverse('friend-request-bulk'), {'to_user_ids': [others[0].pk, others[1].pk]}, format='json')
+        self.assertEqual(self.counts(me)['pending_out'], 2)
+        ids = [self.send(other, me) for other in others[1:]]
+        self.client.force_authenticate(user=me.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('friend-request-bulk'), {'ids': ids, 'action': 'accepted'}, format='json')
+        self.assertEqual(self.counts(me), {'pending_in': 0, 'pending_out': 2, 'friends': 2})
+        self.assertEqual(self.counts(others[2]), {'pending_in': 0, 'pending_out': 0, 'friends': 1})
+
+    def test_migration_backfills_existing_users(self):
+        a, b, c, d = self.users
+        # rows written before the counters existed
+        FriendRequest.objects.create(from_user=a, to_user=b)
+        FriendRequest.objects.create(from_user=c, to_user=b)
+        FriendRequest.objects.create(from_user=d, to_user=a, status='rejected')
+        Friendship.objects.link(a.pk, c.pk)
+        UserCounters.objects.all().delete()
+        migration = importlib.import_module('user.migrations.0007_usercounters')
+        apps = MigrationExecutor(connection).loader.project_state(('user', '0007_usercounters')).apps
+        migration.backfill_counters(apps, mock.Mock(connection=connection))
+        self.assertEqual(get_counters(a.pk), {'pending_in': 0, 'pending_out': 1, 'friends': 1})
+        self.assertEqual(get_counters(b.pk), {'pending_in': 2, 'pending_out': 0, 'friends': 0})
+        self.assertEqual(get_counters(c.pk), {'pending_in': 0, 'pending_out': 1, 'friends': 1})
+        self.assertFalse(UserCounters.objects.filter(pk=d.pk).exists())
+
+    def test_reconcile_repairs_drift(self):
+        a, b, c, _ = self.users
+        self.send(a, b)
+        # written around the counted paths
+        FriendRequest.objects.create(from_user=c, to_user=b)
+        Friendship.objects.link(a.pk, c.pk)
+        UserCounters.objects.filter(pk=a.pk).update(pending_in=5)
+        expected = {
+            a.pk: {'pending_in': 0, 'pending_out': 1, 'friends': 1},
+            b.pk: {'pending_in': 2, 'pending_out': 0, 'friends': 0},
+            c.pk: {'pending_in': 0, 'pending_out': 1, 'friends': 1},
+        }
+
+        output = io.StringIO()
+        call_command('reconcile_user_counters', dry_run=True, batch_size=2, stdout=output)
+        self.assertIn('checked 4 users, found 3 drifted', output.getvalue())
+        self.assertEqual(get_counters(a.pk)['pending_in'], 5)
+
+        call_command('reconcile_user_counters', batch_size=2, stdout=io.StringIO())
+        for user_data in (a, b, c):
+            self.assertEqual(get_counters(user_data.pk), expected[user_data.pk])
+        output = io.StringIO()
+        call_command('reconcile_user_counters', stdout=output)
+        self.assertIn('repaired 0 drifted', output.getvalue())
+
+
+class FriendRequestArchiveTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for index in range(5):
+            user = User.objects.create(email=f'archive{index}@example.com')
+            cls.users.append(UserData.objects.create(user=user, name=f'Archive {index}'))
+
+    def setUp(self):
+        cache.clear()
+        owner = self.users[0]
+        self.old = timezone.now() - timedelta(days=400)
+        self.rejected = FriendRequest.objects.create(from_user=owner, to_user=self.users[1], status='rejected')
+        self.accepted = FriendRequest.objects.create(from_user=self.users[2], to_user=owner, status='accepted')
+        self.pending = FriendRequest.objects.create(from_user=self.users[3], to_user=owner)
+        self.recent = FriendRequest.objects.create(from_user=owner, to_user=self.users[4], status='rejected')
+        FriendRequest.objects.exclude(pk=self.recent.pk).update(updated_at=self.old)
+
+    def test_batch_moves_old_answered_requests(self):
+        cutoff = timezone.now() - timedelta(days=30)
+        self.assertEqual(archive_batch('rejected', cutoff, 10), 1)
+        self.assertEqual(archive_batch('rejected', cutoff, 10), 0)
+        archived = ArchivedFriendRequest.objects.get()
+        self.assertEqual((archived.pk, archived.from_user_id, archived.to_user_id, archived.status),
+                         (self.rejected.pk, self.users[0].pk, self.users[1].pk, 'rejected'))
+        self.assertEqual(archived.created_at, self.rejected.created_at)
+        self.assertEqual(set(FriendRequest.objects.values_list('pk', flat=True)),
+                         {self.accepted.pk, self.pending.pk, self.recent.pk})
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('archive_friend_requests', dry_run=True, stdout=output)
+        self.assertIn('rejected: 1 requests', output.getvalue())
+        self.assertEqual(ArchivedFriendRequest.objects.count(), 0)
+        call_command('archive_friend_requests', batch_size=1, sleep=0, stdout=io.StringIO())
+        self.assertEqual(set(ArchivedFriendRequest.objects.values_list('pk', flat=True)),
+                         {self.rejected.pk, self.accepted.pk})
+        self.assertEqual(set(FriendRequest.objects.values_list('pk', flat=True)), {self.pending.pk, self.recent.pk})
+
+    def test_duplicate_checks_see_archive(self):
+        call_command('archive_friend_requests', sleep=0, stdout=io.StringIO())
+        owner = self.users[0]
+        self.assertEqual(FriendRequest.objects.send(owner.pk, self.users[1].pk), (None, 'rejected'))
+        self.client.force_authenticate(user=self.users[2].user)
+        response = self.client.post(reverse('friend-request-list'), {'to_user_id': owner.pk})
+        self.assertEqual(response.data['error'], 'already_a_friend')
+        self.client.force_authenticate(user=owner.user)
+        response = self.client.post(reverse('friend-request-bulk'), {'to_user_ids': [self.users[1].pk]}, format='json')
+        self.assertEqual(response.data['results'][0]['error'], 'request_exists')
+        self.assertEqual(FriendRequest.objects.count(), 2)
+
+    def test_export_includes_archive(self):
+        call_command('archive_friend_requests', sleep=0, stdout=io.StringIO())
+        lines = [json.loads(line) for line in user_export(self.users[0].pk, chunk_size=10)]
+        self.assertEqual(sorted(line['id'] for line in lines if line['type'] == 'friend_request'),
+                         sorted([self.rejected.pk, self.accepted.pk, self.pending.pk, self.recent.pk]))
+        with tempfile.NamedTemporaryFile(suffix='.ndjson') as output:
+            call_command('export_social_graph', output.name, stdout=io.StringIO())
+            with open(output.name) as export:
+                self.assertEqual(sum(1 for _ in export), 4)
+
+
+class PrefixIndexTests(TestCase):
+
+    def make_index(self, rows, top_k=10, memory_budget=1 << 30):
+        return PrefixIndex(top_k, memory_budget).build(rows)
+
+    def test_lookup_by_name_last_name_and_email(self):
+        index = self.make_index([
+            (1, 'John Smith', 'john@example.com'),
+            (2, 'Zoë  Smithers', 'zoe@example.com'),
+            (3, 'Anna Jones', 'smithy@example.com'),
+        ])
+        self.assertEqual(index.lookup('jo', 10), [(1, 'John Smith'), (3, 'Anna Jones')])
+        self.assertEqual([user_id for user_id, _ in index.lookup(' SMITH', 10)], [1, 2, 3])
+        self.assertEqual(index.lookup('zoe smi', 10), [(2, 'Zoë  Smithers')])
+        self.assertEqual(index.lookup('smith', 10, exclude_user_id=1), [(2, 'Zoë  Smithers'), (3, 'Anna Jones')])
+        self.assertEqual(index.lookup('smith', 1), [(1, 'John Smith')])
+        self.assertEqual(index.lookup('  ', 10), [])
+
+    def test_top_k_per_term(self):
+        index = self.make_index([(user_id, 'Maya Patel', f'maya{user_id}@example.com') for user_id in (5, 3, 9, 11)],
+                                top_k=2)
+        self.assertEqual([user_id for user_id, _ in index.lookup('maya p', 10)], [3, 5, 9])
+        index.add(1, 'Maya Patel', 'maya1@example.com')
+        self.assertEqual([user_id for user_id, _ in index.lookup('patel', 10)], [1, 3, 5])
+        index.add(7, 'Maya Patel', 'maya7@example.com')
+        self.assertEqual([user_id for user_id, _ in index.lookup('patel', 10)], [1, 3, 5])
+        self.assertEqual(index.lookup('maya7', 10), [(7, 'Maya Patel')])
+        # the extra id fills in for the user asking
+        self.assertEqual([user_id for user_id, _ in index.lookup('patel', 2, exclude_user_id=1)], [3, 5])
+
+    def test_add_replaces_and_remove(self):
+        index = self.make_index([(1, 'John Smith', 'john@example.com')])
+        memory = index.memory
+        index.add(1, 'Johnny Walker', 'johnny@example.com')
+        self.assertEqual(index.lookup('smith', 10), [])
+        self.assertEqual(index.lookup('walk', 10), [(1, 'Johnny Walker')])
+        index.remove(1)
+        self.assertEqual((len(index), index.entries, index.lookup('j', 10)), (0, 0, []))
+        self.assertLess(index.memory, memory)
+
+    def test_memory_budget(self):
+        rows = [(user_id, f'User {user_id}', f'user{user_id}@example.com') for user_id in range(1, 101)]
+        budget = self.make_index(rows[:10]).memory
+        index = self.make_index(rows, memory_budget=budget)
+        self.assertEqual(len(index), 10)
+        self.assertFalse(index.complete)
+        self.assertLessEqual(index.memory, budget)
+        index.add(200, 'Late User', 'late@example.com')
+        self.assertEqual(index.lookup('late', 10), [])
+
+
+@override_settings(AUTOCOMPLETE={'TOP_K': 5, 'MEMORY_BUDGET_MB': 16, 'SYNC_INTERVAL': 3600, 'REBUILD_INTERVAL': 3600})
+class AutocompleteViewTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for index, name in enumerate(['Maya Patel', 'Mayank Rao', 'Liam Patel']):
+            user = User.objects.create(email=f'complete{index}@example.com')
+            cls.users.append(UserData.objects.create(user=user, name=name))
+
+    def setUp(self):
+        cache.clear()
+        self.store = get_autocomplete_store()
+        self.store.rebuild()
+        self.client.force_authenticate(user=self.users[0].user)
+        self.url = reverse('user-autocomplete')
+
+    def names(self, query, **params):
+        response = self.client.get(self.url, {'q': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [result['name'] for result in response.data['results']]
+
+    def test_lookup_without_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'q': 'may'})
+        self.assertEqual(response.data['results'], [{'id': str(self.users[1].pk), 'name': 'Mayank Rao'}])
+        self.assertEqual(self.names('patel'), ['Liam Patel'])
+        self.assertEqual(self.names('complete', limit=1), ['Mayank Rao'])
+        self.assertEqual(self.names(''), [])
+
+    def test_signup_rename_and_delete_update_index(self):
+        user = User.objects.create(email='NewComer@example.com')
+        user_data = UserData.objects.create(user=user, name='Mayra Lopez')
+        self.assertEqual(self.names('mayr'), ['Mayra Lopez'])
+        user_data.name = 'Nora Lopez'
+        user_data.save()
+        self.assertEqual(self.names('mayr'), [])
+        self.assertEqual(self.names('lopez'), ['Nora Lopez'])
+        user.email = 'nora@example.com'
+        user.save()
+        self.assertEqual(self.names('newcomer'), [])
+        self.assertEqual(self.names('nora@'), ['Nora Lopez'])
+        user.delete()
+        self.assertEqual(self.names('nora'), [])
+
+    def test_sync_picks_up_bulk_writes(self):
+        user = User.objects.create(email='bulk@example.com')
+        UserData.objects.bulk_create([UserData(user=user, name='Bulk Loaded', email_normalized='bulk@example.com')])
+        self.assertEqual(self.names('bulk'), [])
+        self.store.sync()
+        self.assertEqual(self.names('bulk'), ['Bulk Loaded'])
+
+    def test_falls_back_to_database_over_budget(self):
+        with override_settings(AUTOCOMPLETE={**settings.AUTOCOMPLETE, 'MEMORY_BUDGET_MB': 0}):
+            self.store.rebuild()
+        self.assertFalse(self.store.index().complete)
+        self.assertEqual(self.names('may'), ['Mayank Rao'])
+
+
+@override_settings(AUTOCOMPLETE={'TOP_K': 5, 'MEMORY_BUDGET_MB': 16, 'SYNC_INTERVAL': 3600, 'REBUILD_INTERVAL': 3600})
+class AutocompleteRebuildTests(TransactionTestCase):
+    """The build thread reads on its own connection, so the rows must be committed."""
+
+    def setUp(self):
+        self.users = []
+        for index, name in enumerate(['Maya Patel', 'Mayank Rao', 'Liam Patel']):
+            user = User.objects.create(email=f'rebuild{index}@example.com')
+            self.users.append(UserData.objects.create(user=user, name=name))
+
+    def test_first_build_runs_in_background(self):
+        store, building, release = AutocompleteStore(), threading.Event(), threading.Event()
+        build = PrefixIndex.build
+
+        def slow_build(index, rows):
+            building.set()
+            release.wait(5)
+            return build(index, rows)
+
+        with mock.patch.object(PrefixIndex, 'build', slow_build), mock.patch('user.autocomplete._store', store):
+            # answered from the database while the index is built
+            self.assertEqual(autocomplete('may', 5, exclude_user_id=self.users[0].pk),
+                             [(self.users[1].pk, 'Mayank Rao')])
+            self.assertIsNone(store.index())
+            self.assertTrue(building.wait(5))
+            # changed in this process during the build
+            store.remove(self.users[2].pk)
+            release.set()
+            store._rebuilding.join(5)
+        index = store.index()
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.lookup('patel', 5), [(self.users[0].pk, 'Maya Patel')])
+
+
+@override_settings(REQUEST_METRICS=METRICS)
+class ResponseCacheTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = UserData.objects.create(user=User.objects.create(email='cached-owner@example.com'), name='Owner')
+        cls.sender = UserData.objects.create(user=User.objects.create(email='cached-sender@example.com'), name='Sender')
+        cls.friend_request = FriendRequest.objects.create(from_user=cls.sender, to_user=cls.owner)
+
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        get_registry().reset()
+        self.client.force_authenticate(user=self.owner.user)
+        self.url = reverse('friend-request-list')
+
+    def inbox(self, **headers):
+        return self.client.get(self.url, {'status': 'pending'}, headers=headers)
+
+    def counters(self):
+        return get_registry().snapshot()['GET /api/user/friend-requests/']['counters']
+
+    def test_repeat_is_served_without_queries(self):
+        first = self.inbox()
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+        with self.assertNumQueries(0):
+            second = self.inbox()
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+        with self.assertNumQueries(0):
+            response = self.inbox(If_None_Match=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.counters(), {'response_cache_miss': 1, 'response_cache_hit': 1,
+                                           'response_cache_not_modified': 1})
+
+    def test_keyed_by_user_and_query(self):
+        etag = self.inbox()['ETag']
+        self.assertNotEqual(self.client.get(self.url, {'status': 'accepted'})['ETag'], etag)
+        self.client.force_authenticate(user=self.sender.user)
+        response = self.inbox()
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_writes_invalidate(self):
+        etag = self.inbox()['ETag']
+        UserData.objects.filter(pk=self.sender.pk).update(name='Renamed')
+        # writes that skip the signals are not seen
+        self.assertEqual(self.inbox(If_None_Match=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.sender.name = 'Renamed'
+        self.sender.save()
+        response = self.inbox(If_None_Match=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'][0]['from_user']['name'], 'Renamed')
+
+        etag = response['ETag']
+        patch = self.client.patch(reverse('friend-request-detail', args=[self.friend_request.pk]), {'action': 'accepted'})
+        self.assertEqual(patch.status_code, status.HTTP_200_OK)
+        response = self.inbox(If_None_Match=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_search_invalidated_by_signup(self):
+        url = reverse('user-search')
+        self.assertEqual(self.client.get(url, {'q': 'newcomer'}).json()['results'], [])
+        UserData.objects.create(user=User.objects.create(email='newcomer@example.com'), name='Newcomer')
+        self.assertEqual([result['name'] for result in self.client.get(url, {'q': 'newcomer'}).json()['results']],
+                         ['Newcomer'])
+
+    def test_large_bodies_not_kept(self):
+        with mock.patch.object(get_response_cache(), 'max_body_bytes', 10):
+            self.inbox()
+            self.assertEqual(len(get_response_cache()), 0)
+            etag = self.inbox()['ETag']
+            # the ETag still answers conditional requests
+            self.assertEqual(self.inbox(If_None_Match=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.counters()['response_cache_miss'], 2)
+
+    @override_settings(DATABASE_ROUTING={'CACHE': 'default', 'REPLICAS': ['replica'], 'STICKY_SECONDS': 60})
+    def test_replica_reads_bypass_fresh_versions(self):
+        with mock.patch.object(FriendRequestView, 'read_replica', False), \
+                mock.patch('base.views.current_state', return_value=mock.Mock(replica=True)):
+            response = self.inbox()
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(len(get_response_cache()), 0)
+        self.assertEqual(self.counters(), {'response_cache_bypass': 1})
@@ -1,11 +1,27 @@
 from django.urls import path
 from user import views as user_view
+from user import async_views
 
 urlpatterns = [
     path('signup/', user_view.SignupView.as_view(), name='signup'),
     path('login/', user_view.LoginView.as_view(), name='login'),
     path('token/refresh/', user_view.CustomTokenRefreshView.as_view(), name='token_refresh'),
+    path('logout/', user_view.LogoutView.as_view(), name='logout'),
     path('search/', user_view.UserSearchView.as_view(), name='user-search'),
+    path('search/autocomplete/', user_view.UserAutocompleteView.as_view(), name='user-autocomplete'),
     path('friend-requests/', user_view.FriendRequestView.as_view(http_method_names=['get', 'post']), name='friend-request-list'),
+    path('friend-requests/bulk/', user_view.BulkFriendRequestView.as_view(), name='friend-request-bulk'),
     path('friend-requests/<int:pk>/', user_view.FriendRequestView.as_view(http_method_names=['patch']), name='friend-request-detail'),
+    path('friends/', user_view.FriendListView.as_view(), name='friend-list'),
+    path('friends/<int:pk>/mutual/', user_view.MutualFriendListView.as_view(), name='mutual-friend-list'),
+    path('friends/suggestions/', user_view.FriendSuggestionListView.as_view(), name='friend-suggestion-list'),
+    path('me/counters/', user_view.UserCountersView.as_view(), name='user-counters'),
+    path('export/', user_view.ExportView.as_view(), name='export'),
+
+    # async variants for the ASGI deployment
+    path('async/login/', async_views.login, name='async-login'),
+    path('async/search/', async_views.search, name='async-user-search'),
+    path('async/friend-requests/', async_views.friend_requests, name='async-friend-request-list'),
+    path('async/friend-requests/events/', async_views.friend_request_events, name='async-friend-request-events'),
+    path('async/friend-requests/<int:pk>/', async_views.respond_friend_request, name='async-friend-request-detail'),
 ]
@@ -1,20 +1,34 @@
-from datetime import datetime, timedelta
-
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenRefreshView
 
-from django.db.models import Q
-from django.db import transaction
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django.core.validators import EmailValidator
 
+from base.ratelimit import SlidingWindowRateLimiter
+from base.response_cache import user_scope
 from base.views import BaseListView
 
-from user.models import FriendRequest, UserData, User
+from user import counters
+from user.models import FriendRequest, UserData, User, Friendship, FriendSuggestion
 from user.serializers import (UserSerializer, LoginSerializer, UserSearchSerializer, FriendRequestSerializer, 
-                              ErrorSerializer, SelfFriendRequestSerializer)
-from user.helper import generate_user_token, check_missing_fields
+                              ErrorSerializer, SelfFriendRequestSerializer, FriendSerializer,
+                              FriendSuggestionSerializer, RevocableTokenRefreshSerializer)
+from user.hashing import PasswordHashingBusy
+from user.helper import generate_user_token, check_missing_fields, rate_limit, hashing_busy_response
+from user.autocomplete import autocomplete
+from user.export import user_export
+from user.revocation import revoke_token
+from user.search import get_search_backend, SEARCH_ORDERING
+from user.signals import PROFILES_SCOPE, SEARCH_SCOPE, friend_requests_changed
+from user.suggestions import apply_new_friendships
 
 
 class SignupView(generics.GenericAPIView):
@@ -46,6 +60,8 @@ class SignupView(generics.GenericAPIView):
                 else:
                     return Response({'message': 'Something Went Wrong', 'errors': str(serializer.errors)}, status=status.HTTP_400_BAD_REQUEST)
                 UserData.objects.create(user=user, name=name)
+        except PasswordHashingBusy:
+            return hashing_busy_response()
         except Exception as e:
             return Response({'message': 'Something Went Wrong', 'errors': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -60,7 +76,11 @@ class LoginView(generics.GenericAPIView):
     @check_missing_fields("email", "password")
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
-        if serializer.is_valid():
+        try:
+            valid = serializer.is_valid()
+        except PasswordHashingBusy:
+            return hashing_busy_response()
+        if valid:
             user = serializer.validated_data
         else:
             error_serializer = ErrorSerializer(serializer.errors)
@@ -72,6 +92,7 @@ class LoginView(generics.GenericAPIView):
 
 
 class CustomTokenRefreshView(TokenRefreshView):
+    serializer_class = RevocableTokenRefreshSerializer
     throttle_classes = []
 
     @check_missing_fields("refresh")
@@ -79,19 +100,97 @@ class CustomTokenRefreshView(TokenRefreshView):
         return super().post(request)
     
 
+class LogoutView(generics.GenericAPIView):
+    throttle_classes = []
+
+    @check_missing_fields("refresh")
+    def post(self, request, *args, **kwargs):
+        try:
+            refresh = RefreshToken(request.data.get('refresh'))
+        except TokenError as e:
+            return Response({'message': str(e), 'error': 'invalid_token'}, status=status.HTTP_400_BAD_REQUEST)
+        if refresh[api_settings.USER_ID_CLAIM] != getattr(request.user, api_settings.USER_ID_FIELD):
+            return Response({'message': 'Token belongs to another user', 'error': 'invalid_token'}, status=status.HTTP_400_BAD_REQUEST)
+        revoke_token(refresh)
+        if request.auth is not None:
+            revoke_token(request.auth)
+        return Response({'message': 'Logged Out Successfully'})
+
+
+# FriendRequestManager.send reason -> (message, error)
+SEND_ERRORS = {
+    'invalid_id': ('Invalid User Id', 'invalid_id'),
+    'pending': ('Friend request already sent', 'request_in_pending_queue'),
+    'accepted': ('Already In Friend List', 'already_a_friend'),
+    'rejected': ('Friend request already answered', 'request_exists'),
+}
+
+
+def create_friend_request(from_user_id, to_user_id):
+    """FriendRequestManager.send with the counters of both users in the same transaction."""
+    with transaction.atomic():
+        pk, existing = FriendRequest.objects.send(from_user_id, to_user_id)
+        if pk is not None:
+            counters.apply(counters.sent([(from_user_id, to_user_id)]))
+            friend_requests_changed.send(sender=FriendRequest, ids=[pk], user_ids=[from_user_id, to_user_id])
+    return pk, existing
+
+
+def answer_friend_request(pk, user_id, action):
+    """
+    Accept or reject request `pk` received by `user_id`. False when it isn't
+    pending; of concurrent answers only one gets True.
+    """
+    with transaction.atomic():
+        from_user_id = FriendRequest.objects.transition(pk, user_id, action)
+        if from_user_id is None:
+            return False
+        friend_requests_changed.send(sender=FriendRequest, ids=[pk], user_ids=[from_user_id, user_id])
+        edges = []
+        if action == 'accepted':
+            edges = Friendship.objects.link(from_user_id, user_id)
+            transaction.on_commit(lambda: apply_new_friendships(edges))
+        counters.apply(counters.answered([(from_user_id, user_id)], edges))
+    return True
+
+
 class UserSearchView(BaseListView):
     serializer_class = UserSearchSerializer
+    fast_serialization = True
+    read_replica = True
+    response_cache = True
+    keyset_ordering = SEARCH_ORDERING
+    include_count = False
+
+    def get_cache_scopes(self):
+        return [SEARCH_SCOPE]
 
     def get_queryset(self):
         query = self.request.query_params.get('q', '')
-        return UserData.objects.select_related('user').filter(
-            Q(user__email__iexact=query) |
-            Q(name__icontains=query)
-        ).exclude(user=self.request.user)
+        return get_search_backend().search(query, exclude_user_id=self.request.user.id)
+
+
+class UserAutocompleteView(generics.GenericAPIView):
+    """Type-ahead over names and emails from the in-process prefix index, see user.autocomplete."""
+
+    def get(self, request, *args, **kwargs):
+        top_k = settings.AUTOCOMPLETE['TOP_K']
+        try:
+            limit = min(int(request.query_params.get('limit', top_k)), top_k)
+        except ValueError:
+            limit = top_k
+        results = autocomplete(request.query_params.get('q', ''), max(limit, 1), exclude_user_id=request.user.id)
+        return Response({'results': [{'id': str(user_id), 'name': name} for user_id, name in results]})
 
 
 class FriendRequestView(BaseListView):
     serializer_class = FriendRequestSerializer
+    fast_serialization = True
+    read_replica = True
+    response_cache = True
+
+    def get_cache_scopes(self):
+        return [user_scope(self.request.user.id), PROFILES_SCOPE]
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -102,9 +201,9 @@ class FriendRequestView(BaseListView):
     def get_queryset(self):
         data = self.request.query_params
         status = data.get('status')
-        return FriendRequest.objects.filter(
+        return FriendRequest.objects.select_related('from_user__user').filter(
             to_user_id=self.request.user.id, status=status
-        )
+        ).order_by('-created_at', '-pk')
     
     @check_missing_fields("status")
     def get(self, request, *args, **kwargs):
@@ -112,10 +211,10 @@ class FriendRequestView(BaseListView):
 
 
     @check_missing_fields("to_user_id")
+    @rate_limit("FRIEND_REQUEST_RATE_LIMIT", "You cannot send more than {limit} friend requests in a {period}")
     def post(self, request):
         to_user_id = self.request.data.get('to_user_id')
         from_user_id = self.request.user.id
-        data = {"from_user_id" : from_user_id, "to_user_id" :to_user_id}
 
         missing_fields = []
         if not to_user_id:
@@ -131,41 +230,195 @@ class FriendRequestView(BaseListView):
         if int(to_user_id) == int(from_user_id):
             return Response({'message': 'You cant send request to yourself', "error" : "circular error"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not UserData.objects.filter(user_id=to_user_id).exists():
-            return Response({'message': 'Invalid User Id', "error" : "invalid_id"}, status=status.HTTP_400_BAD_REQUEST)
-
-        if FriendRequest.objects.filter(status='pending', **data).exists():
-            return Response({'message': 'Friend request already sent', "error" : "request_in_pending_queue"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        elif FriendRequest.objects.filter(status='accepted', **data).exists():
-            return Response({'message': 'Already In Friend List', "error" : "already_a_friend"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        now = datetime.now()
-        one_minute_ago = now - timedelta(minutes=1)
-        recent_requests = FriendRequest.objects.filter(from_user_id=from_user_id, created_at__gte=one_minute_ago)
-        if recent_requests.count() >= 3:
-            return Response({'message': 'You cannot send more than 3 friend requests in a minute', "error" : "limit_exceed"}, status=status.HTTP_400_BAD_REQUEST)
-
-        serailizer = self.serializer_class(data={"from_user_id" : from_user_id, "to_user_id" :to_user_id})
-        if serailizer.is_valid():
-            serailizer.save()
-        else:
-            return Response({'message': 'Something Went Wrong', "error" : str(serailizer.errors)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            pk, existing = create_friend_request(from_user_id, int(to_user_id))
+        except IntegrityError as e:
+            return Response({'message': 'Something Went Wrong', "error" : str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if pk is None:
+            message, error = SEND_ERRORS.get(existing, SEND_ERRORS['rejected'])
+            return Response({'message': message, "error" : error}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'message': 'Friend Request Sent Successfully'}, status=status.HTTP_201_CREATED)
     
     @check_missing_fields("action")
     def patch(self, request, pk, *args, **kwargs):
-        user_id = request.user.id
-        if not FriendRequest.objects.filter(to_user_id=user_id, status='pending', id=pk).exists():
-            return Response({'message': 'No Request Found', "error" : "not_found"}, status=status.HTTP_400_BAD_REQUEST)
-            
-        instance = FriendRequest.objects.get(to_user_id=user_id, status='pending', id=pk)
         action = request.data.get('action')
-        if action in ["accepted", "rejected"]:
-            instance.status = action
-        else:
+        if action not in FriendRequest.TRANSITIONS['pending']:
             return Response({'message': 'Invalid action', "error" : "invalid_action"}, status=status.HTTP_400_BAD_REQUEST)
-        instance.save()
+        if not answer_friend_request(pk, request.user.id, action):
+            return Response({'message': 'No Request Found', "error" : "not_found"}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'message': 'Friend Request Accepted Successfully'})
-    
-    
\ No newline at end of file
+
+
+class BulkFriendRequestView(generics.GenericAPIView):
+    """
+    Send or answer many friend requests in one call. Validation runs one
+    query per rule for the whole batch and the writes are bulk statements.
+    """
+
+    def get_ids(self, request, field):
+        """Ids in `field` as ints where possible, None if the batch is too large."""
+        data = request.data
+        values = data.getlist(field) if hasattr(data, 'getlist') else data.get(field)
+        if not isinstance(values, list):
+            values = [values]
+        if len(values) > settings.FRIEND_REQUEST_BULK_MAX:
+            return None
+        ids = []
+        for value in values:
+            try:
+                ids.append(int(value))
+            except (TypeError, ValueError):
+                ids.append(value)
+        return ids
+
+    def batch_too_large(self):
+        return Response({
+            'message': f'At most {settings.FRIEND_REQUEST_BULK_MAX} ids per request', 'error': 'batch_too_large'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    @check_missing_fields("to_user_ids")
+    @rate_limit("FRIEND_REQUEST_BULK_RATE_LIMIT", "You cannot send more than {limit} bulk friend requests in a {period}")
+    def post(self, request):
+        from_user_id = request.user.id
+        to_user_ids = self.get_ids(request, 'to_user_ids')
+        if to_user_ids is None:
+            return self.batch_too_large()
+
+        candidates = {to_user_id for to_user_id in to_user_ids if isinstance(to_user_id, int)}
+        existing_users = set(UserData.objects.filter(user_id__in=candidates).values_list('user_id', flat=True))
+        request_status = FriendRequest.objects.statuses(from_user_id, candidates)
+
+        results, to_send, seen = [], {}, set()
+        for to_user_id in to_user_ids:
+            error = None
+            if not isinstance(to_user_id, int) or to_user_id not in existing_users:
+                error = ('invalid_id', 'Invalid User Id')
+            elif to_user_id == from_user_id:
+                error = ('circular error', 'You cant send request to yourself')
+            elif to_user_id in seen:
+                error = ('duplicate_id', 'Duplicate User Id')
+            elif to_user_id in request_status:
+                message, code = SEND_ERRORS.get(request_status[to_user_id], SEND_ERRORS['rejected'])
+                error = (code, message)
+
+            if error:
+                results.append({'to_user_id': to_user_id, 'status': 'error', 'error': error[0], 'message': error[1]})
+            else:
+                seen.add(to_user_id)
+                to_send[to_user_id] = {'to_user_id': to_user_id, 'status': 'sent'}
+                results.append(to_send[to_user_id])
+
+        # every request sent counts against the single send's limit
+        limiter = SlidingWindowRateLimiter(settings.FRIEND_REQUEST_RATE_LIMIT, prefix='FRIEND_REQUEST_RATE_LIMIT',
+                                           cache_alias=settings.RATE_LIMIT_CACHE)
+        counter, granted = limiter.take(from_user_id, len(to_send))
+        allowed = list(to_send)[:granted]
+        for to_user_id in list(to_send)[granted:]:
+            to_send[to_user_id].update(status='error', error='limit_exceed', message=(
+                f'You cannot send more than {limiter.limit} friend requests in a {limiter.period}'
+            ))
+
+        with transaction.atomic():
+            created = FriendRequest.objects.send_many(from_user_id, allowed)
+            counters.apply(counters.sent((from_user_id, to_user_id) for to_user_id in created))
+            friend_requests_changed.send(
+                sender=FriendRequest, ids=list(created.values()), user_ids=[from_user_id, *created],
+            )
+        # taken by a concurrent send, or answered or deleted since the checks above
+        missed = [to_user_id for to_user_id in allowed if to_user_id not in created]
+        if missed:
+            limiter.release(counter, len(missed))
+            request_status = FriendRequest.objects.statuses(from_user_id, missed)
+            for to_user_id in missed:
+                message, code = SEND_ERRORS.get(request_status.get(to_user_id, 'invalid_id'), SEND_ERRORS['rejected'])
+                to_send[to_user_id].update(status='error', error=code, message=message)
+
+        response_status = status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        return Response({'message': f'{len(created)} Friend Requests Sent', 'results': results}, status=response_status)
+
+    @check_missing_fields("ids", "action")
+    def patch(self, request):
+        user_id = request.user.id
+        action = request.data.get('action')
+        if action not in ["accepted", "rejected"]:
+            return Response({'message': 'Invalid action', "error" : "invalid_action"}, status=status.HTTP_400_BAD_REQUEST)
+        ids = self.get_ids(request, 'ids')
+        if ids is None:
+            return self.batch_too_large()
+
+        with transaction.atomic():
+            pending = dict(FriendRequest.objects.select_for_update().filter(
+                to_user_id=user_id, status='pending', id__in=[pk for pk in ids if isinstance(pk, int)]
+            ).values_list('id', 'from_user_id'))
+            FriendRequest.objects.filter(id__in=pending).update(status=action, updated_at=timezone.now())
+            friend_requests_changed.send(sender=FriendRequest, ids=list(pending), user_ids=[user_id, *pending.values()])
+            pairs = [(from_user_id, user_id) for from_user_id in pending.values()]
+            edges = []
+            if action == 'accepted':
+                edges = Friendship.objects.link_many(pairs)
+                transaction.on_commit(lambda: apply_new_friendships(edges))
+            counters.apply(counters.answered(pairs, edges))
+
+        results = []
+        for pk in ids:
+            if pk in pending:
+                results.append({'id': pk, 'status': action})
+                pending.pop(pk)
+            else:
+                results.append({'id': pk, 'status': 'error', 'error': 'not_found', 'message': 'No Request Found'})
+        return Response({'message': f'Friend Requests {action.capitalize()}', 'results': results})
+
+
+class FriendListView(BaseListView):
+    serializer_class = FriendSerializer
+    fast_serialization = True
+
+    def get_queryset(self):
+        return Friendship.objects.select_related('friend__user').filter(
+            user_id=self.request.user.id
+        ).order_by('-created_at', '-pk')
+
+
+class MutualFriendListView(BaseListView):
+    serializer_class = FriendSerializer
+    fast_serialization = True
+
+    def get(self, request, pk, *args, **kwargs):
+        if not UserData.objects.filter(user_id=pk).exists():
+            return Response({'message': 'Invalid User Id', "error" : "invalid_id"}, status=status.HTTP_400_BAD_REQUEST)
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return Friendship.objects.mutual(self.request.user.id, self.kwargs['pk']).select_related(
+            'friend__user'
+        ).order_by('-created_at', '-pk')
+
+
+class FriendSuggestionListView(BaseListView):
+    serializer_class = FriendSuggestionSerializer
+    fast_serialization = True
+    keyset_ordering = ('-mutual_count', '-pk')
+
+    def get_queryset(self):
+        return FriendSuggestion.objects.select_related('suggested__user').filter(
+            user_id=self.request.user.id
+        ).order_by('-mutual_count', '-pk')
+
+
+class UserCountersView(generics.GenericAPIView):
+    """Badge counts of the user, one primary key lookup, see user.counters."""
+
+    def get(self, request, *args, **kwargs):
+        return Response(counters.get_counters(request.user.id))
+
+
+class ExportView(generics.GenericAPIView):
+    """The user's friend requests and friendships as a streamed NDJSON download, see user.export."""
+
+    @rate_limit("EXPORT_RATE_LIMIT", "You cannot export more than {limit} times in a {period}")
+    def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(
+            user_export(request.user.id, settings.EXPORT_CHUNK_SIZE), content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = f'attachment; filename="social-graph-{request.user.id}.ndjson"'
+        return response